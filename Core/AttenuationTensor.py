@@ -0,0 +1,72 @@
+import hashlib
+
+import numpy as np
+try:
+    from .Cache import LRUCache
+    from .ElementDatabase import getElementDatabase
+    from .Interpolation import MU_INTERP_CACHE
+except ImportError:
+    from Cache import LRUCache
+    from ElementDatabase import getElementDatabase
+    from Interpolation import MU_INTERP_CACHE
+
+
+class AttenuationTensor:
+    """mu/rho [cm^2/g] of every catalogue element resampled once onto one energy grid, as a dense (92, n_E) array.
+
+    Any stack or compound then reduces to a vector of areal densities per element a_Z [g/cm^2]
+    (Σ over layers of mass fraction x density x thickness), and its optical depth is a @ matrix: one BLAS call
+    for a single stack, or for a whole (n_candidates, 92) batch of candidate compositions.
+    """
+    """所有元素的 μ/ρ 一次性重采样到同一能量网格上的 (92, n_E) 稠密矩阵。"""
+
+    def __init__(self, e_mev):
+        database = getElementDatabase()
+        self.e_mev = np.array(e_mev, dtype=float).reshape(-1)
+        self.e_mev.flags.writeable = False
+        self.matrix = np.empty((len(database), len(self.e_mev)))
+        for z in range(1, len(database) + 1):
+            table = database.table(z)
+            self.matrix[z - 1] = MU_INTERP_CACHE.muInterp(table[:, 0], table[:, 1], 1.0,
+                                                          table_key=('element', z))(self.e_mev)
+        self.matrix.flags.writeable = False
+
+    def opticalDepth(self, areal_density) -> np.ndarray:
+        """Optical depth for areal densities per element, shape (..., 92) -> (..., n_E)."""
+        return np.asarray(areal_density, dtype=float) @ self.matrix
+
+    def transmission(self, areal_density) -> np.ndarray:
+        """exp(-optical depth); for very large candidate batches call this on chunks to bound memory."""
+        depth = self.opticalDepth(areal_density)
+        np.negative(depth, out=depth)
+        return np.exp(depth, out=depth)
+
+
+#  每个能量网格只重采样一次
+TENSOR_CACHE = LRUCache(maxsize=8)
+
+
+def attenuationTensor(e_mev) -> AttenuationTensor:
+    """Shared AttenuationTensor for the grid e_mev [MeV], cached by grid contents."""
+    grid = np.ascontiguousarray(e_mev, dtype=float).reshape(-1)
+    key = hashlib.blake2b(grid.tobytes(), digest_size=16).hexdigest()
+    return TENSOR_CACHE.get(key, lambda: AttenuationTensor(grid))
+
+
+def arealDensityVector(stack, n_elements: int = None):
+    """Split a stack into per-element areal densities a_Z [g/cm^2] and the layers without a known composition.
+
+    Returns (vector of shape (n_elements,), list of materials that must still be evaluated from their own table).
+    """
+    if n_elements is None:
+        n_elements = len(getElementDatabase())
+    areal_density = np.zeros(n_elements)
+    others = []
+    for material in stack:
+        if getattr(material, 'composition', None) is None:
+            others.append(material)
+            continue
+        mass_per_area = material.tungsten_density * (material.thickness or 0.0) / 10.0  # g/cm^2
+        for z, fraction in material.composition.items():
+            areal_density[z - 1] += fraction * mass_per_area
+    return areal_density, others
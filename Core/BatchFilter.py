@@ -0,0 +1,276 @@
+"""Headless batch filtering: every spectrum in a manifest through every filter stack.
+
+Usage:
+    python -m Core.BatchFilter manifest.json [--workers N] [--output DIR] [--quiet]
+
+Manifest (paths are relative to the manifest file):
+    {
+        "output": "batch_output",
+        "spectra": ["2MeV.txt", {"path": "wwz/test.txt", "unit": "keV", "name": "tube"}, "spectra/*.txt"],
+        "stacks": [
+            {"name": "W1", "layers": [["W", 1.0]]},
+            {"layers": [{"material": "Cu", "thickness": 0.5},
+                        {"material": "Al", "thickness": 2, "density": 2.7, "file": "my_al.csv"}]},
+            {"layers": [{"material": "Ti90Al6V4", "kind": "mixture", "thickness": 1, "density": 4.43},
+                        {"material": "H2O", "kind": "compound", "thickness": 10, "density": 1.0}]}
+        ],
+        "response": {"file": "wwz/responseDetector.txt", "unit": "MeV"}
+    }
+
+"response" is optional: a two-column (E_in, E_out) detector response file, or "counting" / "integrating" for
+an ideal detector. With it the main CSV gains Signal_In / Signal_Out (detected signal per bin) and the summary
+the detected signal fraction.
+
+For each (spectrum, stack) pair the same three files as Win_ApplyFilter.saveClicked are written:
+    <spectrum>_<stack>.csv                   Energy_keV, Counts_In, Counts_Out, Transmission, Weights_In_Sum1, Weights_Out_Sum1
+    <spectrum>_<stack>_keV_counts.csv        Energy_keV, Counts_Out
+    <spectrum>_<stack>_keV_weights_sum1.csv  Energy_keV, Weights_Out_Sum1
+plus batch_summary.csv with one row per job. A name shared by several jobs (e.g. two spectra with the same
+basename) gets the job index appended, so no job overwrites another's files. A job that raises is recorded
+in the summary with status "failed" and its error, and the remaining jobs still run. No Qt or matplotlib is
+imported.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+try:
+    from .DetectorResponse import DetectorResponse, loadResponse
+    from .Materials import Material, MaterialStack
+    from .Spectrum import loadSpectrum
+    from .XFilter import transmission_of_stack, normalize_sum1
+except ImportError:
+    from DetectorResponse import DetectorResponse, loadResponse
+    from Materials import Material, MaterialStack
+    from Spectrum import loadSpectrum
+    from XFilter import transmission_of_stack, normalize_sum1
+
+
+def _layerSpec(layer, base_dir: str) -> dict:
+    if isinstance(layer, (list, tuple)):
+        layer = {"material": layer[0], "thickness": layer[1]}
+    layer = dict(layer)
+    if layer.get("file"):
+        layer["file"] = os.path.join(base_dir, layer["file"])
+    return layer
+
+
+def buildMaterial(layer: dict) -> Material:
+    """Material from a manifest layer: an element symbol, a compound/mixture ("kind"), or an explicit file."""
+    if layer.get("file"):
+        return Material(layer["material"], float(layer["thickness"]), float(layer["density"]), layer["file"])
+    return Material.fromGVXR([layer.get("kind", "element"), layer["material"]], float(layer["thickness"]),
+                             layer.get("density"))
+
+
+def stackName(layers) -> str:
+    return "_".join(f"{layer['material']}{float(layer['thickness']):g}mm" for layer in layers)
+
+
+def readManifest(manifest_file: str) -> dict:
+    """Load a manifest and expand it into a flat list of jobs (spectrum x stack)."""
+    with open(manifest_file, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(manifest_file))
+
+    spectra = []
+    for entry in manifest["spectra"]:
+        entry = {"path": entry} if isinstance(entry, str) else dict(entry)
+        paths = sorted(glob.glob(os.path.join(base_dir, entry["path"])))
+        if not paths:
+            raise FileNotFoundError(f"No spectrum file matches {entry['path']}")
+        for path in paths:
+            spectra.append({
+                "path": path,
+                "unit": entry.get("unit"),
+                "name": entry.get("name") if len(paths) == 1 and entry.get("name")
+                else os.path.splitext(os.path.basename(path))[0],
+            })
+
+    stacks = []
+    for entry in manifest["stacks"]:
+        layers = [_layerSpec(layer, base_dir) for layer in entry["layers"]]
+        stacks.append({"name": entry.get("name") or stackName(layers), "layers": layers})
+
+    response = manifest.get("response")
+    if isinstance(response, dict):
+        response = {"file": os.path.join(base_dir, response["file"]), "unit": response.get("unit", "MeV")}
+
+    output = os.path.join(base_dir, manifest.get("output", "batch_output"))
+    jobs = [{"spectrum": spectrum, "stack": stack, "output": output, "response": response}
+            for spectrum in spectra for stack in stacks]
+    return {"output": output, "jobs": jobs, "workers": manifest.get("workers")}
+
+
+def _writeColumns(file_name: str, columns: dict):
+    np.savetxt(file_name, np.column_stack(list(columns.values())), delimiter=',', fmt='%.10g',
+               header=','.join(columns.keys()), comments='')
+
+
+def jobResponse(job: dict):
+    """DetectorResponse of a job, or None; response files are parsed once per process (RESPONSE_CACHE)."""
+    response = job.get("response")
+    if response is None:
+        return None
+    if isinstance(response, str):
+        return DetectorResponse.fromSpec(response)
+    return loadResponse(response["file"], response["unit"])
+
+
+def jobName(job: dict) -> str:
+    return job.get("name") or f"{job['spectrum']['name']}_{job['stack']['name']}"
+
+
+def uniqueJobNames(jobs: list):
+    """Give every job a distinct output name: <spectrum>_<stack>, with _<job index> appended on clashes."""
+    counts = {}
+    for job in jobs:
+        key = jobName(job).lower()  # Windows 文件名不区分大小写
+        counts[key] = counts.get(key, 0) + 1
+    taken = {key for key, count in counts.items() if count == 1}
+    for index, job in enumerate(jobs):
+        name = jobName(job)
+        if counts[name.lower()] > 1:
+            name = f"{name}_{index}"
+            while name.lower() in taken:
+                name += "_"
+            taken.add(name.lower())
+        job["name"] = name
+
+
+def runJob(job: dict) -> dict:
+    """Filter one spectrum through one stack and write its result files."""
+    start = time.perf_counter()
+    spectrum = loadSpectrum(job["spectrum"]["path"], unit=job["spectrum"]["unit"])
+    stack = MaterialStack([buildMaterial(layer) for layer in job["stack"]["layers"]])
+
+    counts_in = np.clip(spectrum.counts, 0.0, None)
+    T = transmission_of_stack(spectrum.energy_mev, stack)
+    counts_out = counts_in * T
+    E_keV = spectrum.E_keV
+    weights_out = normalize_sum1(counts_out)
+
+    columns = {
+        "Energy_keV": E_keV,
+        "Counts_In": counts_in,
+        "Counts_Out": counts_out,
+        "Transmission": T,
+        "Weights_In_Sum1": normalize_sum1(counts_in),
+        "Weights_Out_Sum1": weights_out,
+    }
+    response = jobResponse(job)
+    if response is not None:
+        signal = response.apply(np.stack([counts_in, counts_out]), spectrum.energy_mev)
+        columns["Signal_In"], columns["Signal_Out"] = signal
+
+    prefix = os.path.join(job["output"], jobName(job))
+    _writeColumns(f"{prefix}.csv", columns)
+    _writeColumns(f"{prefix}_keV_counts.csv", {"Energy_keV": E_keV, "Counts_Out": counts_out})
+    _writeColumns(f"{prefix}_keV_weights_sum1.csv", {"Energy_keV": E_keV, "Weights_Out_Sum1": weights_out})
+
+    elapsed = time.perf_counter() - start
+    total_in = float(counts_in.sum())
+    result = {
+        "name": jobName(job),
+        "spectrum": job["spectrum"]["name"],
+        "stack": job["stack"]["name"],
+        "status": "ok",
+        "bins": len(spectrum),
+        "total_in": total_in,
+        "total_out": float(counts_out.sum()),
+        "transmitted_fraction": float(counts_out.sum()) / total_in if total_in > 0 else 0.0,
+    }
+    if response is not None:
+        signal_in, signal_out = float(columns["Signal_In"].sum()), float(columns["Signal_Out"].sum())
+        result["signal_fraction"] = signal_out / signal_in if signal_in > 0 else 0.0
+    result["seconds"] = elapsed
+    result["bins_per_second"] = len(spectrum) / elapsed if elapsed > 0 else float('inf')
+    return result
+
+
+def runJobSafely(job: dict) -> dict:
+    """runJob, with any exception turned into a summary row with status "failed" and the error message."""
+    try:
+        return runJob(job)
+    except Exception as e:
+        return {
+            "name": jobName(job),
+            "spectrum": job["spectrum"]["name"],
+            "stack": job["stack"]["name"],
+            "status": "failed",
+            "error": f"{type(e).__name__}: {e}",
+        }
+
+
+def _csvField(value) -> str:
+    text = str(value)
+    if any(c in text for c in ',"\n'):
+        return '"' + text.replace('"', '""') + '"'
+    return text
+
+
+def runBatch(jobs: list, output: str, workers: int = None, quiet: bool = False) -> list:
+    """Run all jobs across a process pool; returns one summary dict per job, in job order."""
+    os.makedirs(output, exist_ok=True)
+    uniqueJobNames(jobs)
+    start = time.perf_counter()
+    results = []
+
+    if workers == 1:
+        mapped = map(runJobSafely, jobs)
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        n_workers = workers or os.cpu_count() or 1
+        mapped = executor.map(runJobSafely, jobs, chunksize=max(1, len(jobs) // (4 * n_workers)))
+    try:
+        for result in mapped:
+            results.append(result)
+            if result["status"] != "ok":
+                print(f"[WARNING] {result['name']} failed: {result['error']}")
+            elif not quiet:
+                print(f"[INFO] {result['spectrum']} x {result['stack']}: {result['bins']} bins in "
+                      f"{result['seconds'] * 1e3:.2f} ms ({result['bins_per_second'] / 1e6:.2f} Mbins/s), "
+                      f"transmitted {result['transmitted_fraction']:.4g}")
+    finally:
+        if workers != 1:
+            executor.shutdown()
+
+    elapsed = time.perf_counter() - start
+    summary_file = os.path.join(output, "batch_summary.csv")
+    with open(summary_file, 'w', encoding='utf-8') as f:
+        # 各行的列可能不同（失败的任务、有无探测器响应），取并集，缺的留空
+        keys = list(dict.fromkeys(key for result in results for key in result))
+        f.write(','.join(keys) + '\n')
+        for result in results:
+            f.write(','.join(_csvField(result.get(key, '')) for key in keys) + '\n')
+
+    failed = sum(result["status"] != "ok" for result in results)
+    print(f"[INFO] {len(results)} jobs ({failed} failed) in {elapsed:.2f} s "
+          f"({len(results) / elapsed if elapsed > 0 else 0:.1f} jobs/s). Summary: {summary_file}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Filter spectra through filter stacks without the GUI.")
+    parser.add_argument("manifest", help="JSON manifest with 'spectra' and 'stacks'")
+    parser.add_argument("--workers", type=int, default=None, help="process pool size (default: manifest or CPUs)")
+    parser.add_argument("--output", default=None, help="output directory (default: manifest 'output')")
+    parser.add_argument("--quiet", action="store_true", help="only print the final summary")
+    args = parser.parse_args(argv)
+
+    batch = readManifest(args.manifest)
+    workers = args.workers if args.workers is not None else batch["workers"]
+    output = args.output or batch["output"]
+    for job in batch["jobs"]:
+        job["output"] = output
+    results = runBatch(batch["jobs"], output, workers=workers, quiet=args.quiet)
+    return 1 if any(result["status"] != "ok" for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+import glob
+import hashlib
+import os
+
+import numpy as np
+try:
+    from .DetectorResponse import DetectorResponse
+    from .Spectrum import Spectrum
+    from .XFilter import transmission_of_stack
+except ImportError:
+    from DetectorResponse import DetectorResponse
+    from Spectrum import Spectrum
+    from XFilter import transmission_of_stack
+
+#  磁盘缓存目录，可用环境变量 FILTRATION_CACHE_DIR 指定
+CACHE_DIR = os.path.join(os.environ.get("FILTRATION_CACHE_DIR",
+                                        os.path.join(os.path.expanduser("~"), ".cache", "filtration")),
+                         "beam_hardening")
+#  磁盘缓存总大小上限（字节）；超出时删除最久未用的表。删除整个 CACHE_DIR 目录也可随时清空缓存
+MAX_CACHE_BYTES = 256 * 1024 ** 2
+#  路径长度网格的默认采样点数
+DEFAULT_LENGTH_SAMPLES = 4096
+#  表格文件格式版本，计算方式改变时递增，使旧缓存失效
+LUT_VERSION = 1
+#  反查表（log 强度 -> 路径长度）相对正查表的采样倍数
+INVERSE_OVERSAMPLING = 4
+
+
+def spectralWeights(spectrum, filters=None, response=None):
+    """(E_mev, weights) of the detected signal per energy bin: counts x filter transmission x detector response.
+
+    spectrum: Spectrum or (E_mev, counts). filters: MaterialStack or list of Materials (None: no filter).
+    response: DetectorResponse, (E_in, E_out) [MeV] deposited-energy table, a callable E -> E_det, 'counting'
+    for photon counting, or None / 'integrating' for an ideal energy-integrating detector (E_det = E).
+    """
+    if isinstance(spectrum, Spectrum):
+        e_mev, counts = spectrum.energy_mev, spectrum.counts
+    else:
+        e_mev, counts = spectrum
+    e_mev = np.asarray(e_mev, dtype=float)
+    weights = np.clip(np.asarray(counts, dtype=float), 0.0, None)
+
+    if filters is not None and len(filters):
+        weights = weights * transmission_of_stack(e_mev, filters)
+    return e_mev, DetectorResponse.fromSpec(response).apply(weights, e_mev)
+
+
+class BeamHardeningLUT:
+    """Detected intensity against path length through one sample material, I(L) = Σ_E w(E) exp(-mu(E) L).
+
+    The table is sampled on a uniform grid 0..max_length [mm], so intensity() is an index computation plus a
+    linear interpolation. For linearise() (measured intensity -> path length, i.e. beam-hardening correction)
+    the inverse is resampled once on a uniform grid of log I, which is close to linear in L, so it costs one
+    log more. Neither touches the spectrum again. Path lengths beyond max_length are clamped to the end of
+    the table.
+    """
+    """射束硬化查找表：给定能谱、滤片、样品材料与探测器响应，预先计算强度-路径长度曲线，按插值换算。"""
+
+    def __init__(self, lengths, intensities, key: str = None):
+        self.lengths = np.asarray(lengths, dtype=float)
+        self.intensities = np.asarray(intensities, dtype=float)
+        self.key = key
+        self._step = self.lengths[1] - self.lengths[0]
+        self._table = self.intensities.astype(np.float32)
+        self._inverse = None
+
+    @property
+    def max_length(self) -> float:
+        return float(self.lengths[-1])
+
+    @property
+    def I0(self) -> float:
+        """Unattenuated intensity I(0)."""
+        return float(self.intensities[0])
+
+    def intensity(self, path_length) -> np.ndarray:
+        """Detected intensity for path lengths [mm] (any shape), float32."""
+        position = np.asarray(path_length, dtype=np.float32) / np.float32(self._step)
+        np.clip(position, 0, len(self.lengths) - 1, out=position)
+        index = np.minimum(position.astype(np.intp), len(self.lengths) - 2)
+        position -= index
+        lower = self._table[index]
+        return lower + (self._table[index + 1] - lower) * position
+
+    def linearise(self, intensity, normalised: bool = False) -> np.ndarray:
+        """Path length [mm] that gives each measured intensity (I / I0 when normalised), float32.
+
+        Intensities above I0 map to 0 and below I(max_length) to max_length.
+        """
+        if self._inverse is None:
+            self._inverse = self._buildInverse()
+        log_low, log_step, table = self._inverse
+        position = np.asarray(intensity, dtype=np.float32)
+        if normalised:
+            position = position * np.float32(self.I0)
+        position = np.log(np.maximum(position, np.float32(np.exp(log_low))))
+        position -= np.float32(log_low)
+        position /= np.float32(log_step)
+        np.clip(position, 0, len(table) - 1, out=position)
+        index = np.minimum(position.astype(np.intp), len(table) - 2)
+        position -= index
+        lower = table[index]
+        return lower + (table[index + 1] - lower) * position
+
+    def _buildInverse(self):
+        # I(L) 单调递减；log I 取负后递增以满足 np.interp 的要求
+        log_intensity = np.log(np.maximum(self.intensities, 1e-300))
+        log_low, log_high = log_intensity[-1], log_intensity[0]
+        n = len(self.lengths) * INVERSE_OVERSAMPLING
+        grid = np.linspace(log_low, log_high, n)
+        table = np.interp(-grid, -log_intensity, self.lengths).astype(np.float32)
+        return log_low, max((log_high - log_low) / (n - 1), 1e-300), table
+
+    def save(self, file_name: str):
+        folder = os.path.dirname(os.path.abspath(file_name))
+        os.makedirs(folder, exist_ok=True)
+        temporary = f"{file_name}.{os.getpid()}.tmp.npy"
+        np.save(temporary, np.stack([self.lengths, self.intensities]))
+        # 先写临时文件再改名，并发的进程不会读到写了一半的表
+        os.replace(temporary, file_name)
+
+    @classmethod
+    def load(cls, file_name: str, key: str = None):
+        lengths, intensities = np.load(file_name)
+        return cls(lengths, intensities, key)
+
+    @classmethod
+    def fromWeights(cls, e_mev, weights, mu, max_length: float, n_lengths: int = DEFAULT_LENGTH_SAMPLES,
+                    key: str = None):
+        """Table from detected weights per bin and mu [1/mm] of the sample on the same energy grid."""
+        lengths = np.linspace(0.0, float(max_length), int(n_lengths))
+        intensities = np.empty(len(lengths))
+        mu = np.asarray(mu, dtype=float)
+        weights = np.asarray(weights, dtype=float)
+        for start in range(0, len(lengths), 1024):
+            depth = np.multiply.outer(lengths[start:start + 1024], -mu)
+            intensities[start:start + 1024] = np.exp(depth, out=depth) @ weights
+        return cls(lengths, intensities, key)
+
+    @classmethod
+    def build(cls, spectrum, material, filters=None, response=None, max_length: float = 100.0,
+              n_lengths: int = DEFAULT_LENGTH_SAMPLES, cache: bool = True, cache_dir: str = None):
+        """Table for spectrum through filters and `material` (a Material, with its density) seen by `response`.
+
+        With cache the table is stored in cache_dir (default CACHE_DIR) under a hash of every input that
+        affects it, namely the energy grid, detected weights, mu(E) of the sample and the length grid, and is
+        loaded from there next time. The directory is kept within MAX_CACHE_BYTES by pruneCache; clearCache
+        (or deleting the directory) empties it.
+        """
+        e_mev, weights = spectralWeights(spectrum, filters, response)
+        mu = material.muInterp()(e_mev) / 10.0  # 1/mm
+        key = lutKey(e_mev, weights, mu, max_length, n_lengths)
+        file_name = os.path.join(cache_dir or CACHE_DIR, f"{key}.npy")
+        if cache and os.path.exists(file_name):
+            try:
+                lut = cls.load(file_name, key)
+                os.utime(file_name)  # mtime 记录最近使用时间，供 pruneCache 按最近最少使用淘汰
+                return lut
+            except (OSError, ValueError) as e:
+                print("[WARNING] Ignoring unreadable beam-hardening table:", e)
+        lut = cls.fromWeights(e_mev, weights, mu, max_length, n_lengths, key)
+        if cache:
+            try:
+                lut.save(file_name)
+            except OSError as e:
+                print("[WARNING] Cannot cache beam-hardening table:", e)
+            else:
+                pruneCache(cache_dir, keep=file_name)
+        return lut
+
+
+def _cachedTables(cache_dir: str = None) -> list:
+    """(last_used, size_bytes, file_name) of every cached table, oldest first."""
+    tables = []
+    for file_name in glob.glob(os.path.join(cache_dir or CACHE_DIR, "*.npy")):
+        if ".tmp" in os.path.basename(file_name):
+            continue  # 其他进程正在写入
+        try:
+            stat = os.stat(file_name)
+        except OSError:
+            continue
+        tables.append((stat.st_mtime, stat.st_size, file_name))
+    return sorted(tables)
+
+
+def pruneCache(cache_dir: str = None, max_bytes: int = None, keep: str = None):
+    """Remove least recently used tables (never `keep`) until cache_dir is within max_bytes (MAX_CACHE_BYTES)."""
+    max_bytes = MAX_CACHE_BYTES if max_bytes is None else max_bytes
+    tables = _cachedTables(cache_dir)
+    total = sum(size for _, size, _ in tables)
+    for _, size, file_name in tables:
+        if total <= max_bytes:
+            break
+        if keep is not None and os.path.abspath(file_name) == os.path.abspath(keep):
+            continue
+        try:
+            os.remove(file_name)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print("[WARNING] Cannot remove cached beam-hardening table:", e)
+            continue
+        total -= size
+
+
+def clearCache(cache_dir: str = None):
+    """Delete every cached beam-hardening table."""
+    pruneCache(cache_dir, max_bytes=0)
+
+
+def lutKey(e_mev, weights, mu, max_length: float, n_lengths: int) -> str:
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(f"v{LUT_VERSION}:{float(max_length)!r}:{int(n_lengths)}".encode())
+    for array in (e_mev, weights, mu):
+        digest.update(np.ascontiguousarray(array, dtype=float).tobytes())
+    return digest.hexdigest()
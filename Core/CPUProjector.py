@@ -0,0 +1,346 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+try:
+    from .DetectorResponse import DetectorResponse, loadResponse
+    from .Materials import Material
+    from .Mesh import BVH, loadSTL
+    from .Spectrum import loadSpectrum
+except ImportError:
+    from DetectorResponse import DetectorResponse, loadResponse
+    from Materials import Material
+    from Mesh import BVH, loadSTL
+    from Spectrum import loadSpectrum
+
+#  长度单位 -> mm
+LENGTH_TO_MM = {
+    'um': 1e-3,
+    'mm': 1.0,
+    'cm': 10.0,
+    'dm': 100.0,
+    'm': 1000.0,
+}
+#  每个并行任务处理的探测器像素块边长
+DEFAULT_TILE_SIZE = 64
+#  多色投影时每批处理的像素数，限制 (像素, 能量) 临时数组的大小
+SPECTRAL_CHUNK = 1 << 16
+#  gVXR 把能谱计数当作距光源此距离 (mm) 处每 cm^2 的光子数
+GVXR_REFERENCE_DISTANCE = 1000.0
+
+
+def _length(value, unit: str = 'mm') -> np.ndarray:
+    """[x, y, z, "unit"] (unit optional) -> mm."""
+    if isinstance(value[-1], str):
+        unit, value = value[-1], value[:-1]
+    return np.asarray(value, dtype=float) * LENGTH_TO_MM[unit]
+
+
+def _findFile(file_name: str, folder: str) -> str:
+    path = file_name if os.path.isabs(file_name) else os.path.join(folder, file_name)
+    if os.path.exists(path):
+        return path
+    # JSON 里常写成 test.STL 而文件是 test.stl；区分大小写的文件系统上按不区分大小写再找一次
+    directory, name = os.path.split(path)
+    for candidate in os.listdir(directory or '.'):
+        if candidate.lower() == name.lower():
+            return os.path.join(directory, candidate)
+    raise FileNotFoundError(path)
+
+
+def _angles(numProj: int, final_angle: float, include_final: bool):
+    # 与 Json2gvxrCalculator.acquisitionAngles 相同的角度间隔；那个模块需要 gVXR，这里不能导入
+    if include_final and numProj > 1:
+        return np.linspace(0.0, final_angle, numProj)
+    return np.arange(numProj) * final_angle / max(numProj, 1)
+
+
+class Scene:
+    """The geometry, samples, spectrum and detector of a gVXR JSON scene file, read without gVXR.
+
+    Lengths are in mm and energies in MeV. Samples are centred together on the origin, as gvxr.moveToCentre()
+    does, and the scan rotates them about CenterOfRotation around the z axis.
+    """
+    """不依赖 gVXR 读取 JSON 场景：光源、探测器几何、STL 样品与材料、能谱、探测器能量响应、扫描角度。"""
+
+    def __init__(self, JSONFileName: str):
+        self.JSONFileName = JSONFileName
+        folder = os.path.dirname(os.path.abspath(JSONFileName))
+        with open(JSONFileName, 'r', encoding='utf-8') as f:
+            self.params = json.load(f)
+
+        source = self.params["Source"]
+        if str(source.get("Shape", "Point")).lower() != "point":
+            raise ValueError(f"Only point sources are supported, not {source['Shape']!r}")
+        self.source = _length(source["Position"])
+
+        detector = self.params["Detector"]
+        self.detector_centre = _length(detector["Position"])
+        self.n_pixels = tuple(int(n) for n in detector["NumberOfPixels"][:2])  # (列数, 行数)
+        self.pixel_size = _length(detector["Size"])[:2] / np.array(self.n_pixels)
+        # 探测器平面: 法向指向光源，行方向沿 UpVector，列方向 = up × 法向
+        normal = self.source - self.detector_centre
+        normal /= np.linalg.norm(normal)
+        up = np.asarray(detector.get("UpVector", [0, 0, 1]), dtype=float)
+        up -= np.dot(up, normal) * normal
+        self.up = up / np.linalg.norm(up)
+        self.right = np.cross(self.up, normal)
+
+        beam = source["Beam"]
+        if not isinstance(beam, dict) or "TextFile" not in beam:
+            raise ValueError("Only TextFile beam spectra are supported")
+        self.spectrum = loadSpectrum(_findFile(beam["TextFile"], folder), unit=beam.get("Unit"))
+
+        # 探测器能量响应: 入射能量 -> 沉积能量，两列，单位见 "Energy"
+        self.response = None
+        response = detector.get("Energy response")
+        if response:
+            self.response = loadResponse(_findFile(response["File"], folder), response.get("Energy", "MeV"))
+
+        self.samples = []
+        for sample in self.params["Samples"]:
+            triangles = loadSTL(_findFile(sample["Path"], folder)) * LENGTH_TO_MM[sample.get("Unit", "mm")]
+            material = Material.fromGVXR(sample["Material"], 1.0, sample.get("Density"))
+            self.samples.append({"label": sample.get("Label", os.path.basename(sample["Path"])),
+                                 "triangles": triangles, "material": material})
+        if self.samples:
+            corners = np.concatenate([sample["triangles"].reshape(-1, 3) for sample in self.samples])
+            centre = (corners.min(axis=0) + corners.max(axis=0)) / 2
+            for sample in self.samples:
+                sample["triangles"] = sample["triangles"] - centre
+
+        scan = self.params["Scan"]
+        self.centre_of_rotation = _length(scan.get("CenterOfRotation", [0, 0, 0]))
+        self.axis = np.array([0.0, 0.0, 1.0])
+        self.angles = _angles(int(scan["NumberOfProjections"]), float(scan["FinalAngle"]),
+                              bool(scan["IncludeFinalAngle"]))
+
+    @property
+    def shape(self) -> tuple:
+        """Projection shape (rows, columns)."""
+        return self.n_pixels[1], self.n_pixels[0]
+
+    def detectedEnergy(self, e_mev) -> np.ndarray:
+        """Energy deposited per photon on the grid e_mev [MeV] (identity without an energy response), read-only."""
+        return DetectorResponse.fromSpec(self.response).resample(e_mev)
+
+    def attenuation(self, e_mev=None) -> np.ndarray:
+        """mu [1/mm] of every sample on the energy grid (the spectrum bins by default), shape (n_samples, n_E)."""
+        e_mev = self.spectrum.energy_mev if e_mev is None else e_mev
+        return np.stack([sample["material"].muInterp()(e_mev) / 10.0 for sample in self.samples])
+
+    def gvxrScale(self) -> float:
+        """Factor that turns this projector's output (spectrum counts taken as photons per pixel) into gVXR's.
+
+        gVXR reads the spectrum as photons per cm^2 at GVXR_REFERENCE_DISTANCE (1 m) from the source and
+        scales it to the detector by the inverse square of the source-detector distance and the pixel area.
+        The on-axis distance is used for every pixel.
+        """
+        distance = np.linalg.norm(self.detector_centre - self.source)
+        pixel_area_cm2 = float(np.prod(self.pixel_size)) / 100.0
+        return pixel_area_cm2 * (GVXR_REFERENCE_DISTANCE / distance) ** 2
+
+    def geometry(self) -> dict:
+        """Plain arrays describing the rays, for worker processes."""
+        return {"source": self.source, "detector_centre": self.detector_centre, "up": self.up,
+                "right": self.right, "pixel_size": self.pixel_size, "shape": self.shape,
+                "centre_of_rotation": self.centre_of_rotation}
+
+
+def _rotationZ(angle_deg: float) -> np.ndarray:
+    c, s = np.cos(np.radians(angle_deg)), np.sin(np.radians(angle_deg))
+    return np.array([[c, -s, 0.0], [s, c, 0.0], [0.0, 0.0, 1.0]])
+
+
+def tileRays(geometry: dict, angle: float, rows: slice, columns: slice):
+    """Source position and source->pixel-centre vectors for a block of pixels, in the sample frame.
+
+    Rotating the sample by +angle is the same as rotating source and detector by -angle around the centre of
+    rotation, so the meshes (and their BVHs) never move.
+    """
+    n_rows, n_columns = geometry["shape"]
+    i = np.arange(n_rows)[rows]
+    j = np.arange(n_columns)[columns]
+    # 第 0 行在 up 方向的最上端
+    v = ((n_rows - 1) / 2 - i) * geometry["pixel_size"][1]
+    u = (j - (n_columns - 1) / 2) * geometry["pixel_size"][0]
+    pixels = geometry["detector_centre"] + v[:, None, None] * geometry["up"] + u[None, :, None] * geometry["right"]
+
+    rotation = _rotationZ(-angle)
+    centre = geometry["centre_of_rotation"]
+    source = (geometry["source"] - centre) @ rotation.T + centre
+    pixels = (pixels - centre) @ rotation.T + centre
+    return source, pixels - source
+
+
+def tilePathLengths(bvhs: list, geometry: dict, angle: float, rows: slice, columns: slice) -> np.ndarray:
+    """Path length [mm] through every sample for a block of pixels, shape (n_samples, rows, columns)."""
+    source, directions = tileRays(geometry, angle, rows, columns)
+    shape = directions.shape[:2]
+    directions = directions.reshape(-1, 3)
+    return np.stack([bvh.pathLengths(source, directions, 1.0).reshape(shape) for bvh in bvhs]).astype(np.float32)
+
+
+def polychromaticProjection(path_lengths, mu, weights, chunk: int = SPECTRAL_CHUNK) -> np.ndarray:
+    """Beer–Lambert sum over energy bins: Σ_E weights(E) exp(-Σ_s mu_s(E) L_s) for every pixel.
+
+    path_lengths: (n_samples, ...) [mm]; mu: (n_samples, n_E) [1/mm]; weights: (n_E,). Pixels are processed in
+    chunks so the (pixels, n_E) optical-depth array stays small.
+    """
+    path_lengths = np.asarray(path_lengths, dtype=float)
+    n_samples = path_lengths.shape[0]
+    flat = path_lengths.reshape(n_samples, -1)
+    out = np.empty(flat.shape[1], dtype=np.float32)
+    weights = np.asarray(weights, dtype=float)
+    mu = np.asarray(mu, dtype=float).reshape(n_samples, -1)
+    for start in range(0, flat.shape[1], chunk):
+        depth = flat[:, start:start + chunk].T @ mu
+        np.negative(depth, out=depth)
+        np.exp(depth, out=depth)
+        out[start:start + chunk] = depth @ weights
+    return out.reshape(path_lengths.shape[1:])
+
+
+#  进程池中每个 worker 持有样品的 BVH 和几何参数，只在初始化时传一次
+_worker_bvhs = None
+_worker_geometry = None
+
+
+def _initWorker(bvhs, geometry):
+    global _worker_bvhs, _worker_geometry
+    _worker_bvhs, _worker_geometry = bvhs, geometry
+
+
+def _tileTask(bvhs, geometry, angle, rows, columns):
+    return rows, columns, tilePathLengths(bvhs, geometry, angle, rows, columns)
+
+
+def _workerTile(angle, rows, columns):
+    return _tileTask(_worker_bvhs, _worker_geometry, angle, rows, columns)
+
+
+class CPUProjector:
+    """Pure-NumPy reference projector for gVXR JSON scenes (point source, flat detector, STL samples).
+
+    Path lengths come from ray casting each detector pixel centre against a BVH per sample; rays are handled in
+    tile_size x tile_size blocks, spread over a process pool of `workers` (1 = in this process). Projections
+    are the noise-free, energy-integrated Beer–Lambert signal Σ_E N(E) E_det(E) exp(-Σ_s mu_s(E) L_s), with
+    samples treated as disjoint volumes.
+
+    N(E) is the spectrum as given, i.e. photons per pixel. gVXR instead takes it as photons per cm^2 at 1 m and
+    applies the inverse-square and pixel-area factors, so the two differ by the constant Scene.gvxrScale();
+    gvxr_units=True multiplies it in, making the projections directly comparable with GVXRCalculate.
+    """
+    """纯 NumPy 的 CPU 参考投影器：BVH 光线求交得到每个样品的路径长度，再按多色 Beer–Lambert 定律积分。"""
+
+    def __init__(self, scene, workers: int = None, tile_size: int = DEFAULT_TILE_SIZE, gvxr_units: bool = False):
+        self.scene = scene if isinstance(scene, Scene) else Scene(scene)
+        self.tile_size = int(tile_size)
+        self.bvhs = [BVH(sample["triangles"]) for sample in self.scene.samples]
+        self.geometry = self.scene.geometry()
+        e_mev = self.scene.spectrum.energy_mev
+        self.mu = self.scene.attenuation(e_mev)
+        self.weights = np.clip(self.scene.spectrum.counts, 0.0, None) * self.scene.detectedEnergy(e_mev)
+        if gvxr_units:
+            self.weights = self.weights * self.scene.gvxrScale()
+        self._executor = None
+        if workers != 1:
+            self._executor = ProcessPoolExecutor(max_workers=workers, initializer=_initWorker,
+                                                 initargs=(self.bvhs, self.geometry))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _tiles(self):
+        n_rows, n_columns = self.scene.shape
+        for r in range(0, n_rows, self.tile_size):
+            for c in range(0, n_columns, self.tile_size):
+                yield slice(r, min(r + self.tile_size, n_rows)), slice(c, min(c + self.tile_size, n_columns))
+
+    def pathLengths(self, angle: float) -> np.ndarray:
+        """Path length [mm] through each sample for every pixel, shape (n_samples, rows, columns), float32."""
+        out = np.zeros((len(self.bvhs),) + self.scene.shape, dtype=np.float32)
+        tiles = list(self._tiles())
+        if self._executor is None:
+            parts = (_tileTask(self.bvhs, self.geometry, angle, rows, columns) for rows, columns in tiles)
+        else:
+            parts = self._executor.map(_workerTile, [angle] * len(tiles), [t[0] for t in tiles],
+                                       [t[1] for t in tiles], chunksize=max(1, len(tiles) // 64))
+        for rows, columns, block in parts:
+            out[:, rows, columns] = block
+        return out
+
+    def projection(self, angle: float = None, path_lengths=None) -> np.ndarray:
+        """Energy-integrated projection at `angle` (or from already computed path_lengths), float32."""
+        if path_lengths is None:
+            path_lengths = self.pathLengths(angle)
+        return polychromaticProjection(path_lengths, self.mu, self.weights)
+
+    def acquire(self, callback=None):
+        """All projections of the scan; returns (projection_set, angle_set) like GVXRCalculate.
+
+        callback(index, angle, projection) is called as each projection is finished.
+        """
+        angles = self.scene.angles
+        projection_set = np.empty((len(angles),) + self.scene.shape, dtype=np.float32)
+        for index, angle in enumerate(angles):
+            projection_set[index] = self.projection(float(angle))
+            if callback is not None:
+                callback(index, float(angle), projection_set[index])
+        return projection_set, [float(angle) for angle in angles]
+
+
+def CPUCalculate(JSONFileName: str, workers: int = None, tile_size: int = DEFAULT_TILE_SIZE,
+                 gvxr_units: bool = False):
+    """CPU counterpart of GVXRCalculate for machines without OpenGL; returns (projection_set, angle_set).
+
+    Without gvxr_units the values are per photon per pixel; see CPUProjector and Scene.gvxrScale.
+    """
+    start_time = time.time()
+    with CPUProjector(JSONFileName, workers=workers, tile_size=tile_size, gvxr_units=gvxr_units) as projector:
+        n = len(projector.scene.angles)
+        result = projector.acquire(
+            callback=lambda index, angle, _: print(f"[INFO] Projection {index + 1}/{n} ({angle:g} deg) "
+                                                   f"done, {time.time() - start_time:.1f} s"))
+    print(f"[INFO] Total execution time: {time.time() - start_time:.2f} seconds.")
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ray-cast a gVXR JSON scene on the CPU (no OpenGL needed).")
+    parser.add_argument("json", help="gVXR JSON scene file")
+    parser.add_argument("--output", "-o", help="write the projections to this memory-mapped TIFF stack")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: all cores)")
+    parser.add_argument("--tile", type=int, default=DEFAULT_TILE_SIZE, help="pixel tile size per task")
+    parser.add_argument("--gvxr-units", action="store_true",
+                        help="apply gVXR's per-cm^2-at-1-m and pixel-area normalisation")
+    args = parser.parse_args(argv)
+
+    projection_set, angle_set = CPUCalculate(args.json, workers=args.workers, tile_size=args.tile,
+                                             gvxr_units=args.gvxr_units)
+    if args.output:
+        try:
+            from .ProjectionStack import ProjectionStack
+        except ImportError:
+            from ProjectionStack import ProjectionStack
+        stack = ProjectionStack.create(args.output, len(projection_set), projection_set.shape[1:], angles=angle_set,
+                                       metadata={"json": args.json, "projector": "cpu",
+                                                 "gvxr_units": args.gvxr_units})
+        stack.projections[:] = projection_set
+        stack.close()
+        print(f"[INFO] Projections saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import re
+
+import numpy as np
+try:
+    from .Cache import LRUCache
+    from .ElementDatabase import getElementDatabase
+    from .Interpolation import PiecewiseTable
+except ImportError:
+    from Cache import LRUCache
+    from ElementDatabase import getElementDatabase
+    from Interpolation import PiecewiseTable
+
+#  标准原子量 (g/mol)，按原子序数 1~92 排列；放射性元素取最长寿命同位素的质量数
+ATOMIC_MASS = (
+    1.008, 4.0026, 6.94, 9.0122, 10.81, 12.011, 14.007, 15.999, 18.998, 20.180,
+    22.990, 24.305, 26.982, 28.085, 30.974, 32.06, 35.45, 39.948, 39.098, 40.078,
+    44.956, 47.867, 50.942, 51.996, 54.938, 55.845, 58.933, 58.693, 63.546, 65.38,
+    69.723, 72.630, 74.922, 78.971, 79.904, 83.798, 85.468, 87.62, 88.906, 91.224,
+    92.906, 95.95, 98.0, 101.07, 102.91, 106.42, 107.87, 112.41, 114.82, 118.71,
+    121.76, 127.60, 126.90, 131.29, 132.91, 137.33, 138.91, 140.12, 140.91, 144.24,
+    145.0, 150.36, 151.96, 157.25, 158.93, 162.50, 164.93, 167.26, 168.93, 173.05,
+    174.97, 178.49, 180.95, 183.84, 186.21, 190.23, 192.22, 195.08, 196.97, 200.59,
+    204.38, 207.2, 208.98, 209.0, 210.0, 222.0, 223.0, 226.0, 227.0, 232.04,
+    231.04, 238.03,
+)
+
+_FORMULA_TOKEN = re.compile(r'([A-Z][a-z]?)|(\()|(\))|(\d+\.?\d*|\.\d+)')
+
+
+def parseFormula(formula: str) -> dict:
+    """Parse 'H2O', 'Ca10(PO4)6(OH)2' or 'Ti90Al6V4' into {symbol: number}, in order of first appearance."""
+    groups = [{}]
+    position = 0
+    last = None  # 最近一个可以被数字修饰的对象: 元素符号或刚闭合的括号组
+    while position < len(formula):
+        match = _FORMULA_TOKEN.match(formula, position)
+        if match is None:
+            raise ValueError(f"Cannot parse formula {formula!r} at position {position}")
+        symbol, opening, closing, number = match.groups()
+        position = match.end()
+
+        if symbol is not None:
+            groups[-1][symbol] = groups[-1].get(symbol, 0.0) + 1.0
+            last = ('element', symbol)
+        elif opening is not None:
+            groups.append({})
+            last = None
+        elif closing is not None:
+            if len(groups) == 1:
+                raise ValueError(f"Unbalanced ')' in formula {formula!r}")
+            group = groups.pop()
+            for key, count in group.items():
+                groups[-1][key] = groups[-1].get(key, 0.0) + count
+            last = ('group', group)
+        else:
+            if last is None:
+                raise ValueError(f"Number without element in formula {formula!r}")
+            factor = float(number)
+            if last[0] == 'element':
+                groups[-1][last[1]] += factor - 1.0
+            else:
+                for key, count in last[1].items():
+                    groups[-1][key] += count * (factor - 1.0)
+            last = None
+
+    if len(groups) != 1:
+        raise ValueError(f"Unbalanced '(' in formula {formula!r}")
+    return groups[0]
+
+
+def massFractions(composition, kind: str = 'compound') -> dict:
+    """Return {Z: mass fraction} (summing to 1) for a composition.
+
+    kind='compound': formula numbers are atom counts (H2O, SiO2).
+    kind='mixture': formula numbers are mass proportions, as in gVXR's ["mixture", "Ti90Al6V4"].
+    composition may also be a dict {symbol or Z: mass proportion}, always read as a mixture.
+    """
+    database = getElementDatabase()
+    if isinstance(composition, str):
+        parts = parseFormula(composition)
+    else:
+        parts = dict(composition)
+        kind = 'mixture'
+
+    weights = {}
+    for element, amount in parts.items():
+        z = element if isinstance(element, (int, np.integer)) else database.atomicNumber(element)
+        if kind == 'compound':
+            amount = amount * ATOMIC_MASS[z - 1]
+        elif kind != 'mixture':
+            raise ValueError(f"Unknown composition kind {kind!r}, use 'compound' or 'mixture'")
+        weights[int(z)] = weights.get(int(z), 0.0) + float(amount)
+
+    total = sum(weights.values())
+    if total <= 0:
+        raise ValueError(f"Composition {composition!r} has no mass")
+    return {z: weight / total for z, weight in sorted(weights.items())}
+
+
+def compositionKey(fractions: dict) -> tuple:
+    return tuple((z, round(weight, 12)) for z, weight in sorted(fractions.items()))
+
+
+def _mixTable(key: tuple) -> np.ndarray:
+    database = getElementDatabase()
+    tables = [database.table(z) for z, _ in key]
+
+    # 并集能量网格；任一组分的吸收边处保留两行（边下/边上），与 NIST 表格式一致
+    energies = np.unique(np.concatenate([table[:, 0] for table in tables]))
+    is_edge = np.zeros(len(energies), dtype=bool)
+    for table in tables:
+        edges = table[1:, 0][np.diff(table[:, 0]) == 0]
+        is_edge |= np.isin(energies, edges)
+    rows = np.repeat(np.arange(len(energies)), np.where(is_edge, 2, 1))
+    # 每个边的第一行取左极限，其余行取右极限
+    left = np.zeros(len(rows), dtype=bool)
+    left[np.flatnonzero(np.diff(rows, prepend=-1) != 0)[is_edge]] = True
+
+    mixed = np.zeros((len(rows), 3))
+    mixed[:, 0] = energies[rows]
+    for (_, weight), table in zip(key, tables):
+        for column in (1, 2):
+            f = PiecewiseTable(table[:, 0], table[:, column])
+            values = f(energies[rows], side='right')
+            values[left] = f(energies[rows][left], side='left')
+            mixed[:, column] += weight * values
+    mixed.flags.writeable = False
+    return mixed
+
+
+#  按组成缓存混合后的 [Energy (MeV), MAC, Coherent-Corrected MAC] 表
+MIXTURE_CACHE = LRUCache(maxsize=128)
+
+
+def mixtureTable(fractions: dict) -> np.ndarray:
+    """Mixture mu/rho table (rows, 3) for {Z: mass fraction}: Σ w_i (mu/rho)_i on the union energy grid.
+
+    Edges of every constituent are kept as duplicated energies (below-edge row first), like the element CSVs.
+    Tables are cached by composition, so repeated use costs a dictionary lookup.
+    """
+    key = compositionKey(fractions)
+    return MIXTURE_CACHE.get(key, lambda: _mixTable(key))
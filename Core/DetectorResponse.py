@@ -0,0 +1,151 @@
+import hashlib
+import os
+
+import numpy as np
+try:
+    from .Cache import LRUCache
+    from .Spectrum import UNIT_TO_MEV
+except ImportError:
+    from Cache import LRUCache
+    from Spectrum import UNIT_TO_MEV
+
+#  每个响应对象最多缓存的能量网格数
+GRID_CACHE_SIZE = 16
+#  理想探测器的名称，与 DetectorResponse 的 mode 相同，所有入口（fromSpec、批处理清单）都用这一套
+IDEAL_MODES = ('integrating', 'counting')
+
+
+def _gridKey(e_mev) -> str:
+    grid = np.ascontiguousarray(e_mev, dtype=float).reshape(-1)
+    return hashlib.blake2b(grid.tobytes(), digest_size=16).hexdigest()
+
+
+class DetectorResponse:
+    """Detector energy response: signal per incident photon as a function of its energy E [MeV].
+
+    A table (E_in, E_out) gives the energy deposited per photon (the gVXR "Energy response" file, two columns,
+    linearly interpolated); without a table the detector is an ideal energy integrator (signal E) or, with
+    mode='counting', a photon counter (signal 1). The response resampled onto an energy grid is cached per
+    grid, so applying it to any number of spectra on that grid is one broadcast multiply.
+    """
+    """探测器能量响应：按能量网格缓存重采样结果，一次广播乘法把整批滤过后的能谱换算为探测信号。"""
+
+    def __init__(self, e_in=None, e_out=None, mode: str = 'integrating', source: str = None):
+        if mode not in IDEAL_MODES:
+            raise ValueError(f"Unknown detector mode {mode!r}")
+        if e_in is not None:
+            order = np.argsort(e_in, kind='stable')
+            e_in = np.asarray(e_in, dtype=float)[order]
+            e_out = np.asarray(e_out, dtype=float)[order]
+            e_in.flags.writeable = False
+            e_out.flags.writeable = False
+        self.e_in = e_in
+        self.e_out = e_out
+        self.mode = mode
+        self.source = source
+        self._grids = LRUCache(maxsize=GRID_CACHE_SIZE)
+
+    @property
+    def isTable(self) -> bool:
+        return self.e_in is not None
+
+    def __call__(self, e_mev) -> np.ndarray:
+        """Signal per photon at energies e_mev [MeV] (any shape), evaluated without the grid cache."""
+        e_mev = np.asarray(e_mev, dtype=float)
+        if self.isTable:
+            return np.interp(e_mev, self.e_in, self.e_out)
+        if self.mode == 'counting':
+            return np.ones_like(e_mev)
+        return e_mev.copy()
+
+    def resample(self, e_mev) -> np.ndarray:
+        """Read-only response on the grid e_mev [MeV], computed once per grid contents."""
+        grid = np.ascontiguousarray(e_mev, dtype=float).reshape(-1)
+
+        def build():
+            response = self(grid)
+            response.flags.writeable = False
+            return response
+
+        return self._grids.get(_gridKey(grid), build)
+
+    def apply(self, counts, e_mev, out=None) -> np.ndarray:
+        """Detected signal per energy bin for counts on the grid e_mev: shape (n_E,) or a batch (..., n_E)."""
+        return np.multiply(counts, self.resample(e_mev), out=out)
+
+    def signal(self, counts, e_mev) -> np.ndarray:
+        """Total detected signal of each spectrum in counts (..., n_E) -> (...), one matrix-vector product."""
+        return np.asarray(counts, dtype=float) @ self.resample(e_mev)
+
+    def table(self):
+        """(E_in, E_out) [MeV], or None for the ideal detectors."""
+        return None if not self.isTable else (self.e_in, self.e_out)
+
+    @classmethod
+    def fromTable(cls, table, source: str = None):
+        """From (E_in, E_out) arrays in MeV."""
+        return cls(table[0], table[1], source=source)
+
+    @classmethod
+    def fromFile(cls, file_name: str, unit: str = 'MeV'):
+        return loadResponse(file_name, unit)
+
+    @classmethod
+    def fromSpec(cls, response):
+        """Normalise the response arguments used across Core into a DetectorResponse.
+
+        None or 'integrating': ideal energy-integrating detector. 'counting': photon counting. Any other string
+        is an error. A DetectorResponse is returned as is; a callable E -> signal is wrapped, with one wrapper
+        (and so one per-grid cache) per callable; anything else is read as an (E_in, E_out) table.
+        """
+        if response is None:
+            return IDEAL_INTEGRATING
+        if isinstance(response, DetectorResponse):
+            return response
+        if isinstance(response, str):
+            if response.lower() not in IDEAL_MODES:
+                raise ValueError(f"Unknown detector response {response!r}, expected one of {IDEAL_MODES}")
+            return PHOTON_COUNTING if response.lower() == 'counting' else IDEAL_INTEGRATING
+        if callable(response):
+            try:
+                return CALLABLE_RESPONSE_CACHE.get(response, lambda: _CallableResponse(response))
+            except TypeError:  # 不可哈希的可调用对象
+                return _CallableResponse(response)
+        return cls.fromTable(response)
+
+
+class _CallableResponse(DetectorResponse):
+    """A user function E -> signal; cached per grid like the tables."""
+
+    def __init__(self, function):
+        super().__init__()
+        self.function = function
+
+    def __call__(self, e_mev) -> np.ndarray:
+        return np.asarray(self.function(np.asarray(e_mev, dtype=float)), dtype=float)
+
+
+#  共享的理想探测器：能量积分（信号 = E）与光子计数（信号 = 1）
+IDEAL_INTEGRATING = DetectorResponse()
+PHOTON_COUNTING = DetectorResponse(mode='counting')
+
+#  fromSpec 对同一个可调用对象返回同一个包装，重复调用时复用它的网格缓存
+CALLABLE_RESPONSE_CACHE = LRUCache(maxsize=16)
+
+#  按 (路径, mtime, 大小, 单位) 缓存已读取的响应表，文件未变时共享同一对象及其网格缓存
+RESPONSE_CACHE = LRUCache(maxsize=16)
+
+
+def loadResponse(file_name: str, unit: str = 'MeV') -> DetectorResponse:
+    """Load a two-column (E_in, E_out) response file in `unit`; repeated loads share one DetectorResponse."""
+    path = os.path.abspath(file_name)
+    scale = UNIT_TO_MEV[unit]
+
+    def parse():
+        table = np.loadtxt(path, ndmin=2)
+        if table.shape[1] < 2:
+            raise ValueError(f"detector response {path} needs two columns (E_in, E_out)")
+        return DetectorResponse(table[:, 0] * scale, table[:, 1] * scale, source=path)
+
+    stat = os.stat(path)
+    return RESPONSE_CACHE.get((path, stat.st_mtime_ns, stat.st_size, unit), parse)
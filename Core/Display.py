@@ -0,0 +1,74 @@
+import numpy as np
+
+#  默认查找表长度
+DEFAULT_LUT_SIZE = 4096
+#  从堆栈估计显示窗口时最多读取的投影张数与每张的像素数
+WINDOW_SAMPLE_FRAMES = 16
+WINDOW_SAMPLE_PIXELS = 1 << 20
+
+
+class DisplayWindow:
+    """float32 projection -> uint8 display mapping, fixed once per stack.
+
+    Reproduces GUI float32_to_uint8 (logCount nested log(x - min + offset) passes, then min/max stretch) for
+    an image whose range is [low, high], but with the statistics taken once for the whole stack. The first log
+    is applied per pixel (it spreads out the steep low end) and the remaining passes and the stretch come from
+    a lookup table, so a frame costs one log, one multiply-add and one table lookup.
+    """
+    """每个投影堆栈只计算一次窗口统计，之后经查找表把 float32 投影转换为 uint8 显示图像。"""
+
+    def __init__(self, low: float, high: float, offset: float = 1.0, logCount: int = 3,
+                 lut_size: int = DEFAULT_LUT_SIZE):
+        self.low = float(low)
+        self.high = max(float(high), self.low)
+        self.offset = 1.0 if offset <= 0 else float(offset)
+        self.logCount = int(logCount)
+        lut_size = max(int(lut_size), 2)
+
+        # 查找表的自变量: 第一遍 log 之后的值（logCount 为 0 时就是原始值）
+        self._u0 = self._first(np.float64(self.low))
+        u1 = self._first(np.float64(self.high))
+        self._scale = (lut_size - 1) / (u1 - self._u0) if u1 > self._u0 else 0.0
+        y = np.linspace(self._u0, u1, lut_size)
+        for _ in range(self.logCount - 1):
+            y = np.log(y - y[0] + self.offset)
+        span = y[-1] - y[0]
+        if span > 0:
+            self.lut = ((y - y[0]) / span * 255).astype(np.uint8)
+        else:
+            self.lut = np.zeros(lut_size, dtype=np.uint8)
+
+    def _first(self, x):
+        if self.logCount > 0:
+            return np.log(x - self.low + self.offset)
+        return x
+
+    def __call__(self, img) -> np.ndarray:
+        work = np.asarray(img, dtype=np.float32)
+        if self.logCount > 0:
+            # 统计值来自采样，个别像素可能低于 low；截断后再取 log
+            work = np.subtract(work, self.low - self.offset, dtype=np.float32)
+            np.maximum(work, self.offset, out=work)
+            np.log(work, out=work)
+        else:
+            work = work.copy()
+        work -= self._u0
+        work *= self._scale
+        # 超出表范围的索引由 take 的 clip 模式截断到两端
+        return np.take(self.lut, work.astype(np.intp), mode='clip')
+
+    @classmethod
+    def fromStack(cls, projections, max_frames: int = WINDOW_SAMPLE_FRAMES,
+                  max_pixels: int = WINDOW_SAMPLE_PIXELS, **kwargs):
+        """Window from the min/max of up to max_frames evenly spaced projections (pixels subsampled by stride)."""
+        n = len(projections)
+        if n == 0:
+            return cls(0.0, 1.0, **kwargs)
+        low, high = np.inf, -np.inf
+        for index in np.unique(np.linspace(0, n - 1, min(n, max_frames)).round().astype(int)):
+            frame = np.asarray(projections[index])
+            stride = max(1, int(np.ceil(np.sqrt(frame.size / max_pixels))))
+            sample = frame[::stride, ::stride] if frame.ndim == 2 else frame
+            low = min(low, float(np.nanmin(sample)))
+            high = max(high, float(np.nanmax(sample)))
+        return cls(low, high, **kwargs)
@@ -0,0 +1,150 @@
+import json
+import os
+import sys
+import threading
+
+import numpy as np
+
+ELEMENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'element')
+SYMBOL_KEY_FILE = os.path.join(ELEMENT_DIR, 'symbol_key.json')
+DATABASE_FILE = os.path.join(ELEMENT_DIR, 'elements.bin')
+
+N_ELEMENTS = 92
+COLUMNS = ('Energy', 'MAC', 'Coherent-Corrected MAC')
+
+# 文件布局: [header][offsets: int64 x (N+1)][data: float64 x (rows, 3)][symbol_key.json (utf-8)]
+_MAGIC = b'XFELEMDB'
+_VERSION = 1
+_HEADER = np.dtype([
+    ('magic', 'S8'),
+    ('version', '<u4'),
+    ('n_elements', '<u4'),
+    ('n_rows', '<u8'),
+    ('key_bytes', '<u8'),
+])
+
+
+def elementCsvPath(atomic_number: int) -> str:
+    return os.path.join(ELEMENT_DIR, f'{atomic_number:02d}.csv')
+
+
+def buildElementDatabase(output_file: str = DATABASE_FILE, element_dir: str = ELEMENT_DIR) -> str:
+    """Pack the 92 NIST tables and symbol_key.json into one binary file."""
+    """把92个NIST衰减表和symbol_key.json打包成一个二进制文件。"""
+    tables = []
+    for z in range(1, N_ELEMENTS + 1):
+        table = np.loadtxt(os.path.join(element_dir, f'{z:02d}.csv'), delimiter=',', skiprows=1, ndmin=2)
+        if table.shape[1] != len(COLUMNS):
+            raise ValueError(f"Element table {z:02d}.csv has {table.shape[1]} columns, expected {len(COLUMNS)}.")
+        tables.append(table)
+
+    offsets = np.zeros(N_ELEMENTS + 1, dtype='<i8')
+    offsets[1:] = np.cumsum([len(table) for table in tables])
+    data = np.ascontiguousarray(np.concatenate(tables), dtype='<f8')
+
+    with open(os.path.join(element_dir, 'symbol_key.json'), 'rb') as f:
+        symbol_key = f.read()
+    json.loads(symbol_key)  # 提前校验, 避免写出坏文件
+
+    header = np.zeros(1, dtype=_HEADER)
+    header['magic'] = _MAGIC
+    header['version'] = _VERSION
+    header['n_elements'] = N_ELEMENTS
+    header['n_rows'] = len(data)
+    header['key_bytes'] = len(symbol_key)
+
+    # 先写临时文件再替换, 多进程同时构建时不会读到半个文件
+    tmp_file = f"{output_file}.{os.getpid()}.tmp"
+    with open(tmp_file, 'wb') as f:
+        f.write(header.tobytes())
+        f.write(offsets.tobytes())
+        f.write(data.tobytes())
+        f.write(symbol_key)
+    os.replace(tmp_file, output_file)
+    return output_file
+
+
+def _isStale(database_file: str, element_dir: str) -> bool:
+    if not os.path.exists(database_file):
+        return True
+    built = os.path.getmtime(database_file)
+    sources = [os.path.join(element_dir, 'symbol_key.json')]
+    sources += [os.path.join(element_dir, f'{z:02d}.csv') for z in range(1, N_ELEMENTS + 1)]
+    return any(os.path.getmtime(source) > built for source in sources if os.path.exists(source))
+
+
+class ElementDatabase:
+    """Memory-mapped view of the packed element attenuation tables."""
+
+    def __init__(self, database_file: str = DATABASE_FILE):
+        self.database_file = database_file
+
+        raw = np.memmap(database_file, dtype=np.uint8, mode='r')
+        header = raw[:_HEADER.itemsize].view(_HEADER)[0]
+        if header['magic'] != _MAGIC or header['version'] != _VERSION:
+            raise ValueError(f"{database_file} is not a version {_VERSION} element database.")
+
+        n_elements = int(header['n_elements'])
+        n_rows = int(header['n_rows'])
+        start = _HEADER.itemsize
+        end = start + 8 * (n_elements + 1)
+        self.offsets = raw[start:end].view('<i8')
+
+        start, end = end, end + 8 * len(COLUMNS) * n_rows
+        #  所有元素首尾相接的 [Energy (MeV), MAC (cm^2/g), Coherent-Corrected MAC (cm^2/g)]
+        self.data = raw[start:end].view('<f8').reshape(n_rows, len(COLUMNS))
+
+        self.symbol_key = json.loads(bytes(raw[end:end + int(header['key_bytes'])]).decode('utf-8'))
+        self.n_elements = n_elements
+        self._raw = raw
+
+    def __len__(self):
+        return self.n_elements
+
+    def table(self, atomic_number: int) -> np.ndarray:
+        """Return the (rows, 3) attenuation table of element Z as a read-only view."""
+        if atomic_number < 1 or atomic_number > self.n_elements:
+            raise KeyError(f"No attenuation table for Z={atomic_number}.")
+        return self.data[self.offsets[atomic_number - 1]:self.offsets[atomic_number]]
+
+    def atomicNumber(self, symbol: str) -> int:
+        return int(self.symbol_key[symbol]["atomic_number"])
+
+    def density(self, symbol: str) -> float:
+        return float(self.symbol_key[symbol]["density"])
+
+    def symbols(self):
+        return list(self.symbol_key.keys())
+
+
+_database = None
+_database_lock = threading.Lock()
+
+
+def getElementDatabase() -> ElementDatabase:
+    """Return the shared database, (re)building the binary file if it is missing or older than the CSVs."""
+    global _database
+    if _database is None:
+        with _database_lock:
+            if _database is None:
+                if _isStale(DATABASE_FILE, ELEMENT_DIR):
+                    buildElementDatabase(DATABASE_FILE, ELEMENT_DIR)
+                _database = ElementDatabase(DATABASE_FILE)
+    return _database
+
+
+def elementFileNumber(file_name: str):
+    """Return Z if file_name is one of the Core/element/NN.csv tables, otherwise None."""
+    if not file_name.endswith('.csv'):
+        return None
+    folder, name = os.path.split(os.path.abspath(file_name))
+    stem = name[:-len('.csv')]
+    if not stem.isdigit() or os.path.normcase(folder) != os.path.normcase(ELEMENT_DIR):
+        return None
+    z = int(stem)
+    return z if 1 <= z <= N_ELEMENTS else None
+
+
+if __name__ == "__main__":
+    out = sys.argv[1] if len(sys.argv) > 1 else DATABASE_FILE
+    print("Element database written to:", buildElementDatabase(out))
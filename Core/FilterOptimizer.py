@@ -0,0 +1,248 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+try:
+    from .ElementDatabase import getElementDatabase
+    from .Materials import Material, MaterialStack
+    from .Spectrum import Spectrum
+    from .XFilter import transmission_of_stack
+except ImportError:
+    from ElementDatabase import getElementDatabase
+    from Materials import Material, MaterialStack
+    from Spectrum import Spectrum
+    from XFilter import transmission_of_stack
+
+#  违反约束时的罚分系数，保证任何可行解都优于不可行解
+CONSTRAINT_PENALTY = 1e3
+#  默认候选材料排除气体（密度小于此值, g/cm^3）和没有稳定同位素的元素
+MIN_SOLID_DENSITY = 0.5
+#  室温下不是固体的元素（气体和液体 Br、Hg），无论数据库里的密度如何都不能做滤片
+NOT_SOLID_AT_ROOM_TEMPERATURE = ('H', 'He', 'N', 'O', 'F', 'Ne', 'Cl', 'Ar', 'Br', 'Kr', 'Xe', 'Hg', 'Rn')
+MAX_STABLE_Z = 83
+UNSTABLE_BELOW_MAX_Z = ('Tc', 'Pm')
+
+
+class FilterCriteria:
+    """What a filter stack should achieve on the filtered spectrum.
+
+    target_mean_energy [MeV]: minimise |mean energy - target| / target. Without it the objective is to
+    maximise the transmitted fraction of counts.
+    low_energy_cutoff [MeV] with max_low_fraction: at most this fraction of the filtered counts below the cutoff.
+    min_transmission / max_transmission: bounds on total transmitted counts / input counts.
+    """
+
+    def __init__(self, target_mean_energy: float = None, low_energy_cutoff: float = None,
+                 max_low_fraction: float = None, min_transmission: float = None, max_transmission: float = None):
+        self.target_mean_energy = target_mean_energy
+        self.low_energy_cutoff = low_energy_cutoff
+        self.max_low_fraction = max_low_fraction if max_low_fraction is not None or low_energy_cutoff is None \
+            else 0.01
+        self.min_transmission = min_transmission
+        self.max_transmission = max_transmission
+
+
+def spectrumMetrics(E_mev: np.ndarray, counts_in: np.ndarray, optical_depth: np.ndarray, low_energy_cutoff=None):
+    """Mean energy, transmitted fraction and low-energy fraction for a batch of optical depths (B, n_E)."""
+    counts_out = np.exp(-optical_depth)
+    counts_out *= counts_in
+    total_out = counts_out.sum(axis=-1)
+    safe_total = np.where(total_out > 0, total_out, 1.0)
+    metrics = {
+        "mean_energy": (counts_out @ E_mev) / safe_total,
+        "transmission": total_out / max(float(counts_in.sum()), 1e-300),
+    }
+    if low_energy_cutoff is not None:
+        metrics["low_energy_fraction"] = counts_out[..., E_mev < low_energy_cutoff].sum(axis=-1) / safe_total
+    return metrics
+
+
+def scoreMetrics(metrics: dict, criteria: FilterCriteria):
+    """Return (score, feasible) arrays; lower scores are better."""
+    if criteria.target_mean_energy is not None:
+        score = np.abs(metrics["mean_energy"] - criteria.target_mean_energy) / criteria.target_mean_energy
+    else:
+        score = -metrics["transmission"]
+
+    violation = np.zeros_like(score)
+    transmission = metrics["transmission"]
+    if criteria.min_transmission is not None:
+        violation += np.maximum(criteria.min_transmission - transmission, 0.0) / criteria.min_transmission
+    if criteria.max_transmission is not None:
+        violation += np.maximum(transmission - criteria.max_transmission, 0.0) / criteria.max_transmission
+    if criteria.low_energy_cutoff is not None:
+        violation += np.maximum(metrics["low_energy_fraction"] - criteria.max_low_fraction, 0.0) \
+                     / max(criteria.max_low_fraction, 1e-12)
+    return score + CONSTRAINT_PENALTY * violation, violation == 0
+
+
+class _CandidateEvaluator:
+    """Scores batches of (base stack + one more layer) candidates against the criteria."""
+
+    def __init__(self, E_mev, counts_in, layer_depth, criteria: FilterCriteria):
+        self.E_mev = E_mev
+        self.counts_in = counts_in
+        self.layer_depth = layer_depth
+        self.criteria = criteria
+
+    def best(self, base_depth, base_ids, layer_ids, keep: int):
+        """Score every pair base_ids[i] + layer_ids[i]; return the `keep` best as (scores, base_ids, layer_ids)."""
+        depth = base_depth[base_ids]
+        depth += self.layer_depth[layer_ids]
+        metrics = spectrumMetrics(self.E_mev, self.counts_in, depth, self.criteria.low_energy_cutoff)
+        score, _ = scoreMetrics(metrics, self.criteria)
+        if len(score) > keep:
+            best = np.argpartition(score, keep - 1)[:keep]
+            return score[best], base_ids[best], layer_ids[best]
+        return score, base_ids, layer_ids
+
+
+#  进程池中每个 worker 持有一份评估器，候选层光学厚度表只在初始化时传一次
+_worker_evaluator = None
+
+
+def _initWorker(E_mev, counts_in, layer_depth, criteria):
+    global _worker_evaluator
+    _worker_evaluator = _CandidateEvaluator(E_mev, counts_in, layer_depth, criteria)
+
+
+def _workerBest(base_depth, base_ids, layer_ids, keep):
+    return _worker_evaluator.best(base_depth, base_ids, layer_ids, keep)
+
+
+def defaultMaterials() -> list:
+    """Catalogue elements usable as filter sheets: solid at room temperature and with a stable isotope.
+
+    The symbol_key.json densities of Br and Hg are liquid densities, so liquids and gases are excluded by
+    name (NOT_SOLID_AT_ROOM_TEMPERATURE) as well as by density.
+    """
+    database = getElementDatabase()
+    return [symbol for symbol in database.symbols()
+            if database.density(symbol) >= MIN_SOLID_DENSITY and database.atomicNumber(symbol) <= MAX_STABLE_Z
+            and symbol not in UNSTABLE_BELOW_MAX_Z and symbol not in NOT_SOLID_AT_ROOM_TEMPERATURE]
+
+
+def optimizeFilterStack(spectrum, criteria: FilterCriteria, materials: list = None, thicknesses=None,
+                        max_layers: int = 2, beam_width: int = 32, top: int = 10, workers: int = 1,
+                        chunk_size: int = 8192) -> list:
+    """Search element filter stacks of 1..max_layers layers that best meet `criteria` for `spectrum`.
+
+    spectrum: Spectrum or (E_mev, counts). materials: element symbols, or (symbol, density) pairs
+    (default: defaultMaterials()). thicknesses [mm]: candidate layer thicknesses (default 0.01-20 mm, log spaced).
+    Layers are added one at a time (beam search, beam_width stacks kept per depth); each depth scores every
+    beam stack + every candidate layer in vectorised chunks of chunk_size. By default this runs in the calling
+    process; workers > 1 (or None for one per CPU) opts in to a process pool, which pays off for large
+    catalogues or deep searches but costs a pool start-up and a copy of the layer library per worker.
+    Returns the `top` best stacks as dicts, best first, with metrics recomputed by transmission_of_stack.
+    """
+    """在元素目录中搜索满足目标（平均能量、低能截止、总透射率约束）的1~N层滤片组合。"""
+    if isinstance(spectrum, Spectrum):
+        E_mev, counts_in = spectrum.energy_mev, spectrum.counts
+    else:
+        E_mev, counts_in = spectrum
+    E_mev = np.asarray(E_mev, dtype=float)
+    counts_in = np.clip(np.asarray(counts_in, dtype=float), 0.0, None)
+
+    database = getElementDatabase()
+    materials = defaultMaterials() if materials is None else materials
+    materials = [(entry, database.density(entry)) if isinstance(entry, str) else tuple(entry) for entry in materials]
+    thicknesses = np.geomspace(0.01, 20.0, 40) if thicknesses is None else np.asarray(thicknesses, dtype=float)
+
+    # 候选层库: 每种材料 x 每个厚度的光学厚度 mu(E)·t，形状 (n_materials * n_thicknesses, n_E)
+    mu = np.stack([Material.fromElement(symbol, 1.0, density).muInterp()(E_mev) for symbol, density in materials])
+    layer_depth = (mu[:, None, :] * (thicknesses[None, :, None] / 10.0)).reshape(-1, len(E_mev))
+    layer_material = np.repeat(np.arange(len(materials)), len(thicknesses))
+    layer_thickness = np.tile(thicknesses, len(materials))
+
+    executor = None
+    if workers != 1:
+        executor = ProcessPoolExecutor(max_workers=workers, initializer=_initWorker,
+                                       initargs=(E_mev, counts_in, layer_depth, criteria))
+    local = _CandidateEvaluator(E_mev, counts_in, layer_depth, criteria)
+
+    beam = [()]  # 每个元素是一组层编号（layer_depth 的行号）
+    beam_depth = np.zeros((1, len(E_mev)))
+    found = {}
+    try:
+        for _ in range(max_layers):
+            # 同一材料不重复出现在一个组合中（两层同材料等价于一层更厚的）
+            pairs = []
+            for b, stack in enumerate(beam):
+                layers = np.flatnonzero(~np.isin(layer_material, layer_material[list(stack)]))
+                pairs.append(np.column_stack([np.full(len(layers), b), layers]))
+            pairs = np.concatenate(pairs).astype(np.int64)
+            if not len(pairs):
+                break
+            keep = max(beam_width, top) * 4
+            chunks = [pairs[i:i + chunk_size] for i in range(0, len(pairs), chunk_size)]
+            if executor is None:
+                parts = [local.best(beam_depth, chunk[:, 0], chunk[:, 1], keep) for chunk in chunks]
+            else:
+                parts = list(executor.map(_workerBest, [beam_depth] * len(chunks), [chunk[:, 0] for chunk in chunks],
+                                          [chunk[:, 1] for chunk in chunks], [keep] * len(chunks)))
+            scores = np.concatenate([part[0] for part in parts])
+            base_ids = np.concatenate([part[1] for part in parts])
+            layer_ids = np.concatenate([part[2] for part in parts])
+
+            next_beam = []
+            next_depth = []
+            for i in np.argsort(scores, kind='stable'):
+                stack = tuple(sorted(beam[base_ids[i]] + (int(layer_ids[i]),)))
+                if stack in found:
+                    continue
+                found[stack] = float(scores[i])
+                if len(next_beam) < beam_width:
+                    next_beam.append(stack)
+                    next_depth.append(beam_depth[base_ids[i]] + layer_depth[layer_ids[i]])
+            if not next_beam:
+                break
+            beam, beam_depth = next_beam, np.stack(next_depth)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    results = []
+    for stack, _ in sorted(found.items(), key=lambda item: item[1])[:top]:
+        layers = [(materials[layer_material[l]][0], float(layer_thickness[l]), materials[layer_material[l]][1])
+                  for l in stack]
+        results.append(evaluateStack(E_mev, counts_in, layers, criteria))
+    results.sort(key=lambda result: result["score"])
+    return results
+
+
+def evaluateStack(E_mev, counts_in, layers, criteria: FilterCriteria) -> dict:
+    """Score one stack [(symbol, thickness_mm, density), ...] through transmission_of_stack."""
+    stack = toMaterialStack(layers)
+    optical_depth = -np.log(np.clip(transmission_of_stack(E_mev, stack), 1e-300, None))
+    metrics = spectrumMetrics(E_mev, counts_in, optical_depth[None, :], criteria.low_energy_cutoff)
+    score, feasible = scoreMetrics(metrics, criteria)
+    result = {
+        "layers": layers,
+        "score": float(score[0]),
+        "feasible": bool(feasible[0]),
+        "mean_energy": float(metrics["mean_energy"][0]),
+        "transmission": float(metrics["transmission"][0]),
+    }
+    if "low_energy_fraction" in metrics:
+        result["low_energy_fraction"] = float(metrics["low_energy_fraction"][0])
+    return result
+
+
+def toMaterialStack(layers) -> MaterialStack:
+    """MaterialStack from [(symbol, thickness_mm, density), ...] as returned in optimizeFilterStack results."""
+    return MaterialStack([Material.fromElement(symbol, thickness, density) for symbol, thickness, density in layers])
+
+
+if __name__ == "__main__":
+    try:
+        from .Spectrum import loadSpectrum
+    except ImportError:
+        from Spectrum import loadSpectrum
+
+    spec = loadSpectrum(os.path.join(os.path.dirname(os.path.abspath(__file__)), "2MeV.txt"))
+    found_stacks = optimizeFilterStack(spec, FilterCriteria(target_mean_energy=0.9, min_transmission=0.2),
+                                       max_layers=2)
+    for found_stack in found_stacks:
+        print(" + ".join(f"{s}{t:.3g}mm" for s, t, _ in found_stack["layers"]),
+              f"mean={found_stack['mean_energy']:.4f} MeV T={found_stack['transmission']:.3f}",
+              "" if found_stack["feasible"] else "(infeasible)")
@@ -0,0 +1,94 @@
+import hashlib
+
+import numpy as np
+try:
+    from .Cache import LRUCache
+except ImportError:
+    from Cache import LRUCache
+
+
+class PiecewiseTable:
+    """Preprocessed piecewise-linear attenuation table, in log-log or linear (E, mu/rho) space.
+
+    NIST tables repeat the energy at every absorption edge (below-edge row, then above-edge row). Those
+    zero-width steps are dropped when building the segments, so each edge becomes a segment boundary whose
+    left limit is the below-edge value and whose right limit is the above-edge value. Each segment stores its
+    slope and intercept of mu/rho, so evaluation is one searchsorted, one
+    multiply-add, (log-log only) one exp, and the density factor, which is applied last so that a zero density
+    gives mu = 0 rather than log(0). Queries outside the table extrapolate the first/last segment.
+    """
+    """预处理的分段线性衰减表（对数-对数或线性空间），吸收边按左右极限显式处理。"""
+
+    def __init__(self, E_tab_mev, mu_over_rho_tab, rho_g_cm3: float = 1.0, loglog: bool = True):
+        E_tab = np.asarray(E_tab_mev, dtype=float)
+        x = E_tab
+        y = np.asarray(mu_over_rho_tab, dtype=float)
+        if loglog:
+            # Avoid log(<=0)
+            x = np.log(np.clip(x, 1e-12, None))
+            y = np.log(np.clip(y, 1e-30, None))
+
+        step = np.diff(x) > 0
+        if not np.any(step):
+            raise ValueError("attenuation table needs at least two distinct energies")
+        x0, x1 = x[:-1][step], x[1:][step]
+        y0, y1 = y[:-1][step], y[1:][step]
+
+        self.loglog = loglog
+        self.rho_g_cm3 = rho_g_cm3
+        self.slopes = (y1 - y0) / (x1 - x0)
+        self.intercepts = y0 - self.slopes * x0
+        #  第 i 段从 boundaries[i-1] 开始；吸收边处左侧段取边下值，右侧段取边上值
+        self.boundaries = x0[1:]
+        #  吸收边能量（表中重复出现的能量），单位与输入相同
+        self.edges = E_tab[1:][np.diff(E_tab) == 0]
+
+    def __call__(self, E_mev_query, side: str = 'right'):
+        """Return mu(E) [cm^-1]; at an edge energy side='right' gives the above-edge value, 'left' the below-edge."""
+        E = np.asarray(E_mev_query, dtype=float)
+        x = np.log(np.clip(E, 1e-12, None)) if self.loglog else E
+        segment = np.searchsorted(self.boundaries, x, side=side)
+        y = self.slopes[segment] * x + self.intercepts[segment]
+        return self.rho_g_cm3 * (np.exp(y) if self.loglog else y)
+
+
+def make_mu_interp(E_tab_mev, mu_over_rho_tab, rho_g_cm3):
+    """Return a callable mu(E) [cm^-1] using log-log interpolation on (E, mu/rho) and multiply by density."""
+    """返回一个可调用的μ(E) [cm^-1]，使用(E, μ/ρ)的对数-对数插值并乘以密度。"""
+    return PiecewiseTable(E_tab_mev, mu_over_rho_tab, rho_g_cm3, loglog=True)
+
+
+def make_linear_mu_interp(E_tab_mev, mu_over_rho_tab, rho_g_cm3):
+    """Return a callable mu(E) [cm^-1] using linear interpolation on (E, mu/rho), as filtrationCalculate does."""
+    """返回一个可调用的μ(E) [cm^-1]，在(E, μ/ρ)上线性插值（filtrationCalculate 的算法）。"""
+    return PiecewiseTable(E_tab_mev, mu_over_rho_tab, rho_g_cm3, loglog=False)
+
+
+INTERP_BUILDERS = {
+    'loglog': make_mu_interp,
+    'linear': make_linear_mu_interp,
+}
+
+
+def tableKey(E_tab_mev, mu_over_rho_tab):
+    """Identity of an attenuation table that does not come from the element database: a digest of its values."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(np.ascontiguousarray(E_tab_mev, dtype=float).tobytes())
+    digest.update(np.ascontiguousarray(mu_over_rho_tab, dtype=float).tobytes())
+    return 'table', digest.hexdigest()
+
+
+class InterpolatorCache(LRUCache):
+    """Bounded, thread-safe LRU cache of mu(E) interpolators keyed by (table identity, kind, density)."""
+
+    def muInterp(self, E_tab_mev, mu_over_rho_tab, rho_g_cm3, kind: str = 'loglog', table_key=None):
+        """Return the shared mu(E) [cm^-1] callable (E in MeV) for the given table and density."""
+        if table_key is None:
+            table_key = tableKey(E_tab_mev, mu_over_rho_tab)
+        builder = INTERP_BUILDERS[kind]
+        return self.get((table_key, kind, float(rho_g_cm3)),
+                        lambda: builder(E_tab_mev, mu_over_rho_tab, rho_g_cm3))
+
+
+#  Material / filtrationCalculate / transmission_of_stack 共用的插值器缓存
+MU_INTERP_CACHE = InterpolatorCache()
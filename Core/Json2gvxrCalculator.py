@@ -1,13 +1,29 @@
 import functools
+import hashlib
+import json
 import os
 import sys
+import threading
 from io import StringIO
 
 import numpy as np
-from tifffile import imwrite
 from gvxrPython3 import gvxr, json2gvxr
 import time
 from tqdm import tqdm
+try:
+    from .Profiling import StageProfiler
+    from .ProjectionStack import ProjectionStack
+    from .ProjectionWriter import StreamingTifWriter
+    from .Pyramid import PreviewPyramid, PyramidBuilder
+    from .ResultCache import ResultCache, configurationKey, openResult
+    from .Spectrum import Spectrum
+except ImportError:
+    from Profiling import StageProfiler
+    from ProjectionStack import ProjectionStack
+    from ProjectionWriter import StreamingTifWriter
+    from Pyramid import PreviewPyramid, PyramidBuilder
+    from ResultCache import ResultCache, configurationKey, openResult
+    from Spectrum import Spectrum
 
 
 def debuggable_print(debug):
@@ -29,11 +45,207 @@ def debuggable_print(debug):
     return decorator
 
 
+def projectionToArray(raw, out: np.ndarray = None) -> np.ndarray:
+    """Convert one projection returned by gVXR into float32, writing into `out` when given.
+
+    Buffer-backed results (NumPy arrays) are used without copying; nested sequences are converted straight into
+    the destination, so no float64 or whole-set temporary is ever built.
+    """
+    try:
+        array = np.asarray(memoryview(raw), dtype=np.float32)
+    except TypeError:
+        array = None
+    if out is None:
+        return array if array is not None else np.asarray(raw, dtype=np.float32)
+    out[...] = array if array is not None else raw
+    return out
+
+
+def spectrumArrays(spectrum):
+    """(E_mev, counts) float arrays of a Spectrum or an (E_mev, counts) pair, e.g. (E_keV / 1000, counts_out)."""
+    if isinstance(spectrum, Spectrum):
+        e_mev, counts = spectrum.energy_mev, spectrum.counts
+    else:
+        e_mev, counts = spectrum
+    e_mev = np.asarray(e_mev, dtype=float).reshape(-1)
+    counts = np.asarray(counts, dtype=float).reshape(-1)
+    if len(e_mev) != len(counts):
+        raise ValueError(f"spectrum has {len(e_mev)} energies but {len(counts)} counts")
+    return e_mev, counts
+
+
+def loadBeamSpectrum(spectrum):
+    """Hand a spectrum held in memory to gVXR bin by bin, in place of json2gvxr.initSpectrum.
+
+    Counts are passed per cm^2 at 1 m, as json2gvxr does for a Beam TextFile, so a spectrum gives the same
+    projections whether it comes from memory or from its text file. Bins with no photons are skipped. A filter
+    declared in the JSON Beam is still applied by gVXR on top.
+    Returns the number of bins loaded.
+    """
+    e_mev, counts = spectrumArrays(spectrum)
+    gvxr.resetBeamSpectrum()
+    loaded = 0
+    for energy, count in zip(e_mev * 1000.0, counts):
+        if count > 0:
+            gvxr.addEnergyBinToSpectrumPerCm2At1m(float(energy), "keV", float(count))
+            loaded += 1
+    if loaded == 0:
+        raise ValueError("spectrum has no energy bin with photons")
+
+    filters = json2gvxr.getFiltration()
+    if filters:
+        json2gvxr.applyFiltration(filters)
+    return loaded
+
+
+def spectrumMetadata(spectrum) -> dict:
+    e_mev, counts = spectrumArrays(spectrum)
+    return {"energy_mev": e_mev.tolist(), "counts": counts.tolist(),
+            "source": getattr(spectrum, "source", None) or "memory"}
+
+
+def initScene(spectrum=None):
+    """Set up source, spectrum, detector, samples and noise from the JSON loaded by json2gvxr.initGVXR.
+
+    spectrum (Spectrum or (E_mev, counts)) replaces the JSON Beam spectrum without going through a file.
+    """
+    json2gvxr.initSourceGeometry()
+    if spectrum is None:
+        json2gvxr.initSpectrum(verbose=0)
+        print(f"[INFO] Spectrum: {json2gvxr.params['Source']['Beam']['TextFile']} "
+              f"in {json2gvxr.params['Source']['Beam']['Unit']}")
+    else:
+        n_bins = loadBeamSpectrum(spectrum)
+        print(f"[INFO] Spectrum: {n_bins} energy bins from memory")
+
+    json2gvxr.initDetector()
+    json2gvxr.initSamples()
+    gvxr.moveToCentre()
+
+    gvxr.usePoissonNoise()
+    print("[INFO] Poisson noise enabled")
+
+
+class SceneReloader:
+    """One gVXR context reused for many parameter sets (e.g. the points of a Sweep).
+
+    load() installs a parameter dict as json2gvxr.params and re-initialises only the parts that differ from the
+    previously loaded set: source geometry and spectrum, detector, samples. A density change therefore reloads
+    the samples only, and a new projection count reloads nothing (IncrementalAcquisition reads Scan directly).
+    """
+    """复用同一个 gVXR 上下文加载多组参数，只重新初始化发生变化的部分（源/能谱、探测器、样品）。"""
+
+    def __init__(self, JSONFileName: str):
+        self.JSONFileName = JSONFileName
+        # 只在这里读一次 JSON 并创建窗口/上下文
+        json2gvxr.initGVXR(JSONFileName)
+        self.params = json2gvxr.params
+        self.reloads = {"source": 0, "spectrum": 0, "detector": 0, "samples": 0}
+        self._loaded = None
+
+    def load(self, params: dict, spectrum=None):
+        """Make params (same layout as the JSON; relative paths resolve against JSONFileName) the current scene.
+
+        spectrum (Spectrum or (E_mev, counts)) replaces the Beam spectrum, as in initScene.
+        """
+        if spectrum is None:
+            spectrum_key = None
+        else:
+            digest = hashlib.blake2b(digest_size=16)
+            for array in spectrumArrays(spectrum):
+                digest.update(array.tobytes())
+            spectrum_key = digest.hexdigest()
+        sections = tuple(json.dumps(params.get(name), sort_keys=True) for name in ("Source", "Detector", "Samples"))
+        previous = self._loaded or (None, None, None, None)
+
+        json2gvxr.params = params
+        self.params = params
+        if sections[0] != previous[0]:
+            json2gvxr.initSourceGeometry()
+            self.reloads["source"] += 1
+        if sections[0] != previous[0] or spectrum_key != previous[3]:
+            if spectrum is None:
+                json2gvxr.initSpectrum(verbose=0)
+            else:
+                loadBeamSpectrum(spectrum)
+            self.reloads["spectrum"] += 1
+        if sections[1] != previous[1]:
+            json2gvxr.initDetector()
+            self.reloads["detector"] += 1
+        if sections[2] != previous[2]:
+            json2gvxr.initSamples()
+            gvxr.moveToCentre()
+            self.reloads["samples"] += 1
+        if self._loaded is None:
+            gvxr.usePoissonNoise()
+        self._loaded = sections + (spectrum_key,)
+
+
+def acquisitionMetadata(JSONFileName: str, spectrum=None) -> dict:
+    """Header of a projection stack: the JSON, its parameters and, when given in memory, the spectrum used."""
+    metadata = {"json": JSONFileName, "params": json2gvxr.params}
+    if spectrum is not None:
+        metadata["spectrum"] = spectrumMetadata(spectrum)
+    return metadata
+
+
+def acquisitionAngles(numProj: int, final_angle: float, include_final: bool, first_angle: float = 0.0):
+    """Projection angles [deg] as computeCTAcquisition spaces them."""
+    if include_final and numProj > 1:
+        return np.linspace(first_angle, final_angle, numProj)
+    return first_angle + np.arange(numProj) * (final_angle - first_angle) / max(numProj, 1)
+
+
 @debuggable_print(debug=True)
-def GVXRCalculate(JSONFileName: str = "wwz/mytest2.json", saveFlag: bool = False):
+def GVXRCalculate(JSONFileName: str = "wwz/mytest2.json", saveFlag: bool = False, keepProjections: bool = True,
+                  stackFile: str = None, profileMemory: bool = False, pyramid: bool = False, spectrum=None,
+                  cache=False):
+    """Run the CT acquisition described by JSONFileName.
+
+    With saveFlag the projections are streamed to TIFF files as they are converted; with keepProjections=False
+    they are not also collected into one in-memory array (projection_set is then returned as None).
+    With stackFile the projections are written into one memory-mapped BigTIFF stack (see ProjectionStack) that
+    also records the angles and the JSON parameters, and projection_set is the disk-backed array instead.
+    Time and peak RSS per stage are printed at the end; profileMemory adds the tracemalloc heap peak per stage.
+    With pyramid a 2x/4x/8x PreviewPyramid (next to stackFile when given) is built on a background thread as the
+    projections are converted, and returned as a third item: (projection_set, angle_set, pyramid).
+    spectrum (a Spectrum, or (E_mev, counts) such as a filtered counts_out on its grid) is used instead of the
+    JSON Beam spectrum and handed to gVXR in memory, with no text file written or parsed.
+    With cache (True or a ResultCache) a configuration whose JSON, referenced files and spectrum are identical
+    to an earlier run returns that run's projection stack, memory-mapped from the cache, without simulating; the
+    Poisson noise realisation is then the cached one too. saveFlag runs always simulate. A run that misses is
+    stored and then returned the same way, read-only mapped; without stackFile, keepProjections=False still
+    returns projection_set as None. With stackFile a hit copies the cached stack and its pyramid sidecars there
+    and maps that file, so stackFile exists after every run.
+    """
     start_time = time.time()
+    profiler = StageProfiler(trace_memory=profileMemory)
     print(f"[RUNNING] __file__ = {__file__}")
 
+    # --- 结果缓存：JSON、引用的文件和内存能谱都相同则直接映射上次的投影堆栈 ---
+    result_cache, cache_key = None, None
+    #  借用缓存条目作为 stackFile 时，仍按调用者的 keepProjections 决定是否返回投影
+    return_projections = keepProjections or stackFile is not None
+    own_stack = stackFile is None
+    if cache and not saveFlag:
+        try:
+            cache_key = configurationKey(JSONFileName, None if spectrum is None else spectrumMetadata(spectrum),
+                                         extra={"engine": "gvxr", "version": gvxr.getVersionOfCoreGVXR()})
+            result_cache = cache if isinstance(cache, ResultCache) else ResultCache()
+        except Exception as e:
+            print("[WARNING] Result cache disabled:", e)
+        if result_cache is not None:
+            # 调用者指定了 stackFile 时把缓存条目（连同预览金字塔）复制过去，返回该文件的只读映射
+            cached = result_cache.load(cache_key, pyramid) if stackFile is None else \
+                result_cache.loadInto(cache_key, stackFile, pyramid)
+            if cached is not None:
+                print(f"[INFO] Projections from cache {result_cache.entryFile(cache_key)} "
+                      f"in {time.time() - start_time:.3f} seconds.")
+                return _cachedResult(cached, return_projections)
+            if own_stack:
+                # 直接写进缓存条目，省去一次复制
+                stackFile = result_cache.entryFile(cache_key)
+
     # --- 载入 JSON 并初始化场景 ---
     try:
         json2gvxr.initGVXR(JSONFileName)
@@ -71,17 +283,8 @@ def GVXRCalculate(JSONFileName: str = "wwz/mytest2.json", saveFlag: bool = False
         os.makedirs(projection_path, exist_ok=True)
 
     # --- 初始化源/谱、探测器、样品、噪声 ---
-    json2gvxr.initSourceGeometry()
-    json2gvxr.initSpectrum(verbose=0)
-    print(f"[INFO] Spectrum: {json2gvxr.params['Source']['Beam']['TextFile']} "
-          f"in {json2gvxr.params['Source']['Beam']['Unit']}")
-
-    json2gvxr.initDetector()
-    json2gvxr.initSamples()
-    gvxr.moveToCentre()
-
-    gvxr.usePoissonNoise()
-    print("[INFO] Poisson noise enabled")
+    with profiler.stage("initialise scene"):
+        initScene(spectrum)
 
     # --- 用 computeCTAcquisition 计算整套投影（v2.0.10 接口逐分量传参） ---
     first_angle = 0.0
@@ -98,6 +301,7 @@ def GVXRCalculate(JSONFileName: str = "wwz/mytest2.json", saveFlag: bool = False
     print("[INFO] Starting CT acquisition (this may take a moment)...")
 
     # 让 gVXR 只在内存里生成投影（不自动落盘）
+    profiler.begin("CT acquisition")
     gvxr.computeCTAcquisition(
         "",  # 1. projectionOutputPath
         "",  # 2. screenshotOutputPath
@@ -112,46 +316,250 @@ def GVXRCalculate(JSONFileName: str = "wwz/mytest2.json", saveFlag: bool = False
         bool(integrate_energy),  # 15. integrateEnergyFlag
         int(verbose)  # 16. verbose
     )
+    profiler.end()
 
     print(f"[INFO] CT acquisition complete. Use time: {time.time() - start_time:.2f} seconds.")
 
     # 取回投影与角度（方便你校验是否包含末角）
     angle_set = list(gvxr.getAngleSetCT())
 
-    projection_set = np.array(gvxr.getLastProjectionSet(), dtype=np.float32)
+    # gVXR 以嵌套序列返回整套投影；之后逐张直接转换进预分配的 float32 数组，转换完即释放该张的嵌套列表
+    with profiler.stage("fetch projection set"):
+        raw_projections = gvxr.getLastProjectionSet()
+    release = isinstance(raw_projections, list)
 
     print(f"[INFO] Angles ({len(angle_set)}): {angle_set[:10]}{' ...' if len(angle_set) > 10 else ''}")
 
+    # 逐张转换；保存时每张转换完立即交给写盘线程池，不等整套数据
+    projection_set = None
+    stack = None
+    writer = None
+    builder = None
     if saveFlag:
-        try:
-            # --- 保存 .tif ---
-            print(f"[INFO] Saving {len(projection_set)} projections to: {projection_path}")
-            for i, proj in enumerate(tqdm(projection_set, desc="Saving projections")):
-                name = os.path.join(projection_path, f"projection-{i:04d}.tif")
-                imwrite(name, proj)
+        print(f"[INFO] Saving {len(raw_projections)} projections to: {projection_path}")
+        writer = StreamingTifWriter(projection_path)
+    profiler.begin("convert + save" if saveFlag else "convert")
+    converted = False
+    try:
+        n_projections = len(raw_projections)
+        for i in tqdm(range(n_projections), desc="Saving projections" if saveFlag else "Converting"):
+            raw = raw_projections[i]
+            destination = stack.projections if stack is not None else projection_set
+            if destination is not None:
+                proj = projectionToArray(raw, destination[i])
+            else:
+                proj = projectionToArray(raw)
+                if stackFile:
+                    stack = ProjectionStack.create(stackFile, n_projections, proj.shape, angles=angle_set,
+                                                   metadata=acquisitionMetadata(JSONFileName, spectrum))
+                    print(f"[INFO] Writing projection stack: {stackFile}")
+                    stack[i] = proj
+                elif keepProjections:
+                    projection_set = np.empty((n_projections,) + proj.shape, dtype=np.float32)
+                    projection_set[i] = proj
+                if pyramid and builder is None:
+                    builder = PyramidBuilder(PreviewPyramid.create(n_projections, proj.shape, stack_file=stackFile))
+            if release:
+                raw_projections[i] = None
+            del raw
+            if writer is not None:
+                writer.write(i, proj)
+            if builder is not None:
+                builder.submit(i, proj)
+        if writer is not None:
+            writer.close()
             print("[INFO] All projections saved. Done.")
-        except Exception as e:
-            print("Error saving projections:", e)
-
+        converted = True
+    except Exception as e:
+        print("Error saving projections:", e)
+    finally:
+        if writer is not None:
+            writer.close(raise_error=False)
+        if builder is not None:
+            builder.close(raise_error=False)
+        if stack is not None:
+            stack.flush()
+            projection_set = stack.projections
+        del raw_projections
+        profiler.end()
+
+    cached = None
+    if result_cache is not None and converted and stack is not None:
+        with profiler.stage("store in cache"):
+            result_cache.store(cache_key, stackFile, {"json": os.path.abspath(JSONFileName)})
+            # 与命中时返回同一种结果：只读映射，不把可写的映射交出去
+            if own_stack:
+                cached = result_cache.load(cache_key, pyramid)
+            else:
+                try:
+                    cached = openResult(stackFile, pyramid)
+                except (OSError, ValueError) as e:
+                    print("[WARNING] Cannot reopen projection stack read-only:", e)
+
+    print("[INFO] Stage timing / memory:\n" + profiler.report())
     end_time = time.time()
     elapsed_time = end_time - start_time
     print(f"[INFO] Total execution time: {elapsed_time:.2f} seconds.")
 
+    if cached is not None:
+        stack.close()
+        return _cachedResult(cached, return_projections)
+    if pyramid:
+        return projection_set, angle_set, builder.pyramid if builder is not None else None
     return projection_set, angle_set
 
 
+def _cachedResult(cached: tuple, keep_projections: bool) -> tuple:
+    """ResultCache.load result with projection_set dropped when the caller asked not to keep projections."""
+    if keep_projections:
+        return cached
+    return (None,) + tuple(cached[1:])
+
+
+class IncrementalAcquisition:
+    """CT scan rendered one angle at a time, as an alternative to the blocking computeCTAcquisition.
+
+    The scene is rotated about the z axis through the centre (like computeCTAcquisition after moveToCentre)
+    and each projection is rendered with computeXRayImage, so it is available as soon as it exists. Iterate for
+    (index, angle, projection) or call run(); cancel() (from any thread) stops after the current projection.
+    The scene transformation is restored when the scan ends or is abandoned.
+    """
+    """逐角度增量采集：每算完一张投影立即交出，支持进度、剩余时间估计和中途取消。"""
+
+    def __init__(self, JSONFileName: str, spectrum=None, initialise: bool = True):
+        self.JSONFileName = JSONFileName
+        self.spectrum = spectrum
+        self._cancel = threading.Event()
+        # initialise=False: 场景已由调用方（如 SceneReloader）在当前上下文中加载好
+        if initialise:
+            json2gvxr.initGVXR(JSONFileName)
+            initScene(spectrum)
+        scan = json2gvxr.params["Scan"]
+        self.angles = acquisitionAngles(int(scan["NumberOfProjections"]), float(scan["FinalAngle"]),
+                                        bool(scan["IncludeFinalAngle"]))
+
+    def __len__(self):
+        return len(self.angles)
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def rotations(self):
+        """Rotate the scene to each angle in turn, yielding (index, angle) while it is there."""
+        matrix = gvxr.getSceneTransformationMatrix()
+        try:
+            current = 0.0
+            for index, angle in enumerate(self.angles):
+                if self._cancel.is_set():
+                    return
+                gvxr.rotateScene(float(angle - current), 0.0, 0.0, 1.0)
+                current = angle
+                yield index, float(angle)
+        finally:
+            gvxr.setSceneTransformationMatrix(matrix)
+
+    def __iter__(self):
+        for index, angle in self.rotations():
+            yield index, angle, projectionToArray(gvxr.computeXRayImage())
+
+    def run(self, callback=None, stackFile: str = None, pyramid: bool = False):
+        """Render every angle, collecting the projections; returns like GVXRCalculate.
+
+        callback(index, angle, projection, done, total, eta_seconds) is called for every projection, with
+        projection a view into the returned projection_set, so holding on to it costs no memory. After
+        cancel() only the projections done so far are returned (a stackFile keeps its full size on disk, with
+        the missing projections left zero).
+        """
+        total = len(self)
+        projection_set = None
+        stack = None
+        builder = None
+        done = 0
+        start = time.perf_counter()
+        try:
+            for index, angle, projection in self:
+                if projection_set is None:
+                    if stackFile:
+                        stack = ProjectionStack.create(stackFile, total, projection.shape, angles=self.angles,
+                                                       metadata=acquisitionMetadata(self.JSONFileName,
+                                                                                    self.spectrum))
+                        projection_set = stack.projections
+                    else:
+                        projection_set = np.empty((total,) + projection.shape, dtype=np.float32)
+                    if pyramid:
+                        builder = PyramidBuilder(PreviewPyramid.create(total, projection.shape))
+                projection_set[index] = projection
+                # 回调拿到的是堆栈里的视图而不是单独的数组，界面保留它不会再占一份内存
+                projection = projection_set[index]
+                if builder is not None:
+                    builder.submit(index, projection)
+                done = index + 1
+                if callback is not None:
+                    elapsed = time.perf_counter() - start
+                    callback(index, angle, projection, done, total, elapsed / done * (total - done))
+        finally:
+            if builder is not None:
+                builder.close(raise_error=False)
+            if stack is not None:
+                stack.flush()
+
+        if self.cancelled:
+            print(f"[INFO] Acquisition cancelled after {done}/{total} projections.")
+        if projection_set is not None:
+            projection_set = projection_set[:done]
+        angle_set = [float(angle) for angle in self.angles[:done]]
+        if pyramid:
+            return projection_set, angle_set, builder.pyramid if builder is not None else None
+        return projection_set, angle_set
+
+
+def computePathLengthMaps(JSONFileName: str, file_name: str = None):
+    """PathLengthMaps of every scan angle from gVXR's L-buffer (lengths in gVXR's internal unit, mm).
+
+    Same result as PathLengthMaps.compute with the CPU projector, but rendered on the GPU.
+    """
+    try:
+        from .CPUProjector import Scene
+        from .PathLengthMaps import PathLengthMaps, sceneMetadata
+    except ImportError:
+        from CPUProjector import Scene
+        from PathLengthMaps import PathLengthMaps, sceneMetadata
+
+    scene = Scene(JSONFileName)
+    metadata = sceneMetadata(scene)
+    labels = [sample["label"] for sample in metadata["samples"]]
+    acquisition = IncrementalAcquisition(JSONFileName)
+    maps = None
+    for index, angle in tqdm(acquisition.rotations(), total=len(acquisition), desc="Path lengths"):
+        for s, label in enumerate(labels):
+            lengths = projectionToArray(gvxr.computeLBuffer(label))
+            if maps is None:
+                shape = (len(acquisition) * len(labels),) + lengths.shape
+                if file_name is None:
+                    maps = PathLengthMaps(np.empty(shape, dtype=np.float32), metadata)
+                else:
+                    maps = PathLengthMaps(ProjectionStack.create(file_name, shape[0], shape[1:],
+                                                                 metadata=metadata).projections,
+                                          metadata, file_name)
+            maps.lengths[index * len(labels) + s] = lengths
+    if maps is not None:
+        maps.flush()
+    return maps
+
+
 @debuggable_print(debug=True)
 def saveTif(projection_set, output_path):
     # --- 保存 .tif ---
     try:
-        os.makedirs(output_path, exist_ok=True)
         print(f"[INFO] Saving {len(projection_set)} projections to: {output_path}")
 
-        for i, proj in enumerate(tqdm(projection_set, desc="Saving projections")):
-
-            name = os.path.join(output_path, f"projection-{i:04d}.tif")
-            print(name)
-            imwrite(name, proj)
+        with StreamingTifWriter(output_path) as writer:
+            for i, proj in enumerate(tqdm(projection_set, desc="Saving projections")):
+                writer.write(i, proj)
 
         print("[INFO] All projections saved. Done.")
     except Exception as e:
@@ -159,10 +567,8 @@ def saveTif(projection_set, output_path):
 
 
 def getTif(projection_set):
-    tifList = []
-    for i, proj in enumerate(tqdm(projection_set, desc="Saving projections")):
-        tifList.append(proj)
-    return tifList
+    # 只收集每张投影的视图，不复制数据；内存映射的堆栈仍按需从磁盘读取
+    return list(projection_set)
 
 
 if __name__ == "__main__":
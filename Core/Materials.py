@@ -1,8 +1,18 @@
-import pandas as pd
+import numpy as np
+
+try:
+    from .ElementDatabase import getElementDatabase, elementFileNumber, elementCsvPath
+    from .Interpolation import MU_INTERP_CACHE
+    from .Compounds import massFractions, mixtureTable, compositionKey
+except ImportError:
+    from ElementDatabase import getElementDatabase, elementFileNumber, elementCsvPath
+    from Interpolation import MU_INTERP_CACHE
+    from Compounds import massFractions, mixtureTable, compositionKey
 
 
 class Material:
-    def __init__(self, material: str, thickness: float, density: float, tungsten_file: str = None):
+    def __init__(self, material: str, thickness: float, density: float, tungsten_file: str = None,
+                 composition=None, kind: str = 'compound'):
 
         self.material = material  # 材料类型
 
@@ -18,16 +28,88 @@ class Material:
         self.mass_attenuation_coefficients = None
         self.coherent_corrected_MAC = None
 
+        #  衰减表的身份标识，作为插值器缓存的键；None 时按表内容计算
+        self.table_key = None
+
+        #  元素组成 {Z: 质量分数}；来自任意外部衰减文件时为 None
+        self.composition = None
+
         self.MaterialInit(tungsten_file)
+        if composition is not None:
+            self.MaterialInitComposition(composition, kind)
 
     def __str__(self):
         return f"{self.material} ({self.thickness}mm)"
 
+    @classmethod
+    def fromElement(cls, symbol: str, thickness: float, density: float = None):
+        """Build a pure-element material from the element database; density defaults to symbol_key.json."""
+        database = getElementDatabase()
+        if density is None:
+            density = database.density(symbol)
+        return cls(symbol, thickness, density, elementCsvPath(database.atomicNumber(symbol)))
+
+    @classmethod
+    def fromFormula(cls, formula: str, thickness: float, density: float):
+        """Compound from a chemical formula with atom counts, e.g. 'H2O', 'SiO2', 'Ca10(PO4)6(OH)2'."""
+        return cls(formula, thickness, density, composition=formula, kind='compound')
+
+    @classmethod
+    def fromMixture(cls, mixture, thickness: float, density: float, name: str = None):
+        """Mixture from mass proportions: gVXR-style 'Ti90Al6V4' or a dict {symbol: mass fraction}."""
+        if name is None:
+            name = mixture if isinstance(mixture, str) else "".join(f"{k}{v:g}" for k, v in mixture.items())
+        return cls(name, thickness, density, composition=mixture, kind='mixture')
+
+    @classmethod
+    def fromGVXR(cls, material: list, thickness: float, density: float = None):
+        """Material from a gVXR JSON material entry: ["element", "W"], ["compound", "H2O"], ["mixture", "Ti90Al6V4"]."""
+        kind, name = str(material[0]).lower(), material[1]
+        if kind == 'element':
+            return cls.fromElement(name, thickness, density)
+        if density is None:
+            raise ValueError(f"A density is required for {kind} {name}")
+        if kind == 'compound':
+            return cls.fromFormula(name, thickness, density)
+        if kind == 'mixture':
+            return cls.fromMixture(name, thickness, density)
+        raise ValueError(f"Unknown gVXR material type {material[0]!r}")
+
+    def muInterp(self, kind: str = 'loglog'):
+        """Return the shared, cached mu(E) [cm^-1] callable (E in MeV) for this table and density."""
+        return MU_INTERP_CACHE.muInterp(self.energy, self.mass_attenuation_coefficients, self.tungsten_density,
+                                        kind=kind, table_key=self.table_key)
+
+    def MaterialInitComposition(self, composition, kind: str = 'compound'):
+        """Build mu/rho from the element tables for a formula or mass-fraction mixture (see Compounds.massFractions)."""
+        try:
+            fractions = massFractions(composition, kind)
+            self.tungsten_data = mixtureTable(fractions)
+            self.energy = self.tungsten_data[:, 0]
+            self.mass_attenuation_coefficients = self.tungsten_data[:, 1]
+            self.coherent_corrected_MAC = self.tungsten_data[:, 2]
+            self.composition = fractions
+            self.table_key = ('mixture', compositionKey(fractions))
+        except Exception as e:
+            print("Error building material composition:", e)
+
     def MaterialInit(self, tungsten_file: str):
         try:
             if tungsten_file is None:
                 return
 
+            # Core/element 下的元素表直接从打包好的二进制库读取（内存映射，不经过pandas）
+            atomic_number = elementFileNumber(tungsten_file)
+            if atomic_number is not None:
+                self.tungsten_data = getElementDatabase().table(atomic_number)
+                self.energy = self.tungsten_data[:, 0]
+                self.mass_attenuation_coefficients = self.tungsten_data[:, 1]
+                self.coherent_corrected_MAC = self.tungsten_data[:, 2]
+                self.table_key = ('element', atomic_number)
+                self.composition = {atomic_number: 1.0}
+                return
+
+            import pandas as pd
             if tungsten_file.endswith('.csv'):
                 self.tungsten_data = pd.read_csv(tungsten_file)
             elif tungsten_file.endswith(('.xlsx', '.xls')):
@@ -56,14 +138,25 @@ class MaterialStack:
     def __init__(self, material_stack: list = None):
         self.material_stack = material_stack
 
+        #  当前能量网格 (MeV) 上的总光学厚度 Σ mu_i·t_i，以及每层的 mu_i(E) [cm^-1]
+        #  增删层或改厚度时只加减该层的一项，不再对 N 层逐一求 exp
+        self._energy_grid = None
+        self._optical_depth = None
+        self._layer_mu = []
+        #  每层贡献项对应的 (material, thickness, density)，用于发现绕过接口的直接修改
+        self._layer_state = []
+
     def __str__(self):
         msg = ""
-        for i, material in enumerate(self.material_stack):
+        for i, material in enumerate(self.material_stack or []):
             msg += f"{i+1}: {material}\n"
         return msg
 
     def __iter__(self):
-        return iter(self.material_stack)
+        return iter(self.material_stack or [])
+
+    def __len__(self):
+        return len(self.material_stack or [])
 
     def insertMaterial(self, location: int, material: Material):
         if self.material_stack is None:
@@ -72,6 +165,13 @@ class MaterialStack:
             print("Invalid location. Please enter a valid index.")
             return
         self.material_stack.insert(location, material)
+        if self._energy_grid is not None and len(self._layer_mu) != len(self.material_stack) - 1:
+            self._energy_grid = None  # 缓存已与列表脱节，下次计算时整体重建
+        elif self._energy_grid is not None:
+            mu = material.muInterp()(self._energy_grid)
+            self._layer_mu.insert(location, mu)
+            self._layer_state.insert(location, self._layerState(material))
+            self._optical_depth += mu * self._thicknessCm(material)
 
     def removeMaterial(self, location: int):
         if self.material_stack is None:
@@ -81,12 +181,85 @@ class MaterialStack:
             print("Invalid location. Please enter a valid index.")
             return
         removed_material = self.material_stack.pop(location)
+        if self._energy_grid is not None:
+            if len(self._layer_mu) != len(self.material_stack) + 1:
+                self._energy_grid = None  # 缓存已与列表脱节，下次计算时整体重建
+            else:
+                mu = self._layer_mu.pop(location)
+                _, thickness, _ = self._layer_state.pop(location)
+                if self.material_stack:
+                    self._optical_depth -= mu * (thickness or 0.0) / 10.0
+                else:
+                    self._optical_depth[:] = 0.0  # 清空时归零，顺便消除累积的舍入误差
         return removed_material
 
     def appendMaterial(self, material: Material):
         if self.material_stack is None:
             self.material_stack = []
-        self.material_stack.append(material)
+        self.insertMaterial(len(self.material_stack), material)
+
+    def setThickness(self, location: int, thickness: float):
+        """Change one layer's thickness [mm], updating the cached optical depth by that layer's term only."""
+        if self.material_stack is None or location < 0 or location >= len(self.material_stack):
+            print("Invalid location. Please enter a valid index.")
+            return
+        material = self.material_stack[location]
+        material.thickness = thickness
+        if self._energy_grid is not None and location < len(self._layer_state) \
+                and self._layer_state[location][0] is material:
+            _, old_thickness, density = self._layer_state[location]
+            self._optical_depth += self._layer_mu[location] * ((thickness or 0.0) - (old_thickness or 0.0)) / 10.0
+            self._layer_state[location] = (material, thickness, density)
+
+    def opticalDepth(self, e_mev) -> np.ndarray:
+        """Return the total optical depth Σ mu_i(E)·t_i on the energy grid e_mev [MeV]."""
+        self._sync(e_mev)
+        return self._optical_depth.copy()
+
+    def transmission(self, e_mev) -> np.ndarray:
+        """Return the stack transmission T(E) = exp(-Σ mu_i(E)·t_i) with a single exp."""
+        self._sync(e_mev)
+        return np.exp(-self._optical_depth)
+
+    @staticmethod
+    def _thicknessCm(material: Material) -> float:
+        return (material.thickness or 0.0) / 10.0
+
+    @staticmethod
+    def _layerState(material: Material):
+        return material, material.thickness, material.tungsten_density
+
+    def _rebuild(self, e_mev):
+        grid = np.array(e_mev, dtype=float)
+        self._energy_grid = grid
+        self._layer_mu = [material.muInterp()(grid) for material in self]
+        self._layer_state = [self._layerState(material) for material in self]
+        self._optical_depth = np.zeros_like(grid)
+        for material, mu in zip(self, self._layer_mu):
+            self._optical_depth += mu * self._thicknessCm(material)
+
+    def _sync(self, e_mev):
+        """Bring the cache onto grid e_mev and in line with the list, touching only layers that changed."""
+        grid = self._energy_grid
+        if grid is None or (e_mev is not grid and not np.array_equal(e_mev, grid)):
+            self._rebuild(e_mev)
+            return
+
+        layers = list(self)
+        if len(layers) != len(self._layer_state) or \
+                any(material is not state[0] for material, state in zip(layers, self._layer_state)):
+            self._rebuild(e_mev)
+            return
+
+        for i, material in enumerate(layers):
+            _, thickness, density = self._layer_state[i]
+            if material.tungsten_density != density:
+                self._optical_depth -= self._layer_mu[i] * (thickness or 0.0) / 10.0
+                self._layer_mu[i] = material.muInterp()(grid)
+                self._optical_depth += self._layer_mu[i] * self._thicknessCm(material)
+            elif material.thickness != thickness:
+                self._optical_depth += self._layer_mu[i] * ((material.thickness or 0.0) - (thickness or 0.0)) / 10.0
+            self._layer_state[i] = self._layerState(material)
 
 
 # cu = Material('Cu', 50, 8.96)
@@ -0,0 +1,174 @@
+import numpy as np
+
+#  BVH 叶节点最多包含的三角形数
+BVH_LEAF_SIZE = 8
+#  一次送入 Möller–Trumbore 求交的 (光线, 三角形) 对数上限，限制临时数组大小
+MAX_PAIRS = 1 << 20
+#  同一光线、同一方向上 t 相差小于此相对值的交点视为同一点（光线穿过共享的边或顶点）
+DUPLICATE_HIT_TOLERANCE = 1e-9
+#  包围盒相对网格尺寸的外扩量
+BOX_PADDING = 1e-7
+#  重心坐标判定的容差：共享边上的交点在两侧三角形中都可能因舍入落在外面，放宽后由去重保证只计一次
+BARYCENTRIC_TOLERANCE = 1e-9
+
+_STL_RECORD = np.dtype([('normal', '<f4', (3,)), ('vertices', '<f4', (3, 3)), ('attribute', '<u2')])
+
+
+def loadSTL(file_name: str) -> np.ndarray:
+    """Triangles of a binary or ASCII STL file as an (n, 3, 3) float64 array of vertex coordinates."""
+    with open(file_name, 'rb') as f:
+        data = f.read()
+    if len(data) >= 84:
+        n = int.from_bytes(data[80:84], 'little')
+        if len(data) == 84 + n * _STL_RECORD.itemsize:
+            records = np.frombuffer(data, dtype=_STL_RECORD, count=n, offset=84)
+            return records['vertices'].astype(float)
+    vertices = [line.split()[1:4] for line in data.decode('ascii', errors='ignore').splitlines()
+                if line.strip().startswith('vertex')]
+    if not vertices or len(vertices) % 3:
+        raise ValueError(f"{file_name} is not a valid STL file")
+    return np.array(vertices, dtype=float).reshape(-1, 3, 3)
+
+
+class BVH:
+    """Bounding-volume hierarchy over the triangles of a closed mesh, traversed for many rays at once.
+
+    Nodes are stored as flat arrays (box corners, children, leaf triangle ranges) so that traversal is
+    breadth-first over (ray, node) pairs: every step tests all live pairs against their boxes in one NumPy
+    expression, expands internal nodes into their children and sends leaf hits to a vectorised
+    Möller–Trumbore test. All rays of a call share one origin (a point source), so the origin-dependent
+    Möller–Trumbore terms are computed once per triangle and each (ray, triangle) pair costs three dot products.
+    """
+    """网格三角形的层次包围盒，按 (光线, 节点) 对做广度优先的向量化遍历。"""
+
+    def __init__(self, triangles, leaf_size: int = BVH_LEAF_SIZE):
+        triangles = np.asarray(triangles, dtype=float)
+        centroids = triangles.mean(axis=1)
+        order = np.arange(len(triangles))
+        lower, upper, children, starts, counts = [], [], [], [], []
+
+        # 中位数划分，沿质心分布最长的轴；用显式栈代替递归
+        pending = [(0, len(triangles), -1, 0)]
+        while pending:
+            start, end, parent, side = pending.pop()
+            node = len(lower)
+            if parent >= 0:
+                children[parent][side] = node
+            segment = order[start:end]
+            corners = triangles[segment].reshape(-1, 3)
+            lower.append(corners.min(axis=0))
+            upper.append(corners.max(axis=0))
+            children.append([-1, -1])
+            if end - start <= leaf_size:
+                starts.append(start)
+                counts.append(end - start)
+                continue
+            starts.append(start)
+            counts.append(0)
+            axis = int(np.argmax(np.ptp(centroids[segment], axis=0)))
+            middle = (end - start) // 2
+            order[start:end] = segment[np.argpartition(centroids[segment, axis], middle)]
+            pending.append((start + middle, end, node, 1))
+            pending.append((start, start + middle, node, 0))
+
+        # 包围盒略微外扩：平面上的三角形（盒厚度为 0）和落在盒边界上的交点在舍入误差下也不会漏掉
+        padding = BOX_PADDING * max(float(np.ptp(triangles.reshape(-1, 3), axis=0).max()), 1.0)
+        self.lower = np.array(lower) - padding
+        self.upper = np.array(upper) + padding
+        self.children = np.array(children, dtype=np.int64)
+        self.starts = np.array(starts, dtype=np.int64)
+        self.counts = np.array(counts, dtype=np.int64)
+        triangles = triangles[order]
+        self.v0 = triangles[:, 0]
+        self.e1 = triangles[:, 1] - triangles[:, 0]
+        self.e2 = triangles[:, 2] - triangles[:, 0]
+        self.normals = np.cross(self.e1, self.e2)
+
+    def __len__(self):
+        return len(self.v0)
+
+    @property
+    def bounds(self):
+        return self.lower[0], self.upper[0]
+
+    def pathLengths(self, origin, directions, t_max=None) -> np.ndarray:
+        """Length inside the mesh of each ray origin + t * direction, 0 < t < t_max (t in units of |direction|).
+
+        Entry and exit crossings are told apart by the triangle orientation and summed as -t and +t, so the
+        result is exact for any closed mesh and any number of crossings. A crossing through an edge or vertex
+        shared by several triangles is counted once.
+        """
+        origin = np.asarray(origin, dtype=float)
+        directions = np.asarray(directions, dtype=float).reshape(-1, 3)
+        n_rays = len(directions)
+        t_max = np.full(n_rays, np.inf) if t_max is None else np.broadcast_to(t_max, (n_rays,))
+        # 分量为 0 时用有限的大数代替 inf，避免 0 * inf 产生 nan
+        inverse = 1.0 / np.where(directions == 0, 1e-300, directions)
+        # 共同原点下 Möller–Trumbore 中只与三角形有关的项: s = o - v0, a = e2 × s, q = s × e1, t 的分子 e2 · q
+        offset = origin - self.v0
+        terms = (np.cross(self.e2, offset), np.cross(offset, self.e1))
+        terms = terms + (np.einsum('ij,ij->i', self.e2, terms[1]),)
+        lower = self.lower - origin
+        upper = self.upper - origin
+        hits = []
+
+        rays = np.arange(n_rays)
+        nodes = np.zeros(n_rays, dtype=np.int64)
+        while len(rays):
+            # 射线-包围盒 (slab) 测试
+            ray_inverse = inverse[rays]
+            t1 = lower[nodes] * ray_inverse
+            t2 = upper[nodes] * ray_inverse
+            near = np.minimum(t1, t2)
+            far = np.maximum(t1, t2, out=t1)
+            # 三个分量逐列比较，比沿长度为 3 的轴做 reduce 快得多
+            t_near = np.maximum(np.maximum(near[:, 0], near[:, 1]), near[:, 2])
+            t_far = np.minimum(np.minimum(far[:, 0], far[:, 1]), far[:, 2])
+            hit = (t_far >= np.maximum(t_near, 0.0)) & (t_near < t_max[rays])
+            rays, nodes = rays[hit], nodes[hit]
+
+            leaf = self.counts[nodes] > 0
+            if leaf.any():
+                hits.extend(self._leafHits(terms, directions, t_max, rays[leaf], nodes[leaf]))
+            rays, nodes = rays[~leaf], nodes[~leaf]
+            rays = np.concatenate([rays, rays])
+            nodes = np.concatenate([self.children[nodes, 0], self.children[nodes, 1]])
+
+        signed_t = np.zeros(n_rays)
+        if hits:
+            hit_rays = np.concatenate([hit[0] for hit in hits])
+            hit_t = np.concatenate([hit[1] for hit in hits])
+            hit_sign = np.concatenate([hit[2] for hit in hits])
+            order = np.lexsort((hit_t, hit_sign, hit_rays))
+            hit_rays, hit_t, hit_sign = hit_rays[order], hit_t[order], hit_sign[order]
+            duplicate = np.zeros(len(order), dtype=bool)
+            duplicate[1:] = (hit_rays[1:] == hit_rays[:-1]) & (hit_sign[1:] == hit_sign[:-1]) \
+                & (hit_t[1:] - hit_t[:-1] <= DUPLICATE_HIT_TOLERANCE * np.maximum(hit_t[1:], 1.0))
+            keep = ~duplicate
+            signed_t = np.bincount(hit_rays[keep], weights=hit_sign[keep] * hit_t[keep], minlength=n_rays)
+
+        # 网格法向朝内时符号整体相反
+        return np.abs(signed_t * np.linalg.norm(directions, axis=1))
+
+    def _leafHits(self, terms, directions, t_max, rays, nodes):
+        """(ray, t, +1 exit / -1 entry) of every crossing between the rays and the triangles of the nodes."""
+        a, q, t_numerator = terms
+        counts = self.counts[nodes]
+        pair_rays = np.repeat(rays, counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        pair_triangles = np.repeat(self.starts[nodes], counts) + offsets
+        for i in range(0, len(pair_rays), MAX_PAIRS):
+            r = pair_rays[i:i + MAX_PAIRS]
+            k = pair_triangles[i:i + MAX_PAIRS]
+            d = directions[r]
+            # det = e1 · (d × e2) = -d · n
+            det = -np.einsum('ij,ij->i', d, self.normals[k])
+            with np.errstate(divide='ignore', invalid='ignore'):
+                inverse_det = 1.0 / det
+                u = np.einsum('ij,ij->i', d, a[k]) * inverse_det
+                v = np.einsum('ij,ij->i', d, q[k]) * inverse_det
+                t = t_numerator[k] * inverse_det
+                valid = (det != 0) & (u >= -BARYCENTRIC_TOLERANCE) & (v >= -BARYCENTRIC_TOLERANCE) \
+                    & (u + v <= 1 + BARYCENTRIC_TOLERANCE) & (t > 0) & (t < t_max[r])
+            # det < 0 表示光线沿三角形法向穿出网格
+            yield r[valid], t[valid], -np.sign(det[valid])
@@ -0,0 +1,155 @@
+import time
+
+import numpy as np
+try:
+    from .BeamHardening import BeamHardeningLUT, spectralWeights
+    from .CPUProjector import CPUProjector, Scene, polychromaticProjection
+    from .DetectorResponse import DetectorResponse
+    from .Materials import Material
+    from .ProjectionStack import ProjectionStack
+    from .Spectrum import Spectrum
+except ImportError:
+    from BeamHardening import BeamHardeningLUT, spectralWeights
+    from CPUProjector import CPUProjector, Scene, polychromaticProjection
+    from DetectorResponse import DetectorResponse
+    from Materials import Material
+    from ProjectionStack import ProjectionStack
+    from Spectrum import Spectrum
+
+#  单样品时查找表的长度上限相对当前投影最大路径长度的余量
+LUT_LENGTH_MARGIN = 1.25
+
+
+class PathLengthMaps:
+    """Per-pixel path length [mm] through every sample at every scan angle, computed once per geometry.
+
+    The maps are the only part of a projection that depends on the geometry, so any spectrum, filter stack,
+    detector response or sample material can be re-simulated from them without ray tracing. lengths has shape
+    (n_angles * n_samples, rows, columns), angle-major; in a file it is a memory-mapped ProjectionStack whose
+    header records the angles, sample labels and materials, and the scene spectrum and energy response.
+    """
+    """按几何只算一次的逐角度、逐样品路径长度图；之后换能谱、滤片、探测器响应只需向量化查表，无需重新光线追踪。"""
+
+    def __init__(self, lengths, metadata: dict, file_name: str = None):
+        self.lengths = lengths
+        self.metadata = metadata
+        self.file_name = file_name
+        self.angles = [float(angle) for angle in metadata["angles"]]
+        self.samples = list(metadata["samples"])
+        self._response = None
+
+    def __len__(self):
+        return len(self.angles)
+
+    @property
+    def shape(self) -> tuple:
+        return tuple(self.lengths.shape[1:])
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        """Path lengths of angle index, shape (n_samples, rows, columns)."""
+        n = len(self.samples)
+        return self.lengths[index * n:(index + 1) * n]
+
+    def flush(self):
+        if isinstance(self.lengths, np.memmap):
+            self.lengths.flush()
+
+    def sceneSpectrum(self) -> Spectrum:
+        spectrum = self.metadata["spectrum"]
+        return Spectrum(spectrum["energy_mev"], spectrum["counts"], source=spectrum.get("source"))
+
+    def sceneResponse(self):
+        """Recorded DetectorResponse, or None; one object per maps so its per-grid cache is reused."""
+        response = self.metadata.get("response")
+        if response is not None and self._response is None:
+            self._response = DetectorResponse.fromTable(response)
+        return self._response
+
+    def materials(self, overrides: dict = None) -> list:
+        """Material of every sample from the recorded gVXR entries; overrides maps label -> Material."""
+        overrides = overrides or {}
+        return [overrides.get(sample["label"]) or Material.fromGVXR(sample["material"], 1.0, sample["density"])
+                for sample in self.samples]
+
+    def simulate(self, spectrum=None, filters=None, response=None, materials: dict = None, indices=None,
+                 callback=None, use_lut: bool = True) -> np.ndarray:
+        """Projections for a spectrum / filter stack / detector response, from the stored maps only.
+
+        spectrum: Spectrum or (E_mev, counts), default the scene spectrum. filters: MaterialStack or list of
+        Materials between source and sample (see XFilter.transmission_of_stack). response: see
+        BeamHardening.spectralWeights; None uses the scene response. materials: {label: Material} to swap sample
+        materials. indices: angles to simulate. With a single sample and use_lut the projections are read off a
+        BeamHardeningLUT instead of summing over energy per pixel.
+        Returns float32 projections (len(indices), rows, columns).
+        """
+        spectrum = self.sceneSpectrum() if spectrum is None else spectrum
+        response = self.sceneResponse() if response is None else response
+        e_mev, weights = spectralWeights(spectrum, filters, response)
+
+        mu = np.stack([material.muInterp()(e_mev) / 10.0 for material in self.materials(materials)])
+        indices = range(len(self)) if indices is None else indices
+        projections = np.empty((len(indices),) + self.shape, dtype=np.float32)
+        lut = None
+        for i, index in enumerate(indices):
+            lengths = self[index]
+            if use_lut and len(mu) == 1:
+                max_length = float(lengths.max())
+                if lut is None or max_length > lut.max_length:
+                    lut = BeamHardeningLUT.fromWeights(e_mev, weights, mu[0],
+                                                       max(max_length * LUT_LENGTH_MARGIN, 1e-3))
+                projections[i] = lut.intensity(lengths[0])
+            else:
+                projections[i] = polychromaticProjection(lengths, mu, weights)
+            if callback is not None:
+                callback(i, self.angles[index], projections[i])
+        return projections
+
+    @classmethod
+    def compute(cls, scene, file_name: str = None, workers: int = None, projector: CPUProjector = None):
+        """Ray-cast the maps of every scan angle of scene (Scene or JSON file) with the CPUProjector."""
+        scene = scene if isinstance(scene, Scene) else Scene(scene)
+        metadata = sceneMetadata(scene)
+        n_samples = len(scene.samples)
+        shape = (len(scene.angles) * n_samples,) + scene.shape
+        if file_name is None:
+            lengths = np.empty(shape, dtype=np.float32)
+        else:
+            lengths = ProjectionStack.create(file_name, shape[0], shape[1:], metadata=metadata).projections
+        maps = cls(lengths, metadata, file_name)
+
+        start_time = time.time()
+        own_projector = projector is None
+        projector = CPUProjector(scene, workers=workers) if own_projector else projector
+        try:
+            for index, angle in enumerate(scene.angles):
+                lengths[index * n_samples:(index + 1) * n_samples] = projector.pathLengths(float(angle))
+                print(f"[INFO] Path lengths {index + 1}/{len(scene.angles)} ({angle:g} deg), "
+                      f"{time.time() - start_time:.1f} s")
+        finally:
+            if own_projector:
+                projector.close()
+            maps.flush()
+        return maps
+
+    @classmethod
+    def open(cls, file_name: str, mode: str = 'r'):
+        stack = ProjectionStack.open(file_name, mode=mode)
+        return cls(stack.projections, stack.metadata, file_name)
+
+
+def sceneMetadata(scene: Scene) -> dict:
+    """What simulate() needs to reproduce the scene besides the maps: angles, samples, spectrum, response."""
+    samples = [{"label": sample["label"], "material": entry["Material"], "density": entry.get("Density")}
+               for sample, entry in zip(scene.samples, scene.params["Samples"])]
+    metadata = {
+        "json": scene.JSONFileName,
+        "angles": [float(angle) for angle in scene.angles],
+        "angle_unit": "deg",
+        "samples": samples,
+        "length_unit": "mm",
+        "spectrum": {"energy_mev": scene.spectrum.energy_mev.tolist(), "counts": scene.spectrum.counts.tolist(),
+                     "source": scene.spectrum.source},
+    }
+    if scene.response is not None:
+        metadata["response"] = [scene.response.e_in.tolist(), scene.response.e_out.tolist()]
+    return metadata
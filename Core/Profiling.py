@@ -0,0 +1,79 @@
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peakRSS():
+    """Peak resident set size of this process so far [bytes], or None where the platform cannot report it."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KiB 为单位，macOS 以字节为单位
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class StageProfiler:
+    """Wall time and memory high-water marks per named stage of a run.
+
+    Every stage records its duration and the process peak RSS when it ended. With trace_memory the Python-heap
+    peak inside the stage is also measured through tracemalloc; that covers the Python floats gVXR builds for
+    nested-list results and the NumPy buffers, but slows allocation-heavy stages down, so it is opt-in.
+    """
+    """按阶段记录耗时与内存峰值（进程峰值 RSS，可选 tracemalloc 统计的 Python 堆峰值）。"""
+
+    def __init__(self, trace_memory: bool = False):
+        self.trace_memory = trace_memory
+        self.stages = []
+        self._current = None
+
+    @contextmanager
+    def stage(self, name: str):
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end()
+
+    def begin(self, name: str):
+        """Start timing stage `name`; stages do not nest, so a running stage is ended first."""
+        if self._current is not None:
+            self.end()
+        started_tracing = False
+        base = 0
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+            base, _ = tracemalloc.get_traced_memory()
+        self._current = (name, time.perf_counter(), base, started_tracing)
+
+    def end(self):
+        if self._current is None:
+            return
+        name, start, base, started_tracing = self._current
+        self._current = None
+        record = {"stage": name, "seconds": time.perf_counter() - start, "peak_rss": peakRSS()}
+        if self.trace_memory:
+            _, peak = tracemalloc.get_traced_memory()
+            record["peak_heap"] = peak - base
+            if started_tracing:
+                tracemalloc.stop()
+        self.stages.append(record)
+
+    def report(self) -> str:
+        lines = []
+        for record in self.stages:
+            line = f"{record['stage']:<24s} {record['seconds']:8.2f} s"
+            if record.get("peak_heap") is not None:
+                line += f"   heap peak {record['peak_heap'] / 2 ** 20:9.1f} MiB"
+            if record["peak_rss"] is not None:
+                line += f"   RSS high-water {record['peak_rss'] / 2 ** 20:9.1f} MiB"
+            lines.append(line)
+        return "\n".join(lines)
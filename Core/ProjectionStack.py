@@ -0,0 +1,81 @@
+import os
+
+import numpy as np
+import tifffile
+
+
+class ProjectionStack:
+    """A projection set stored as one memory-mapped, uncompressed multi-page BigTIFF.
+
+    Each projection is one page, so the file also opens in ImageJ/Fiji. The projection angles [deg] and any
+    extra scan metadata (e.g. the gVXR JSON parameters) are kept as JSON in the TIFF header. Opening a stack
+    only maps the file; a projection is read from disk when it is first indexed.
+    """
+    """单文件内存映射投影堆栈（多页 BigTIFF），角度等元数据存放在文件头中，按需分页读取。"""
+
+    def __init__(self, file_name: str, projections: np.memmap, metadata: dict):
+        self.file_name = file_name
+        self.projections = projections
+        self.metadata = metadata
+
+    def __len__(self):
+        return len(self.projections)
+
+    def __getitem__(self, index):
+        return self.projections[index]
+
+    def __setitem__(self, index, projection):
+        self.projections[index] = projection
+
+    def __iter__(self):
+        return iter(self.projections)
+
+    @property
+    def shape(self):
+        return self.projections.shape
+
+    @property
+    def angles(self) -> list:
+        return list(self.metadata.get("angles", []))
+
+    def flush(self):
+        if isinstance(self.projections, np.memmap):
+            self.projections.flush()
+
+    def close(self):
+        self.flush()
+        self.projections = None
+
+    @classmethod
+    def create(cls, file_name: str, n_projections: int, projection_shape, angles=None, metadata: dict = None,
+               dtype=np.float32):
+        """Create a writable stack of n_projections x projection_shape, preallocated on disk."""
+        folder = os.path.dirname(os.path.abspath(file_name))
+        os.makedirs(folder, exist_ok=True)
+        header = dict(metadata or {})
+        if angles is not None:
+            header["angles"] = [float(angle) for angle in angles]
+        header.setdefault("angle_unit", "deg")
+        projections = tifffile.memmap(file_name, shape=(int(n_projections),) + tuple(projection_shape),
+                                      dtype=dtype, metadata=header, bigtiff=True)
+        return cls(file_name, projections, header)
+
+    @classmethod
+    def open(cls, file_name: str, mode: str = 'r'):
+        """Map an existing stack; mode 'r' (read-only) or 'r+' (read/write)."""
+        with tifffile.TiffFile(file_name) as tif:
+            shaped = tif.shaped_metadata
+            metadata = dict(shaped[0]) if shaped else {}
+        metadata.pop("shape", None)
+        projections = tifffile.memmap(file_name, mode=mode)
+        if projections.ndim == 2:
+            projections = projections[np.newaxis]
+        return cls(file_name, projections, metadata)
+
+
+def isProjectionStackFile(file_name: str) -> bool:
+    return file_name.lower().endswith(('.tif', '.tiff'))
+
+
+def openProjectionStack(file_name: str) -> ProjectionStack:
+    return ProjectionStack.open(file_name, mode='r')
@@ -0,0 +1,75 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from tifffile import imwrite
+
+
+class StreamingTifWriter:
+    """Write projections to <output_path>/projection-XXXX.tif as they arrive, from a bounded thread pool.
+
+    write() returns as soon as the projection is queued; once max_pending projections are waiting or being
+    written it blocks until one finishes (backpressure), so memory stays at about max_pending projections
+    however long the scan is. The first write error is re-raised by the next write() or by close().
+    """
+    """投影到达即写盘的 TIFF 写入器：有界线程池 + 背压，内存只保留少量待写投影。"""
+
+    def __init__(self, output_path: str, max_workers: int = 4, max_pending: int = 8,
+                 name_format: str = "projection-{:04d}.tif"):
+        os.makedirs(output_path, exist_ok=True)
+        self.output_path = output_path
+        self.name_format = name_format
+        self.written = 0
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tif-writer")
+        self._slots = threading.BoundedSemaphore(max(max_pending, max_workers))
+        self._lock = threading.Lock()
+        self._error = None
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(raise_error=exc_type is None)
+
+    def write(self, index: int, projection):
+        """Queue one projection (any array-like convertible to float32) for writing."""
+        self._raiseError()
+        if self._closed:
+            raise RuntimeError("StreamingTifWriter is closed")
+        projection = np.asarray(projection, dtype=np.float32)
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(self._write, index, projection)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(self._release)
+
+    def close(self, raise_error: bool = True):
+        """Wait for all queued projections to be written."""
+        if not self._closed:
+            self._closed = True
+            self._executor.shutdown(wait=True)
+        if raise_error:
+            self._raiseError()
+
+    def _write(self, index: int, projection: np.ndarray):
+        imwrite(os.path.join(self.output_path, self.name_format.format(index)), projection)
+        with self._lock:
+            self.written += 1
+
+    def _release(self, future):
+        self._slots.release()
+        error = future.exception()
+        if error is not None:
+            with self._lock:
+                if self._error is None:
+                    self._error = error
+
+    def _raiseError(self):
+        with self._lock:
+            error = self._error
+        if error is not None:
+            raise error
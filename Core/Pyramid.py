@@ -0,0 +1,201 @@
+import os
+import queue
+import threading
+
+import numpy as np
+try:
+    from .ProjectionStack import ProjectionStack
+except ImportError:
+    from ProjectionStack import ProjectionStack
+
+#  预览金字塔的降采样倍数，由细到粗
+PYRAMID_FACTORS = (2, 4, 8)
+#  队列满时 submit 每隔多久（秒）检查一次是否已 close，避免 close 之后永远阻塞
+SUBMIT_POLL_SECONDS = 0.1
+
+
+def downsample(img: np.ndarray, factor: int) -> np.ndarray:
+    """Block mean over factor x factor pixels (edges that do not fill a block are dropped)."""
+    h, w = img.shape[0] // factor, img.shape[1] // factor
+    blocks = np.asarray(img[:h * factor, :w * factor], dtype=np.float32).reshape(h, factor, w, factor)
+    return blocks.mean(axis=(1, 3), dtype=np.float32)
+
+
+def pyramidFileName(stack_file: str, factor: int, partial: bool = False) -> str:
+    stem, ext = os.path.splitext(stack_file)
+    return f"{stem}.x{factor}{'.part' if partial else ''}{ext or '.tif'}"
+
+
+class PreviewPyramid:
+    """2x/4x/8x block-mean downsampled copies of a projection set, for previews while scrubbing.
+
+    Each level is an (n, h / f, w / f) float32 array, in memory or, next to a projection stack file, a
+    memory-mapped sidecar stack <stem>.x<f>.tif. Levels are filled one projection at a time by add(), each
+    level from the next finer one; ready[i] tells whether projection i is available in every level.
+    """
+    """投影集的多分辨率预览（2×/4×/8× 块平均降采样），供拖动滑块时快速显示。"""
+
+    def __init__(self, levels: dict, ready: np.ndarray, stack_file: str = None):
+        self.levels = levels
+        self.ready = ready
+        self.stack_file = stack_file
+        self.factors = tuple(sorted(levels))
+        self._partial = stack_file is not None and not ready.all()
+
+    def __len__(self):
+        return len(self.ready)
+
+    def coarsest(self, index: int):
+        """(factor, projection) of the coarsest level for projection index, or None if not built yet."""
+        factor = self.factors[-1]
+        level = self.levels.get(factor)  # 收尾改名期间暂时为空
+        if not self.ready[index] or level is None:
+            return None
+        return factor, level[index]
+
+    def add(self, index: int, projection):
+        source, source_factor = projection, 1
+        for factor in self.factors:
+            if factor % source_factor == 0:
+                level = downsample(source, factor // source_factor)
+            else:
+                level = downsample(projection, factor)
+            self.levels[factor][index] = level
+            source, source_factor = level, factor
+        self.ready[index] = True
+
+    def close(self):
+        """Flush file-backed levels; once every projection is in, the sidecars get their final names."""
+        if self.stack_file is None:
+            return
+        for level in self.levels.values():
+            if isinstance(level, np.memmap):
+                level.flush()
+        if self._partial and self.ready.all():
+            # 写完整之后才改名，中途中断只留下 .part 文件，open() 不会把不完整的金字塔当成可用
+            self.levels = {}
+            try:
+                for factor in self.factors:
+                    os.replace(pyramidFileName(self.stack_file, factor, partial=True),
+                               pyramidFileName(self.stack_file, factor))
+                self._partial = False
+            except OSError as e:
+                print("[WARNING] Cannot finalise preview pyramid:", e)
+            self.levels = {factor: ProjectionStack.open(pyramidFileName(self.stack_file, factor,
+                                                                        partial=self._partial)).projections
+                           for factor in self.factors}
+
+    @classmethod
+    def create(cls, n_projections: int, projection_shape, factors=PYRAMID_FACTORS, stack_file: str = None):
+        """Empty pyramid for n_projections of projection_shape; file-backed next to stack_file if given."""
+        factors = tuple(sorted(int(factor) for factor in factors))
+        levels = {}
+        for factor in factors:
+            shape = (projection_shape[0] // factor, projection_shape[1] // factor)
+            if stack_file is None:
+                levels[factor] = np.empty((n_projections,) + shape, dtype=np.float32)
+            else:
+                levels[factor] = ProjectionStack.create(pyramidFileName(stack_file, factor, partial=True),
+                                                        n_projections, shape,
+                                                        metadata={"factor": factor,
+                                                                  "source": os.path.basename(stack_file)}).projections
+        return cls(levels, np.zeros(n_projections, dtype=bool), stack_file)
+
+    @classmethod
+    def open(cls, stack_file: str):
+        """Map the complete sidecar levels of stack_file, or return None if there are none."""
+        levels = {}
+        for factor in PYRAMID_FACTORS:
+            file_name = pyramidFileName(stack_file, factor)
+            if os.path.exists(file_name):
+                levels[factor] = ProjectionStack.open(file_name).projections
+        if not levels:
+            return None
+        n = min(len(level) for level in levels.values())
+        return cls(levels, np.ones(n, dtype=bool), stack_file)
+
+
+class PyramidBuilder:
+    """Fills a PreviewPyramid on a background thread from projections submitted as they are produced.
+
+    submit() only queues the projection (blocking when max_pending are waiting, so a fast producer cannot
+    pile up frames); the first build error is re-raised by the next submit() or by close(). A builder from
+    fromProjections() feeds itself on a second thread; close() stops that feeder and waits for it.
+    """
+    """后台线程逐张构建预览金字塔；投影一产生就提交，不阻塞采集。"""
+
+    def __init__(self, pyramid: PreviewPyramid, max_pending: int = 16):
+        self.pyramid = pyramid
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._error = None
+        self._close_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._feeder = None
+        self._thread = threading.Thread(target=self._run, name="pyramid-builder", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(raise_error=exc_type is None)
+
+    def submit(self, index: int, projection):
+        """Queue one projection; returns False (dropping it) if the builder has been closed meanwhile."""
+        if self._error is not None:
+            raise self._error
+        while not self._stop.is_set():
+            try:
+                self._queue.put((index, projection), timeout=SUBMIT_POLL_SECONDS)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def close(self, raise_error: bool = True):
+        """Stop the feeder, if any, and wait until every queued projection is in the pyramid."""
+        self._stop.set()
+        feeder = self._feeder
+        if feeder is not None and feeder is not threading.current_thread():
+            feeder.join()
+        with self._close_lock:
+            if self._thread.is_alive():
+                self._queue.put(None)
+                self._thread.join()
+                if self._error is None:
+                    self.pyramid.close()
+        if raise_error and self._error is not None:
+            raise self._error
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            if self._error is not None:
+                continue
+            try:
+                self.pyramid.add(*item)
+            except Exception as e:
+                self._error = e
+
+    @classmethod
+    def fromProjections(cls, projections, stack_file: str = None, factors=PYRAMID_FACTORS):
+        """Start building the pyramid of an existing projection set (e.g. a just-opened stack) in the background."""
+        pyramid = PreviewPyramid.create(len(projections), projections[0].shape, factors, stack_file)
+        builder = cls(pyramid)
+        builder._feeder = threading.Thread(target=builder._feed, args=(projections,), name="pyramid-feeder",
+                                           daemon=True)
+        builder._feeder.start()
+        return builder
+
+    def _feed(self, projections):
+        try:
+            for index in range(len(projections)):
+                if self._error is not None or not self.submit(index, projections[index]):
+                    break
+        except Exception as e:
+            if self._error is None:
+                self._error = e
+        finally:
+            self.close(raise_error=False)
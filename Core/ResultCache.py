@@ -0,0 +1,244 @@
+import glob
+import hashlib
+import json
+import os
+import shutil
+import time
+
+try:
+    from .Cache import LRUCache
+    from .ProjectionStack import ProjectionStack
+    from .Pyramid import PYRAMID_FACTORS, PreviewPyramid, pyramidFileName
+except ImportError:
+    from Cache import LRUCache
+    from ProjectionStack import ProjectionStack
+    from Pyramid import PYRAMID_FACTORS, PreviewPyramid, pyramidFileName
+
+#  投影结果缓存目录，可用环境变量 FILTRATION_CACHE_DIR 指定
+CACHE_DIR = os.path.join(os.environ.get("FILTRATION_CACHE_DIR",
+                                        os.path.join(os.path.expanduser("~"), ".cache", "filtration")),
+                         "projections")
+#  缓存总大小上限（字节）
+DEFAULT_MAX_BYTES = 20 * 1024 ** 3
+#  键的计算方式改变时递增，使旧条目失效
+CACHE_VERSION = 1
+#  不影响投影结果的 JSON 参数，不参与键的计算
+IGNORED_PARAMETERS = (("WindowSize",), ("Scan", "OutPath"), ("Scan", "OutFolder"))
+#  没有完成标记的条目（可能是其他进程正在写入）在最后修改多久之后（秒）才允许清理
+STALE_ENTRY_SECONDS = 24 * 3600
+
+#  按 (路径, mtime, 大小) 缓存文件内容摘要，文件未变时不再重读
+FILE_DIGEST_CACHE = LRUCache(maxsize=256)
+
+
+def fileDigest(file_name: str) -> str:
+    """blake2b of a file's bytes, recomputed only when its mtime or size changes."""
+    path = os.path.abspath(file_name)
+
+    def digest():
+        hasher = hashlib.blake2b(digest_size=20)
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                hasher.update(block)
+        return hasher.hexdigest()
+
+    stat = os.stat(path)
+    return FILE_DIGEST_CACHE.get((path, stat.st_mtime_ns, stat.st_size), digest)
+
+
+def _referencedFile(value: str, folder: str):
+    path = value if os.path.isabs(value) else os.path.join(folder, value)
+    if os.path.isfile(path):
+        return path
+    # 与 json2gvxr 在不区分大小写的文件系统上的行为一致：test.STL 也能找到 test.stl
+    directory, name = os.path.split(path)
+    if os.path.isdir(directory or '.'):
+        for candidate in os.listdir(directory or '.'):
+            if candidate.lower() == name.lower() and os.path.isfile(os.path.join(directory, candidate)):
+                return os.path.join(directory, candidate)
+    return None
+
+
+def normaliseParameters(params, folder: str, path: tuple = ()):
+    """JSON parameters with every string naming an existing file replaced by a digest of its contents.
+
+    Moving or renaming the scene files therefore keeps the key, while editing any of them (STL, spectrum,
+    detector response, ...) changes it. Keys in IGNORED_PARAMETERS are dropped.
+    """
+    if isinstance(params, dict):
+        return {key: normaliseParameters(value, folder, path + (key,)) for key, value in params.items()
+                if path + (key,) not in IGNORED_PARAMETERS}
+    if isinstance(params, list):
+        return [normaliseParameters(value, folder, path) for value in params]
+    if isinstance(params, str):
+        file_name = _referencedFile(params, folder)
+        if file_name is not None:
+            return {"file": fileDigest(file_name)}
+    return params
+
+
+def configurationKey(JSONFileName: str, spectrum: dict = None, extra: dict = None) -> str:
+    """Content hash of a simulation: normalised JSON, referenced files, in-memory spectrum and extra options."""
+    with open(JSONFileName, 'r', encoding='utf-8') as f:
+        params = json.load(f)
+    configuration = {
+        "version": CACHE_VERSION,
+        "params": normaliseParameters(params, os.path.dirname(os.path.abspath(JSONFileName))),
+        "spectrum": spectrum,
+        "extra": extra,
+    }
+    text = json.dumps(configuration, sort_keys=True, separators=(',', ':'), default=float)
+    return hashlib.blake2b(text.encode(), digest_size=20).hexdigest()
+
+
+def openResult(stack_file: str, pyramid: bool = False):
+    """(projection_set, angle_set[, pyramid]) of a finished stack file, projection_set read-only mapped."""
+    stack = ProjectionStack.open(stack_file)
+    if pyramid:
+        return stack.projections, stack.angles, PreviewPyramid.open(stack_file)
+    return stack.projections, stack.angles
+
+
+def _copyFile(source: str, destination: str):
+    # 先复制到临时文件再改名，其他进程不会读到写了一半的文件
+    temporary = f"{destination}.{os.getpid()}.tmp"
+    shutil.copyfile(source, temporary)
+    os.replace(temporary, destination)
+
+
+class ResultCache:
+    """Projection stacks of earlier runs on disk, keyed by configurationKey, evicted least recently used.
+
+    An entry is <key>.tif (a ProjectionStack with its angles, plus any <key>.x<f>.tif pyramid sidecars) and a
+    <key>.json marker written last, so a run that was interrupted never counts as cached. A hit only maps the
+    stack. The marker mtime is the last-use time; after each store the oldest entries are removed until the
+    directory is within max_bytes.
+    """
+    """按内容哈希缓存的投影结果：重复配置直接内存映射读取，总大小超限时按最近最少使用淘汰。"""
+
+    def __init__(self, cache_dir: str = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.cache_dir = cache_dir or CACHE_DIR
+        self.max_bytes = max_bytes
+
+    def entryFile(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.tif")
+
+    def _markerFile(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.exists(self._markerFile(key)) and os.path.exists(self.entryFile(key))
+
+    def load(self, key: str, pyramid: bool = False):
+        """(projection_set, angle_set[, pyramid]) of a cached run, or None; projection_set is read-only mapped."""
+        if key not in self:
+            return None
+        try:
+            result = openResult(self.entryFile(key), pyramid)
+            os.utime(self._markerFile(key))
+        except (OSError, ValueError) as e:
+            print("[WARNING] Ignoring unreadable cached projections:", e)
+            return None
+        return result
+
+    def loadInto(self, key: str, stack_file: str, pyramid: bool = False):
+        """Like load(), but first copy the entry and its pyramid sidecars to stack_file and map that copy.
+
+        The copy is the caller's own file (not a link), so writing to it never changes the cache.
+        """
+        if key not in self:
+            return None
+        entry = self.entryFile(key)
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(stack_file)), exist_ok=True)
+            if os.path.abspath(stack_file) != os.path.abspath(entry):
+                _copyFile(entry, stack_file)
+                for factor in PYRAMID_FACTORS:
+                    sidecar = pyramidFileName(entry, factor)
+                    if os.path.exists(sidecar):
+                        _copyFile(sidecar, pyramidFileName(stack_file, factor))
+            result = openResult(stack_file, pyramid)
+            os.utime(self._markerFile(key))
+        except (OSError, ValueError) as e:
+            print("[WARNING] Cannot copy cached projections:", e)
+            return None
+        return result
+
+    def store(self, key: str, stack_file: str, info: dict = None):
+        """Record the finished stack_file as the entry of key (copied in unless it already is the entry file).
+
+        The complete pyramid sidecars of stack_file (pyramidFileName) are copied with it.
+        """
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            entry = self.entryFile(key)
+            if os.path.abspath(stack_file) != os.path.abspath(entry):
+                _copyFile(stack_file, entry)
+                for factor in PYRAMID_FACTORS:
+                    sidecar = pyramidFileName(stack_file, factor)
+                    if os.path.exists(sidecar):
+                        _copyFile(sidecar, pyramidFileName(entry, factor))
+            marker = dict(info or {}, created=time.time())
+            temporary = f"{self._markerFile(key)}.{os.getpid()}.tmp"
+            with open(temporary, 'w', encoding='utf-8') as f:
+                json.dump(marker, f, default=str)
+            os.replace(temporary, self._markerFile(key))
+        except OSError as e:
+            print("[WARNING] Cannot cache projections:", e)
+            return
+        self.evict(keep=key)
+
+    def entries(self) -> list:
+        """(last_used, key, size_bytes, complete) of every entry, oldest first.
+
+        An entry without its marker (a run still writing, or an abandoned one) is dated by its newest file.
+        """
+        sizes, modified = {}, {}
+        for file_name in glob.glob(os.path.join(self.cache_dir, "*")):
+            key = os.path.basename(file_name).split('.', 1)[0]
+            try:
+                stat = os.stat(file_name)
+            except OSError:
+                continue
+            sizes[key] = sizes.get(key, 0) + stat.st_size
+            modified[key] = max(modified.get(key, 0.0), stat.st_mtime)
+        entries = []
+        for key, size in sizes.items():
+            try:
+                entries.append((os.path.getmtime(self._markerFile(key)), key, size, True))
+            except OSError:
+                entries.append((modified[key], key, size, False))
+        return sorted(entries)
+
+    def size(self) -> int:
+        return sum(entry[2] for entry in self.entries())
+
+    def evict(self, keep: str = None):
+        """Remove least recently used entries (never `keep`) until the cache is within max_bytes.
+
+        Incomplete entries are removed only once they are older than STALE_ENTRY_SECONDS.
+        """
+        entries = self.entries()
+        total = sum(entry[2] for entry in entries)
+        now = time.time()
+        for last_used, key, size, complete in entries:
+            if total <= self.max_bytes:
+                break
+            if key == keep or (not complete and now - last_used < STALE_ENTRY_SECONDS):
+                continue
+            self.remove(key)
+            total -= size
+
+    def remove(self, key: str):
+        # 先删标记，其他进程就不会再把这个条目当作命中
+        for file_name in [self._markerFile(key)] + glob.glob(os.path.join(self.cache_dir, f"{key}.*")):
+            try:
+                os.remove(file_name)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print("[WARNING] Cannot remove cached file:", e)
+
+    def clear(self):
+        for entry in self.entries():
+            self.remove(entry[1])
@@ -0,0 +1,143 @@
+import os
+import re
+
+import numpy as np
+try:
+    from .Cache import LRUCache
+except ImportError:
+    from Cache import LRUCache
+
+#  能量单位 -> MeV 的换算系数
+UNIT_TO_MEV = {
+    'eV': 1e-6,
+    'keV': 1e-3,
+    'MeV': 1.0,
+}
+
+_UNIT_PATTERN = re.compile(r'(?<![A-Za-z])(keV|MeV|eV)(?![A-Za-z])', re.IGNORECASE)
+_NUMBER_PATTERN = re.compile(r'^[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?$')
+#  无单位标签时，最高能量不超过 30 按 MeV 读；只有最高能量不低于 MIN_TUBE_KV 且能量间隔不细于
+#  FINEST_KEV_SPACING 时（这样的数据按 keV 读同样合理）才警告
+MIN_TUBE_KV = 5.0
+FINEST_KEV_SPACING = 0.05
+
+
+class Spectrum:
+    """An energy spectrum: bin energies [MeV] and photon counts (or weights) per bin."""
+
+    def __init__(self, energy_mev, counts, unit: str = 'MeV', source: str = None):
+        self.energy_mev = np.asarray(energy_mev, dtype=float)
+        self.counts = np.asarray(counts, dtype=float)
+        #  原文件里的能量单位，保存时可按原单位写回
+        self.unit = unit
+        self.source = source
+
+        if self.energy_mev.shape != self.counts.shape:
+            raise ValueError(f"energy {self.energy_mev.shape} and counts {self.counts.shape} shapes differ")
+
+    def __len__(self):
+        return len(self.energy_mev)
+
+    def __str__(self):
+        name = self.source if self.source is not None else "<memory>"
+        return f"Spectrum {name} ({len(self)} bins, {self.energy_mev.min():.6g}-{self.energy_mev.max():.6g} MeV)"
+
+    @property
+    def E_keV(self) -> np.ndarray:
+        return self.energy_mev * 1000.0
+
+    def energy(self, unit: str = 'MeV') -> np.ndarray:
+        return self.energy_mev / UNIT_TO_MEV[unit]
+
+    @classmethod
+    def fromFile(cls, file_name: str, unit: str = None, counts_column: int = 1):
+        return loadSpectrum(file_name, unit=unit, counts_column=counts_column)
+
+
+def _isNumber(token: str) -> bool:
+    return _NUMBER_PATTERN.match(token) is not None
+
+
+def _splitLine(line: str):
+    return line.replace(',', ' ').replace(';', ' ').split()
+
+
+def guessEnergyUnit(energy: np.ndarray, header: str = '') -> str:
+    """Guess the energy unit: a keV/MeV/eV label in the header wins, otherwise the largest energy decides.
+
+    Without a label, a top energy above 30 is read as keV (no tube or linac spectrum here reaches 30 MeV)
+    and above 30000 as eV. A top energy of MIN_TUBE_KV..30 with bins no finer than FINEST_KEV_SPACING could
+    also be a low-kV keV spectrum; only that ambiguous MeV guess is reported with a [WARNING]. Pass the unit
+    explicitly or label the header for such files.
+    """
+    match = _UNIT_PATTERN.search(header)
+    if match is not None:
+        label = match.group(1).lower()
+        return {'ev': 'eV', 'kev': 'keV', 'mev': 'MeV'}[label]
+    e_max = float(np.max(energy)) if len(energy) else 0.0
+    if e_max > 30000:
+        return 'eV'
+    if e_max > 30:
+        return 'keV'
+    spacing = np.diff(np.unique(energy))
+    if e_max >= MIN_TUBE_KV and len(spacing) and float(np.median(spacing)) >= FINEST_KEV_SPACING:
+        print(f"[WARNING] No energy unit in the spectrum header; max energy {e_max:g} read as MeV, but it could "
+              f"be keV. Pass the unit explicitly if this is wrong.")
+    return 'MeV'
+
+
+def parseSpectrumText(text: str, unit: str = None, counts_column: int = 1, source: str = None) -> Spectrum:
+    """Parse a two-or-more column spectrum (comma, semicolon, tab or space separated, optional header lines)."""
+    """解析能谱文本：自动识别表头、分隔符和能量单位。"""
+    lines = text.splitlines()
+
+    header = []
+    first = 0
+    for first, line in enumerate(lines):
+        tokens = _splitLine(line)
+        if tokens and all(_isNumber(token) for token in tokens):
+            break
+        header.append(line)
+    else:
+        raise ValueError(f"no numeric data in spectrum {source or ''}")
+
+    first_line = lines[first]
+    delimiter = ',' if ',' in first_line else ';' if ';' in first_line else None
+    n_columns = len(_splitLine(first_line))
+    if n_columns <= counts_column:
+        raise ValueError(f"spectrum {source or ''} has {n_columns} columns, counts column {counts_column} missing")
+
+    # 表头之后整块交给 numpy 的 C 解析器
+    data = np.loadtxt(lines[first:], dtype=float, delimiter=delimiter, comments='#', ndmin=2)
+
+    energy = data[:, 0]
+    if unit is None:
+        unit = guessEnergyUnit(energy, '\n'.join(header))
+    return Spectrum(energy * UNIT_TO_MEV[unit], data[:, counts_column], unit=unit, source=source)
+
+
+#  按 (路径, mtime, 大小) 缓存已解析的能谱；文件未变时不再读盘
+SPECTRUM_CACHE = LRUCache(maxsize=32)
+
+
+def loadSpectrum(file_name: str, unit: str = None, counts_column: int = 1, use_cache: bool = True) -> Spectrum:
+    """Load a spectrum file; repeated loads of an unchanged file come from SPECTRUM_CACHE.
+
+    Cached spectra are shared, so their arrays are read-only; copy before modifying them.
+    """
+    path = os.path.abspath(file_name)
+
+    def parse():
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            return parseSpectrumText(f.read(), unit=unit, counts_column=counts_column, source=path)
+
+    def parseShared():
+        spectrum = parse()
+        spectrum.energy_mev.flags.writeable = False
+        spectrum.counts.flags.writeable = False
+        return spectrum
+
+    if not use_cache:
+        return parse()
+    stat = os.stat(path)
+    return SPECTRUM_CACHE.get((path, stat.st_mtime_ns, stat.st_size, unit, counts_column), parseShared)
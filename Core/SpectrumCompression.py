@@ -0,0 +1,174 @@
+import numpy as np
+try:
+    from .DetectorResponse import DetectorResponse
+    from .Spectrum import Spectrum
+except ImportError:
+    from DetectorResponse import DetectorResponse
+    from Spectrum import Spectrum
+
+#  默认的最大允许相对强度误差，以及按误差自动选 K 时的上限
+DEFAULT_TOLERANCE = 1e-3
+MAX_COMPRESSED_BINS = 64
+#  厚度范围的默认采样点数
+DEFAULT_THICKNESS_SAMPLES = 64
+#  权重拟合时把各组权重拉向组内原始信号和的正则强度（相对）
+WEIGHT_REGULARISATION = 1e-6
+
+
+class CompressedSpectrum:
+    """A spectrum reduced to K bins, with the transmitted-intensity error it makes over a thickness range.
+
+    spectrum is the K-bin Spectrum (photon counts, to pass to GVXRCalculate(spectrum=)); errors are the relative
+    errors (I_K - I) / I of the detected intensity at each of thicknesses [mm] through the sample material.
+    """
+    """压缩到 K 个能量箱的能谱，并记录在给定样品厚度范围内透射强度的相对误差。"""
+
+    def __init__(self, spectrum: Spectrum, n_input_bins: int, thicknesses, errors):
+        self.spectrum = spectrum
+        self.n_input_bins = n_input_bins
+        self.thicknesses = np.asarray(thicknesses, dtype=float)
+        self.errors = np.asarray(errors, dtype=float)
+
+    def __len__(self):
+        return len(self.spectrum)
+
+    @property
+    def max_error(self) -> float:
+        return float(np.abs(self.errors).max())
+
+    @property
+    def rms_error(self) -> float:
+        return float(np.sqrt(np.mean(self.errors ** 2)))
+
+    def report(self) -> str:
+        worst = int(np.argmax(np.abs(self.errors)))
+        return (f"{self.n_input_bins} -> {len(self)} energy bins; transmitted intensity error over "
+                f"{self.thicknesses.min():g}-{self.thicknesses.max():g} mm: max {self.max_error:.3e} "
+                f"(at {self.thicknesses[worst]:g} mm), rms {self.rms_error:.3e}")
+
+
+def _spectrumArrays(spectrum):
+    if isinstance(spectrum, Spectrum):
+        return spectrum.energy_mev, spectrum.counts
+    return spectrum
+
+
+def _fitWeights(attenuation, target, prior):
+    """Non-negative weights w minimising Σ_L ((attenuation @ w - target) / target)^2, pulled weakly to prior.
+
+    Least squares on the active set, dropping the bins whose weight comes out negative; K is small, so the
+    loop ends after a few solves.
+    """
+    rows = attenuation / target[:, None]
+    scale = np.where(prior > 0, prior, 1.0)
+    # 以先验权重为单位求解，条件数更好；正则行使近似共线的箱不会得到一正一负的大权重
+    design = np.vstack([rows * scale, np.sqrt(WEIGHT_REGULARISATION) * np.eye(len(prior))])
+    goal = np.concatenate([np.ones(len(target)), np.sqrt(WEIGHT_REGULARISATION) * np.ones(len(prior))])
+    active = prior > 0
+    weights = np.zeros(len(prior))
+    while active.any():
+        solution = np.linalg.lstsq(design[:, active], goal, rcond=None)[0]
+        if (solution >= 0).all():
+            weights[active] = solution * scale[active]
+            break
+        active[np.flatnonzero(active)[solution < 0]] = False
+    return weights
+
+
+def compressWithBins(spectrum, material, thicknesses, n_bins: int, response=None) -> CompressedSpectrum:
+    """Reduce spectrum (Spectrum or (E_mev, counts), already filtered) to n_bins energies for one sample material.
+
+    The bins are split into n_bins contiguous energy groups carrying equal detected signal averaged over the
+    thickness range, so groups are narrow where the signal through the sample is. Each group is represented by
+    its bin whose mu is closest to the group's signal-weighted mean mu, and the group weights are then refitted
+    so that the detected intensity I(L) = Σ_E w(E) r(E) exp(-mu(E) L) matches the full spectrum at every
+    thickness. response: the detector response r(E) (see DetectorResponse.fromSpec); the returned counts are
+    photon counts, with the response divided back out, so gVXR applies its own.
+    """
+    e_mev, counts = _spectrumArrays(spectrum)
+    e_mev = np.asarray(e_mev, dtype=float)
+    counts = np.clip(np.asarray(counts, dtype=float), 0.0, None)
+    thicknesses = np.asarray(thicknesses, dtype=float).reshape(-1)
+    detector = DetectorResponse.fromSpec(response)
+
+    signal = detector.apply(counts, e_mev)
+    used = signal > 0
+    if not used.any():
+        raise ValueError("spectrum has no detected signal to compress")
+    e_used, signal, counts = e_mev[used], signal[used], counts[used]
+    mu = material.muInterp()(e_used) / 10.0  # 1/mm
+    attenuation = np.exp(-np.multiply.outer(thicknesses, mu))  # (n_L, n_E)
+    target = attenuation @ signal
+
+    # 按厚度范围内的平均透射信号等分，能量连续分组
+    importance = signal * attenuation.mean(axis=0)
+    cumulative = np.cumsum(importance)
+    n_bins = int(min(max(n_bins, 1), len(e_used)))
+    edges = np.searchsorted(cumulative, cumulative[-1] * np.arange(1, n_bins) / n_bins, side='right')
+    edges = np.unique(np.concatenate([[0], edges, [len(e_used)]]))
+
+    representatives = []
+    prior = []
+    for start, end in zip(edges[:-1], edges[1:]):
+        group_mu, group_signal = mu[start:end], importance[start:end]
+        mean_mu = np.average(group_mu, weights=group_signal) if group_signal.sum() > 0 else group_mu.mean()
+        representatives.append(start + int(np.argmin(np.abs(group_mu - mean_mu))))
+        prior.append(signal[start:end].sum())
+    representatives = np.array(representatives)
+
+    weights = _fitWeights(attenuation[:, representatives], target, np.array(prior))
+    keep = weights > 0
+    representatives, weights = representatives[keep], weights[keep]
+    errors = (attenuation[:, representatives] @ weights - target) / target
+
+    # 探测器响应除回去，得到光子数
+    photons = weights * counts[representatives] / signal[representatives]
+    compressed = Spectrum(e_used[representatives], photons,
+                          unit=getattr(spectrum, "unit", 'MeV'),
+                          source=f"{getattr(spectrum, 'source', None) or 'memory'} ({len(weights)} bins)")
+    return CompressedSpectrum(compressed, len(e_mev), thicknesses, errors)
+
+
+def compressSpectrum(spectrum, material, thicknesses, tolerance: float = DEFAULT_TOLERANCE, n_bins: int = None,
+                     response=None, max_bins: int = MAX_COMPRESSED_BINS) -> CompressedSpectrum:
+    """Smallest compression of spectrum whose transmitted-intensity error stays within tolerance.
+
+    thicknesses [mm]: the sample thicknesses to preserve, an array, or (min, max) for
+    DEFAULT_THICKNESS_SAMPLES evenly spaced values. With n_bins the compression has exactly that many bins
+    (tolerance is then only reported against). Otherwise K = 1, 2, 4, ... max_bins is tried, then refined by
+    bisection, and the first K meeting the tolerance is returned; if none does, the max_bins result is
+    returned with a warning. The error is in result.errors / result.report().
+    """
+    """能谱压缩：找到满足透射强度误差要求的最少能量箱数。"""
+    thicknesses = np.asarray(thicknesses, dtype=float)
+    if thicknesses.shape == (2,):
+        thicknesses = np.linspace(thicknesses[0], thicknesses[1], DEFAULT_THICKNESS_SAMPLES)
+
+    if n_bins is not None:
+        result = compressWithBins(spectrum, material, thicknesses, n_bins, response)
+    else:
+        results = {}
+
+        def attempt(k):
+            if k not in results:
+                results[k] = compressWithBins(spectrum, material, thicknesses, k, response)
+            return results[k].max_error <= tolerance
+
+        # 先倍增找到满足误差的 K，再在上一档与这一档之间二分
+        low, high = 0, 1
+        while high < max_bins and not attempt(high):
+            low, high = high, min(high * 2, max_bins)
+        if not attempt(high):
+            result = results[high]
+            print(f"[WARNING] Spectrum compression misses tolerance {tolerance:g} with {max_bins} bins")
+        else:
+            while high - low > 1:
+                middle = (low + high) // 2
+                if attempt(middle):
+                    high = middle
+                else:
+                    low = middle
+            result = results[high]
+
+    print(f"[INFO] Spectrum compression: {result.report()}")
+    return result
@@ -0,0 +1,325 @@
+"""Parameter sweeps of gVXR scans: one base JSON, axes of variation, one indexed results store.
+
+Usage:
+    python -m Core.Sweep sweep.json [--output DIR] [--dry-run]
+
+Sweep file (paths are relative to the sweep file):
+    {
+        "base": "wwz/mytest2.json",
+        "design": "cartesian",                     # or "latin" with "points": N and optional "seed"
+        "axes": {
+            "Samples/0/Density": [0.5, 1.0, 4.43],
+            "Samples/0/Material": [["mixture", "Ti90Al6V4"], ["element", "Al"]],
+            "Detector/NumberOfPixels": [[600, 600], [1200, 1200]],
+            "Scan/NumberOfProjections": {"min": 90, "max": 360, "num": 4, "integer": true},
+            "Filter": [[], [["W", 1.0]], [["Cu", 0.5], ["Al", 2]]]
+        },
+        "output": "sweep_output"
+    }
+
+An axis name is a path into the JSON parameters (list indices as numbers). Its values are a list of levels, or
+{"min", "max"} sampled continuously by the Latin hypercube ("num" evenly spaced levels for a Cartesian design,
+"integer" to round). The "Filter" axis takes filter stacks in BatchFilter layer syntax; the base spectrum is
+filtered in memory (XFilter) and handed to gVXR without a text file.
+
+Every point is rendered in the same gVXR context (SceneReloader): only the parts of the scene that changed
+are re-initialised, and points are run in the order that needs the fewest sample reloads. Projections go to
+<output>/projections/point_<n>.tif (ProjectionStack) and every point is recorded in <output>/sweep.sqlite:
+    points(sweep, point, parameters, stack_file, n_projections, rows, columns, mean, min, max, seconds,
+           status, error)
+    point_values(sweep, point, axis, value, text)   indexed on (axis, value) and (axis, text)
+Re-running the same sweep file skips the points already done. SweepStore.query() reads the store back.
+"""
+import argparse
+import copy
+import hashlib
+import itertools
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import numpy as np
+try:
+    from .BatchFilter import _layerSpec, buildMaterial
+    from .Materials import MaterialStack
+    from .Spectrum import loadSpectrum
+    from .XFilter import transmission_of_stack
+except ImportError:
+    from BatchFilter import _layerSpec, buildMaterial
+    from Materials import MaterialStack
+    from Spectrum import loadSpectrum
+    from XFilter import transmission_of_stack
+
+#  滤片轴的名称；其余轴都是 JSON 参数路径
+FILTER_AXIS = "Filter"
+#  运行顺序的排序依据，越靠前的部分重新加载越贵
+RELOAD_ORDER = ("Samples", "Detector", "Source")
+
+
+def _axisLevels(spec, design: str) -> list:
+    if isinstance(spec, list):
+        return spec
+    if design == "cartesian":
+        if "num" not in spec:
+            raise ValueError(f"Cartesian axis {spec} needs 'num' levels")
+        levels = np.linspace(float(spec["min"]), float(spec["max"]), int(spec["num"]))
+        return [int(round(level)) for level in levels] if spec.get("integer") else [float(level) for level in levels]
+    return None
+
+
+def expandDesign(axes: dict, design: str = "cartesian", n_points: int = None, seed: int = 0) -> list:
+    """Design points, each {axis: value}.
+
+    cartesian: every combination of the axis levels. latin: n_points Latin-hypercube points; each axis is cut
+    into n_points equal strata visited once each, a list axis picks the level under its stratum and a
+    {"min", "max"} axis a uniform value within it.
+    """
+    names = list(axes)
+    if design == "cartesian":
+        levels = [_axisLevels(axes[name], design) for name in names]
+        return [dict(zip(names, combination)) for combination in itertools.product(*levels)]
+    if design != "latin":
+        raise ValueError(f"Unknown sweep design {design!r}")
+    if not n_points:
+        raise ValueError("A Latin-hypercube design needs 'points'")
+
+    rng = np.random.default_rng(seed)
+    points = [{} for _ in range(n_points)]
+    for name in names:
+        spec = axes[name]
+        position = (rng.permutation(n_points) + rng.random(n_points)) / n_points  # 每层恰好一个点
+        levels = _axisLevels(spec, design)
+        for point, u in zip(points, position):
+            if levels is not None:
+                point[name] = levels[min(int(u * len(levels)), len(levels) - 1)]
+            else:
+                value = float(spec["min"]) + float(u) * (float(spec["max"]) - float(spec["min"]))
+                point[name] = int(round(value)) if spec.get("integer") else value
+    return points
+
+
+def setParameter(params: dict, axis: str, value):
+    """Set the entry at path axis ("Samples/0/Density") of a JSON parameter tree."""
+    keys = [int(key) if key.lstrip('-').isdigit() else key for key in axis.split('/')]
+    node = params
+    for key in keys[:-1]:
+        node = node[key]
+    node[keys[-1]] = value
+
+
+def pointParameters(base: dict, point: dict) -> dict:
+    params = copy.deepcopy(base)
+    for axis, value in point.items():
+        if axis != FILTER_AXIS:
+            setParameter(params, axis, copy.deepcopy(value))
+    return params
+
+
+def _reloadKey(params: dict, point: dict):
+    # 同一组样品/探测器/源参数的点排在一起，减少重新加载
+    sections = [json.dumps(params.get(name), sort_keys=True) for name in RELOAD_ORDER]
+    return sections + [json.dumps(point.get(FILTER_AXIS), sort_keys=True)]
+
+
+class SweepStore:
+    """SQLite store of sweep points: parameters, projection stack file and summary statistics per point."""
+    """参数扫描结果库：每个点的参数、投影堆栈文件与统计量，按参数建索引便于事后查询。"""
+
+    def __init__(self, file_name: str):
+        folder = os.path.dirname(os.path.abspath(file_name))
+        os.makedirs(folder, exist_ok=True)
+        self.file_name = file_name
+        self.connection = sqlite3.connect(file_name)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS sweeps (
+                sweep INTEGER PRIMARY KEY, digest TEXT UNIQUE, base TEXT, design TEXT, manifest TEXT,
+                created REAL);
+            CREATE TABLE IF NOT EXISTS points (
+                sweep INTEGER, point INTEGER, parameters TEXT, stack_file TEXT, n_projections INTEGER,
+                rows INTEGER, columns INTEGER, mean REAL, min REAL, max REAL, seconds REAL, status TEXT,
+                error TEXT, PRIMARY KEY (sweep, point));
+            CREATE TABLE IF NOT EXISTS point_values (
+                sweep INTEGER, point INTEGER, axis TEXT, value REAL, text TEXT);
+            CREATE INDEX IF NOT EXISTS point_values_by_value ON point_values (axis, value);
+            CREATE INDEX IF NOT EXISTS point_values_by_text ON point_values (axis, text);
+            CREATE INDEX IF NOT EXISTS point_values_by_point ON point_values (sweep, point);
+        """)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.connection.close()
+
+    def beginSweep(self, sweep: dict) -> int:
+        """Id of the sweep described by sweep (created on first use, so re-runs resume it)."""
+        manifest = json.dumps({key: sweep[key] for key in ("base", "design", "axes", "points", "seed")},
+                              sort_keys=True)
+        digest = hashlib.blake2b(manifest.encode(), digest_size=16).hexdigest()
+        with self.connection:
+            self.connection.execute("INSERT OR IGNORE INTO sweeps (digest, base, design, manifest, created) "
+                                    "VALUES (?, ?, ?, ?, ?)", (digest, sweep["base"], sweep["design"], manifest,
+                                                               time.time()))
+        return self.connection.execute("SELECT sweep FROM sweeps WHERE digest = ?", (digest,)).fetchone()[0]
+
+    def completed(self, sweep_id: int) -> set:
+        rows = self.connection.execute("SELECT point FROM points WHERE sweep = ? AND status = 'done'", (sweep_id,))
+        return {row[0] for row in rows}
+
+    def record(self, sweep_id: int, index: int, point: dict, result: dict):
+        with self.connection:
+            self.connection.execute("DELETE FROM point_values WHERE sweep = ? AND point = ?", (sweep_id, index))
+            self.connection.execute(
+                "INSERT OR REPLACE INTO points VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (sweep_id, index, json.dumps(point), result.get("stack_file"), result.get("n_projections"),
+                 result.get("rows"), result.get("columns"), result.get("mean"), result.get("min"),
+                 result.get("max"), result.get("seconds"), result["status"], result.get("error")))
+            self.connection.executemany(
+                "INSERT INTO point_values VALUES (?, ?, ?, ?, ?)",
+                [(sweep_id, index, axis) + _storedValue(value) for axis, value in point.items()])
+
+    def query(self, conditions: dict = None, sweep_id: int = None) -> list:
+        """Points (dicts, with 'parameters' decoded) matching every condition, in point order.
+
+        conditions maps axis -> value, or -> (low, high) for a numeric range.
+        """
+        sql = "SELECT * FROM points WHERE 1"
+        arguments = []
+        if sweep_id is not None:
+            sql += " AND sweep = ?"
+            arguments.append(sweep_id)
+        for axis, condition in (conditions or {}).items():
+            if isinstance(condition, tuple):
+                clause, values = "value BETWEEN ? AND ?", list(condition)
+            else:
+                number, text = _storedValue(condition)
+                clause, values = ("value = ?", [number]) if number is not None else ("text = ?", [text])
+            sql += (" AND EXISTS (SELECT 1 FROM point_values v WHERE v.sweep = points.sweep "
+                    f"AND v.point = points.point AND v.axis = ? AND v.{clause})")
+            arguments += [axis] + values
+        rows = self.connection.execute(sql + " ORDER BY sweep, point", arguments)
+        return [dict(row, parameters=json.loads(row["parameters"])) for row in rows]
+
+
+def _storedValue(value):
+    """(value REAL, text TEXT) columns of an axis value: numbers in value, everything else as JSON text."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value), None
+    return None, json.dumps(value, sort_keys=True)
+
+
+def readSweep(sweep_file: str) -> dict:
+    with open(sweep_file, 'r', encoding='utf-8') as f:
+        sweep = json.load(f)
+    base_dir = os.path.dirname(os.path.abspath(sweep_file))
+    sweep["base"] = os.path.join(base_dir, sweep["base"])
+    sweep["output"] = os.path.join(base_dir, sweep.get("output", "sweep_output"))
+    sweep.setdefault("design", "cartesian")
+    sweep.setdefault("points", None)
+    sweep.setdefault("seed", 0)
+    if FILTER_AXIS in sweep["axes"]:
+        sweep["axes"][FILTER_AXIS] = [[_layerSpec(layer, base_dir) for layer in stack]
+                                      for stack in sweep["axes"][FILTER_AXIS]]
+    return sweep
+
+
+def filteredSpectrum(params: dict, base_json: str, layers: list):
+    """(E_mev, counts) of the point's Beam TextFile spectrum through the filter layers."""
+    beam = params["Source"]["Beam"]
+    path = beam["TextFile"]
+    path = path if os.path.isabs(path) else os.path.join(os.path.dirname(os.path.abspath(base_json)), path)
+    spectrum = loadSpectrum(path, unit=beam.get("Unit"))
+    counts = np.clip(spectrum.counts, 0.0, None)
+    if layers:
+        counts = counts * transmission_of_stack(spectrum.energy_mev,
+                                                MaterialStack([buildMaterial(layer) for layer in layers]))
+    return spectrum.energy_mev, counts
+
+
+def runSweep(sweep: dict, quiet: bool = False) -> list:
+    """Render every point not yet in the store; returns the points of this sweep as stored."""
+    try:
+        from . import Json2gvxrCalculator as Calculator
+    except ImportError:
+        import Json2gvxrCalculator as Calculator
+
+    points = expandDesign(sweep["axes"], sweep["design"], sweep["points"], sweep["seed"])
+    stack_folder = os.path.join(sweep["output"], "projections")
+    with SweepStore(os.path.join(sweep["output"], "sweep.sqlite")) as store:
+        sweep_id = store.beginSweep(sweep)
+        done = store.completed(sweep_id)
+        reloader = Calculator.SceneReloader(sweep["base"])
+        base = copy.deepcopy(reloader.params)
+        todo = [(index, point, pointParameters(base, point)) for index, point in enumerate(points)
+                if index not in done]
+        todo.sort(key=lambda item: _reloadKey(item[2], item[1]))
+        print(f"[INFO] Sweep {sweep_id}: {len(points)} points, {len(done)} already done, {len(todo)} to run")
+
+        start = time.perf_counter()
+        for n, (index, point, params) in enumerate(todo):
+            point_start = time.perf_counter()
+            stack_file = os.path.join(stack_folder, f"point_{index:05d}.tif")
+            try:
+                spectrum = None
+                if FILTER_AXIS in point:
+                    spectrum = filteredSpectrum(params, sweep["base"], point[FILTER_AXIS])
+                reloader.load(params, spectrum)
+                acquisition = Calculator.IncrementalAcquisition(sweep["base"], spectrum, initialise=False)
+                # 统计量在逐张生成时累加，不必再从磁盘读回整套投影
+                totals = {"sum": 0.0, "count": 0, "min": np.inf, "max": -np.inf}
+
+                def accumulate(i, angle, projection, *progress):
+                    totals["sum"] += float(projection.sum(dtype=np.float64))
+                    totals["count"] += projection.size
+                    totals["min"] = min(totals["min"], float(projection.min()))
+                    totals["max"] = max(totals["max"], float(projection.max()))
+
+                projections, _ = acquisition.run(callback=accumulate, stackFile=stack_file)
+                result = {"stack_file": os.path.relpath(stack_file, sweep["output"]),
+                          "n_projections": len(projections), "rows": projections.shape[1],
+                          "columns": projections.shape[2], "mean": totals["sum"] / max(totals["count"], 1),
+                          "min": totals["min"], "max": totals["max"], "status": "done"}
+                del projections
+            except Exception as e:
+                print(f"[ERROR] Sweep point {index} {point}: {e}")
+                result = {"status": "failed", "error": str(e)}
+            result["seconds"] = time.perf_counter() - point_start
+            store.record(sweep_id, index, point, result)
+            if not quiet:
+                print(f"[INFO] Point {index} ({n + 1}/{len(todo)}) {result['status']} in "
+                      f"{result['seconds']:.2f} s: {json.dumps(point)}")
+
+        elapsed = time.perf_counter() - start
+        print(f"[INFO] {len(todo)} points in {elapsed:.1f} s; scene reloads {reloader.reloads}. "
+              f"Results: {store.file_name}")
+        return store.query(sweep_id=sweep_id)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a parameter sweep of gVXR scans.")
+    parser.add_argument("sweep", help="JSON sweep file with 'base' and 'axes'")
+    parser.add_argument("--output", default=None, help="output directory (default: sweep 'output')")
+    parser.add_argument("--dry-run", action="store_true", help="only list the design points")
+    parser.add_argument("--quiet", action="store_true", help="only print the final summary")
+    args = parser.parse_args(argv)
+
+    sweep = readSweep(args.sweep)
+    if args.output:
+        sweep["output"] = os.path.abspath(args.output)
+    if args.dry_run:
+        for index, point in enumerate(expandDesign(sweep["axes"], sweep["design"], sweep["points"],
+                                                   sweep["seed"])):
+            print(index, json.dumps(point))
+        return 0
+    runSweep(sweep, quiet=args.quiet)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,24 +1,21 @@
 import numpy as np
-from scipy.interpolate import interp1d
 try:
+    from .DetectorResponse import DetectorResponse
     from .Materials import Material, MaterialStack
+    from .Interpolation import MU_INTERP_CACHE, make_mu_interp
+    from .AttenuationTensor import attenuationTensor, arealDensityVector
 except ImportError:
+    from DetectorResponse import DetectorResponse
     from Materials import Material, MaterialStack
+    from Interpolation import MU_INTERP_CACHE, make_mu_interp
+    from AttenuationTensor import attenuationTensor, arealDensityVector
 
 
 def filtrationCalculate(material: Material, EnergyRange: np.ndarray):
     try:
-        interp_func = interp1d(material.energy, material.mass_attenuation_coefficients, kind='linear',
-                               fill_value="extrapolate")
-
         energies = np.atleast_1d(EnergyRange / 1e6)  # Ensure input is an array
-        mu_values = np.zeros_like(energies)  # Initialize the output array
-        for i, energy in enumerate(energies):
-            # Calculate the mass attenuation coefficient (mu/rho) using the interpolation function
-            mass_attenuation_coefficient = interp_func(energy)
-            # Convert to linear attenuation coefficient (mu) using the formula: mu = (mu/rho) * rho
-            linear_attenuation_coefficient = mass_attenuation_coefficient * material.tungsten_density
-            mu_values[i] = linear_attenuation_coefficient
+        # Linear attenuation mu = (mu/rho) * rho for all energies at once, from the shared interpolator cache
+        mu_values = material.muInterp('linear')(energies)
 
         transmitted = np.exp(-0.1 * material.thickness * mu_values)
         attenuated = 1 - transmitted
@@ -30,37 +27,140 @@ def filtrationCalculate(material: Material, EnergyRange: np.ndarray):
         return None, None, None
 
 
-def make_mu_interp(E_tab_mev, mu_over_rho_tab, rho_g_cm3):
-    """Return a callable mu(E) [cm^-1] using log-log interpolation on (E, mu/rho) and multiply by density."""
-    """返回一个可调用的μ(E) [cm^-1]，使用(E, μ/ρ)的对数-对数插值并乘以密度。"""
-    E_tab = np.asarray(E_tab_mev, dtype=float)
-    mu_over_rho_tab = np.asarray(mu_over_rho_tab, dtype=float)
-    # Avoid log(<=0)
-    E_tab = np.clip(E_tab, 1e-12, None)
-    mu_over_rho_tab = np.clip(mu_over_rho_tab, 1e-30, None)
-    f = interp1d(np.log(E_tab), np.log(mu_over_rho_tab),
-                 kind="linear", fill_value="extrapolate", bounds_error=False)
+def filtrationCalculateBatch(materials, EnergyRange: np.ndarray, thicknesses, densities=None):
+    """Vectorized filtrationCalculate over every (material, thickness, energy) combination.
+
+    materials: sequence of Material; densities [g/cm^3] default to each material's own density.
+    thicknesses [mm]: shape (n_thicknesses,) shared by all materials, or (n_materials, n_thicknesses).
+    EnergyRange [eV]: shape (n_energies,).
+    Returns mu [cm^-1], transmitted and attenuated fractions, each (n_materials, n_thicknesses, n_energies);
+    mu is a read-only broadcast view since it does not depend on thickness.
+    """
+    """对材料 x 厚度 x 能量的全部组合一次性广播计算衰减与透射。"""
+    try:
+        energies = np.atleast_1d(np.asarray(EnergyRange, dtype=float) / 1e6)
+        if densities is None:
+            densities = [material.tungsten_density for material in materials]
+        densities = np.asarray(densities, dtype=float).reshape(-1)
+        thicknesses = np.asarray(thicknesses, dtype=float)
+        if thicknesses.ndim < 2:
+            thicknesses = thicknesses.reshape(1, -1)
+        if len(densities) != len(materials):
+            raise ValueError(f"got {len(densities)} densities for {len(materials)} materials")
+
+        mu_values = np.empty((len(materials), energies.size))
+        for i, material in enumerate(materials):
+            mu_of_E = MU_INTERP_CACHE.muInterp(material.energy, material.mass_attenuation_coefficients, densities[i],
+                                               kind='linear', table_key=material.table_key)
+            mu_values[i] = mu_of_E(energies)
+
+        transmitted = np.multiply(mu_values[:, None, :], -0.1 * thicknesses[:, :, None])
+        np.exp(transmitted, out=transmitted)
+        attenuated = 1 - transmitted
 
-    def mu_of_E(E_mev_query):
-        E = np.asarray(E_mev_query, dtype=float)
-        E = np.clip(E, 1e-12, None)
-        mu_over_rho = np.exp(f(np.log(E)))  # cm^2/g
-        return mu_over_rho * rho_g_cm3  # -> cm^-1
+        return np.broadcast_to(mu_values[:, None, :], transmitted.shape), transmitted, attenuated
+
+    except Exception as e:
+        print("Error calculating batch filtration:", e)
+        return None, None, None
 
-    return mu_of_E
 
+def transmission_of_stack(e_mev, stack: MaterialStack, dense: bool = False):
+    """Compute total transmission T(E) across a multilayer filter stack using Beer–Lambert law.
 
-def transmission_of_stack(e_mev, stack: MaterialStack):
-    """Compute total transmission T(E) across a multilayer filter stack using Beer–Lambert law."""
+    dense=True folds every layer with a known composition into one areal-density-per-element vector and
+    evaluates it against the cached (92, n_E) AttenuationTensor of the grid with a single matrix-vector product.
+    """
     """使用贝尔-兰伯斯定律计算多层滤芯堆栈的 transmission T(E)。"""
+    if dense:
+        tensor = attenuationTensor(e_mev)
+        areal_density, others = arealDensityVector(stack, len(tensor.matrix))
+        optical_depth = tensor.opticalDepth(areal_density).reshape(np.shape(e_mev))
+        for material in others:
+            optical_depth += material.muInterp()(e_mev) * (material.thickness or 0.0) / 10.0
+        return np.exp(-optical_depth)
+    if isinstance(stack, MaterialStack):
+        # 由 MaterialStack 增量维护 Σ mu_i·t_i，这里只做一次 exp
+        return stack.transmission(e_mev)
     T_ = np.ones_like(e_mev, dtype=float)
     for material in stack:
-        mu = make_mu_interp(material.energy, material.mass_attenuation_coefficients, material.tungsten_density)
+        mu = material.muInterp()
         t_cm = (material.thickness or 0.0) / 10.0
         T_ *= np.exp(-mu(e_mev) * t_cm)
     return T_
 
 
+def filter_spectra(spectra, stack: MaterialStack, e_mev=None, dense: bool = False, response=None) -> dict:
+    """Filter a family of spectra through one stack with a single transmission evaluation.
+
+    spectra: (n_spectra, n_E) counts on the shared grid e_mev [MeV], or a list of Spectrum / (E_mev, counts)
+    pairs on arbitrary grids. For a list, T(E) is evaluated once on the union of all grids and gathered back
+    per spectrum, so no spectrum is interpolated.
+    Returns the keys of Win_ApplyFilter.MaterialsResult (E_keV, counts_in, counts_out, Transmission) plus
+    Weights_In_Sum1 / Weights_Out_Sum1: 2D arrays for 2D input, lists of 1D arrays for list input.
+    Negative input counts are clamped to 0. With a detector response (DetectorResponse, (E_in, E_out) table
+    or 'counting' / 'integrating', see DetectorResponse.fromSpec) Signal_In / Signal_Out hold the detected
+    signal per bin too, from the response resampled once per grid.
+    """
+    """一次透射率计算完成一组能谱的滤过（kVp 扫描、不同源位置等），不对能谱逐个循环。"""
+    if e_mev is not None:
+        E = np.asarray(e_mev, dtype=float)
+        counts_in = np.clip(np.atleast_2d(np.asarray(spectra, dtype=float)), 0.0, None)
+        T_ = transmission_of_stack(E, stack, dense=dense)
+        counts_out = counts_in * T_
+        totals_in = counts_in.sum(axis=1, keepdims=True)
+        totals_out = counts_out.sum(axis=1, keepdims=True)
+        result = {
+            "E_keV": E * 1000.0,
+            "counts_in": counts_in,
+            "counts_out": counts_out,
+            "Transmission": T_,
+            "Weights_In_Sum1": counts_in / np.where(totals_in > 0, totals_in, 1.0),
+            "Weights_Out_Sum1": counts_out / np.where(totals_out > 0, totals_out, 1.0),
+        }
+        if response is not None:
+            detector = DetectorResponse.fromSpec(response)
+            result["Signal_In"] = detector.apply(counts_in, E)
+            result["Signal_Out"] = detector.apply(counts_out, E)
+        return result
+
+    pairs = [(spectrum.energy_mev, spectrum.counts) if hasattr(spectrum, 'energy_mev') else spectrum
+             for spectrum in spectra]
+    lengths = np.array([len(energy) for energy, _ in pairs])
+    E_all = np.concatenate([np.asarray(energy, dtype=float) for energy, _ in pairs])
+    counts_in = np.clip(np.concatenate([np.asarray(counts, dtype=float) for _, counts in pairs]), 0.0, None)
+
+    # 所有能谱的能量并集上只计算一次 T(E)，再按索引取回
+    E_union, inverse = np.unique(E_all, return_inverse=True)
+    T_ = transmission_of_stack(E_union, stack, dense=dense)[inverse]
+    counts_out = counts_in * T_
+
+    starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    nonempty = lengths > 0
+    totals_in = np.zeros(len(lengths))
+    totals_out = np.zeros(len(lengths))
+    totals_in[nonempty] = np.add.reduceat(counts_in, starts[nonempty])
+    totals_out[nonempty] = np.add.reduceat(counts_out, starts[nonempty])
+    weights_in = counts_in / np.repeat(np.where(totals_in > 0, totals_in, 1.0), lengths)
+    weights_out = counts_out / np.repeat(np.where(totals_out > 0, totals_out, 1.0), lengths)
+
+    split_at = np.cumsum(lengths)[:-1]
+    result = {
+        "E_keV": np.split(E_all * 1000.0, split_at),
+        "counts_in": np.split(counts_in, split_at),
+        "counts_out": np.split(counts_out, split_at),
+        "Transmission": np.split(T_, split_at),
+        "Weights_In_Sum1": np.split(weights_in, split_at),
+        "Weights_Out_Sum1": np.split(weights_out, split_at),
+    }
+    if response is not None:
+        # 响应同样只在能量并集上重采样一次
+        detected = DetectorResponse.fromSpec(response).resample(E_union)[inverse]
+        result["Signal_In"] = np.split(counts_in * detected, split_at)
+        result["Signal_Out"] = np.split(counts_out * detected, split_at)
+    return result
+
+
 def normalize_to_max(x):
     """ Normalized to each curve's own max (compare shapes only) """
     x = np.asarray(x, dtype=float)
@@ -74,17 +174,13 @@ def normalize_sum1(x):
     return x / s if s > 0 else x
 
 
-
-import matplotlib.pyplot as plt
-import matplotlib
-
-matplotlib.use('TkAgg')
-import pandas as pd
-from pathlib import Path
-from scipy.interpolate import interp1d
-
-
 if __name__ == "__main__":
+    # 绘图依赖只在脚本运行时导入，库调用（批处理/无界面节点）不需要 matplotlib
+    import matplotlib.pyplot as plt
+    import matplotlib
+
+    matplotlib.use('TkAgg')
+    from pathlib import Path
 
     SPECTRUM_PATH = Path("2MeV.txt")  # Input spectrum file with two columns: E[MeV], counts
     OUTPUT_PREFIX = "2MeV_filtered"  # Output filename prefix
@@ -0,0 +1,37 @@
+import csv
+import os
+import shutil
+
+from BatchFilter import runBatch
+
+SPECTRUM = os.path.join(os.path.dirname(os.path.abspath(__file__)), "2MeV.txt")
+
+
+def job(path, name, layers, output):
+    return {"spectrum": {"path": path, "unit": "MeV", "name": name},
+            "stack": {"name": "filter", "layers": layers}, "output": output, "response": None}
+
+
+def test_failed_job_and_duplicate_names(tmp_path):
+    other = tmp_path / "other"
+    other.mkdir()
+    shutil.copy(SPECTRUM, other / "2MeV.txt")
+    output = str(tmp_path / "out")
+    layers = [{"material": "Cu", "thickness": 0.5}]
+    jobs = [
+        job(SPECTRUM, "2MeV", layers, output),
+        job(str(other / "2MeV.txt"), "2MeV", layers, output),
+        job(SPECTRUM, "bad", [{"material": "Xx", "thickness": 1.0}], output),
+    ]
+
+    results = runBatch(jobs, output, workers=1, quiet=True)
+
+    assert [result["status"] for result in results] == ["ok", "ok", "failed"]
+    assert results[2]["error"]
+    assert results[0]["name"] != results[1]["name"]
+    for result in results[:2]:
+        assert os.path.exists(os.path.join(output, f"{result['name']}.csv"))
+    with open(os.path.join(output, "batch_summary.csv"), newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    assert [row["status"] for row in rows] == ["ok", "ok", "failed"]
+    assert rows[2]["error"] == results[2]["error"]
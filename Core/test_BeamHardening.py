@@ -0,0 +1,35 @@
+import os
+
+import numpy as np
+
+import BeamHardening
+from BeamHardening import BeamHardeningLUT, clearCache
+from Materials import Material
+
+E_MEV = np.linspace(0.02, 0.12, 101)
+COUNTS = np.exp(-((E_MEV - 0.06) / 0.02) ** 2)
+
+
+def test_intensity_matches_direct_sum(tmp_path):
+    material = Material.fromElement('Al', 1.0)
+    lut = BeamHardeningLUT.build((E_MEV, COUNTS), material, max_length=50.0, cache_dir=str(tmp_path))
+    lengths = np.array([0.0, 1.3, 17.0, 49.9])
+    mu = material.muInterp()(E_MEV) / 10.0
+    direct = np.exp(-np.multiply.outer(lengths, mu)) @ (COUNTS * E_MEV)
+    np.testing.assert_allclose(lut.intensity(lengths), direct, rtol=1e-4)
+    np.testing.assert_allclose(lut.linearise(direct), lengths, atol=1e-2)
+
+
+def test_disk_cache_is_size_capped(tmp_path, monkeypatch):
+    material = Material.fromElement('Cu', 1.0)
+    lut = BeamHardeningLUT.build((E_MEV, COUNTS), material, max_length=1.0, cache_dir=str(tmp_path))
+    table_bytes = os.path.getsize(os.path.join(tmp_path, f"{lut.key}.npy"))
+    monkeypatch.setattr(BeamHardening, "MAX_CACHE_BYTES", 3 * table_bytes)
+    for max_length in range(2, 8):
+        lut = BeamHardeningLUT.build((E_MEV, COUNTS), material, max_length=float(max_length),
+                                     cache_dir=str(tmp_path))
+    files = os.listdir(tmp_path)
+    assert len(files) == 3
+    assert f"{lut.key}.npy" in files  # 最新的表总是保留
+    clearCache(str(tmp_path))
+    assert os.listdir(tmp_path) == []
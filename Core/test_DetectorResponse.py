@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+from DetectorResponse import DetectorResponse, IDEAL_INTEGRATING, PHOTON_COUNTING
+
+E_MEV = np.linspace(0.01, 0.1, 10)
+
+
+@pytest.mark.parametrize("spec, expected", [(None, IDEAL_INTEGRATING), ('integrating', IDEAL_INTEGRATING),
+                                            ('Counting', PHOTON_COUNTING)])
+def test_named_detectors(spec, expected):
+    assert DetectorResponse.fromSpec(spec) is expected
+
+
+@pytest.mark.parametrize("spec", ['none', 'energy', ''])
+def test_unknown_names_are_rejected(spec):
+    with pytest.raises(ValueError):
+        DetectorResponse.fromSpec(spec)
+
+
+def test_callable_wrapper_is_reused():
+    def response(e_mev):
+        return 0.5 * e_mev
+
+    detector = DetectorResponse.fromSpec(response)
+    assert DetectorResponse.fromSpec(response) is detector
+    np.testing.assert_allclose(detector.apply(np.ones_like(E_MEV), E_MEV), 0.5 * E_MEV)
+    assert detector.resample(E_MEV) is DetectorResponse.fromSpec(response).resample(E_MEV)
+
+
+def test_table_response():
+    detector = DetectorResponse.fromSpec((np.array([0.0, 0.2]), np.array([0.0, 0.1])))
+    np.testing.assert_allclose(detector.resample(E_MEV), 0.5 * E_MEV)
@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+import pytest
+from scipy.interpolate import interp1d
+
+from Interpolation import PiecewiseTable, make_mu_interp, make_linear_mu_interp
+from Materials import Material, MaterialStack
+from XFilter import transmission_of_stack
+
+ELEMENT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "element")
+
+
+def tungstenTable():
+    data = np.loadtxt(os.path.join(ELEMENT_DIR, "74.csv"), delimiter=',', skiprows=1)
+    return data[:, 0], data[:, 1]
+
+
+def queryEnergies(E_tab):
+    # 避开吸收边本身（interp1d 在重复能量处的取值没有定义）
+    E = np.geomspace(E_tab[0], E_tab[-1], 2000)
+    return E[~np.isin(E, E_tab)]
+
+
+def test_loglog_matches_interp1d():
+    E_tab, mac = tungstenTable()
+    E = queryEnergies(E_tab)
+    rho = 19.3
+    reference = rho * np.exp(interp1d(np.log(E_tab), np.log(mac))(np.log(E)))
+    np.testing.assert_allclose(make_mu_interp(E_tab, mac, rho)(E), reference, rtol=1e-10)
+
+
+def test_linear_matches_interp1d():
+    E_tab, mac = tungstenTable()
+    E = queryEnergies(E_tab)
+    rho = 19.3
+    reference = rho * interp1d(E_tab, mac)(E)
+    np.testing.assert_allclose(make_linear_mu_interp(E_tab, mac, rho)(E), reference, rtol=1e-10)
+
+
+def test_edge_sides():
+    E_tab, mac = tungstenTable()
+    table = PiecewiseTable(E_tab, mac)
+    edge = table.edges[-1]
+    below, above = mac[E_tab == edge]
+    assert table(edge, side='left') == pytest.approx(below)
+    assert table(edge, side='right') == pytest.approx(above)
+
+
+@pytest.mark.parametrize("loglog", [True, False])
+def test_zero_density_gives_zero_mu(loglog):
+    E_tab, mac = tungstenTable()
+    mu = PiecewiseTable(E_tab, mac, 0.0, loglog=loglog)(queryEnergies(E_tab))
+    assert np.all(np.isfinite(mu))
+    assert np.all(mu == 0.0)
+
+
+def test_zero_density_layer_is_transparent():
+    E = np.linspace(0.01, 0.15, 50)
+    stack = MaterialStack([Material.fromElement('W', 1.0, density=0.0)])
+    np.testing.assert_array_equal(transmission_of_stack(E, stack), np.ones_like(E))
@@ -0,0 +1,109 @@
+"""Parity of IncrementalAcquisition with gVXR's computeCTAcquisition; skipped without gVXR or OpenGL."""
+import json
+import os
+
+import numpy as np
+import pytest
+
+Calculator = pytest.importorskip("Json2gvxrCalculator", exc_type=ImportError)
+gvxr = Calculator.gvxr
+
+WWZ = os.path.join(os.path.dirname(os.path.abspath(__file__)), "wwz")
+N_PROJECTIONS = 6
+
+
+def box(lower, upper):
+    x0, y0, z0 = lower
+    x1, y1, z1 = upper
+    v = np.array([[x0, y0, z0], [x1, y0, z0], [x1, y1, z0], [x0, y1, z0],
+                  [x0, y0, z1], [x1, y0, z1], [x1, y1, z1], [x0, y1, z1]], dtype=float)
+    faces = [(0, 2, 1), (0, 3, 2), (4, 5, 6), (4, 6, 7), (0, 1, 5), (0, 5, 4),
+             (1, 2, 6), (1, 6, 5), (2, 3, 7), (2, 7, 6), (3, 0, 4), (3, 4, 7)]
+    return v[np.array(faces)]
+
+
+def writeSTL(file_name, triangles):
+    with open(file_name, 'w') as f:
+        f.write("solid part\n")
+        for triangle in triangles:
+            normal = np.cross(triangle[1] - triangle[0], triangle[2] - triangle[0])
+            normal /= np.linalg.norm(normal)
+            f.write(f"facet normal {normal[0]:g} {normal[1]:g} {normal[2]:g}\nouter loop\n")
+            for vertex in triangle:
+                f.write(f"vertex {vertex[0]:g} {vertex[1]:g} {vertex[2]:g}\n")
+            f.write("endloop\nendfacet\n")
+        f.write("endsolid part\n")
+
+
+@pytest.fixture
+def scene(tmp_path):
+    def write(final_angle, include_final):
+        # L 形样品：绕 z 轴不对称，角度方向或旋转中心错了投影就对不上
+        stl = str(tmp_path / "part.stl")
+        writeSTL(stl, np.concatenate([box((-20, -20, -20), (20, -5, 20)), box((5, -5, -10), (20, 25, 10))]))
+        params = {
+            "WindowSize": [64, 64],
+            "Detector": {"Position": [120, 0, 0, "mm"], "UpVector": [0, 0, -1], "NumberOfPixels": [64, 64],
+                         "Size": [300, 300, "mm"]},
+            "Source": {"Position": [-120, 0.0, 0.0, "mm"], "Shape": "Point",
+                       "Beam": {"TextFile": os.path.join(WWZ, "test.txt"), "Unit": "keV"}},
+            "Samples": [{"Label": "Part", "Path": stl, "Unit": "mm", "Material": ["element", "Al"],
+                         "Density": 2.7, "Type": "inner"}],
+            "Scan": {"NumberOfProjections": N_PROJECTIONS, "FinalAngle": final_angle,
+                     "IncludeFinalAngle": include_final, "CenterOfRotation": [0, 0, 0],
+                     "OutFolder": "./run", "OutPath": str(tmp_path)},
+        }
+        file_name = str(tmp_path / "scene.json")
+        with open(file_name, 'w') as f:
+            json.dump(params, f)
+        return file_name
+    return write
+
+
+def reference(json_file):
+    result = Calculator.GVXRCalculate(json_file)
+    if result is None:
+        pytest.skip("gVXR could not create an OpenGL context")
+    return result
+
+
+@pytest.mark.parametrize("final_angle, include_final", [(360, False), (180, True)])
+def test_acquisition_angles_match_gvxr(scene, final_angle, include_final):
+    _, angle_set = reference(scene(final_angle, include_final))
+    expected = Calculator.acquisitionAngles(N_PROJECTIONS, final_angle, include_final)
+    np.testing.assert_allclose(gvxr.getAngleSetCT(), expected, atol=1e-6)
+    np.testing.assert_allclose(angle_set, expected, atol=1e-6)
+
+
+def test_incremental_matches_ct_acquisition(scene):
+    json_file = scene(360, False)
+    projections, angles = reference(json_file)
+    incremental, incremental_angles = Calculator.IncrementalAcquisition(json_file).run()
+    np.testing.assert_allclose(incremental_angles, angles, atol=1e-6)
+
+    def error(a, b):
+        return float(np.linalg.norm(a - b) / np.linalg.norm(b))
+
+    # 两者都有 Poisson 噪声：同一角度的差别只能是噪声，且必须小于与镜像角度 (-angle) 的差别
+    for i in range(1, N_PROJECTIONS):
+        mirror = (N_PROJECTIONS - i) % N_PROJECTIONS
+        assert error(incremental[i], projections[i]) < 0.05
+        if mirror != i:
+            assert error(incremental[i], projections[i]) < error(incremental[i], projections[mirror])
+
+
+def test_cache_hit_writes_requested_stack_file(scene, tmp_path):
+    json_file = scene(360, False)
+    cache = Calculator.ResultCache(str(tmp_path / "cache"))
+    first_file = str(tmp_path / "first.tif")
+    result = Calculator.GVXRCalculate(json_file, stackFile=first_file, pyramid=True, cache=cache)
+    if result is None:
+        pytest.skip("gVXR could not create an OpenGL context")
+    projections = result[0]
+
+    second_file = str(tmp_path / "second.tif")
+    cached, angles, pyramid = Calculator.GVXRCalculate(json_file, stackFile=second_file, pyramid=True, cache=cache)
+    assert os.path.exists(second_file)
+    np.testing.assert_array_equal(cached, projections)
+    assert not cached.flags.writeable
+    assert pyramid is not None and pyramid.stack_file == second_file
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from Materials import Material, MaterialStack
+
+E_MEV = np.linspace(0.01, 0.15, 300)
+
+
+def bruteForce(stack):
+    T_ = np.ones_like(E_MEV)
+    for material in stack:
+        T_ *= np.exp(-material.muInterp()(E_MEV) * (material.thickness or 0.0) / 10.0)
+    return T_
+
+
+@pytest.fixture
+def stack():
+    stack = MaterialStack([Material.fromElement('Al', 2.0), Material.fromElement('Cu', 0.5)])
+    stack.transmission(E_MEV)  # 先建立缓存，之后的操作都走增量路径
+    return stack
+
+
+def test_insert_and_append(stack):
+    stack.insertMaterial(1, Material.fromElement('Sn', 0.2))
+    stack.appendMaterial(Material.fromElement('W', 0.05))
+    np.testing.assert_allclose(stack.transmission(E_MEV), bruteForce(stack), rtol=1e-12)
+
+
+def test_remove(stack):
+    removed = stack.removeMaterial(0)
+    assert removed.material == 'Al'
+    np.testing.assert_allclose(stack.transmission(E_MEV), bruteForce(stack), rtol=1e-12)
+    stack.removeMaterial(0)
+    np.testing.assert_array_equal(stack.transmission(E_MEV), np.ones_like(E_MEV))
+
+
+def test_set_thickness(stack):
+    stack.setThickness(1, 1.5)
+    assert stack.material_stack[1].thickness == 1.5
+    np.testing.assert_allclose(stack.transmission(E_MEV), bruteForce(stack), rtol=1e-12)
+
+
+def test_direct_edits_are_picked_up(stack):
+    stack.material_stack[0].thickness = 4.0
+    stack.material_stack[1].tungsten_density = 4.0
+    stack.material_stack.append(Material.fromElement('Mo', 0.1))
+    np.testing.assert_allclose(stack.transmission(E_MEV), bruteForce(stack), rtol=1e-12)
+
+
+def test_new_grid_rebuilds(stack):
+    grid = np.linspace(0.02, 0.1, 50)
+    expected = np.exp(-sum(m.muInterp()(grid) * m.thickness / 10.0 for m in stack))
+    np.testing.assert_allclose(stack.transmission(grid), expected, rtol=1e-12)
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+
+from Mesh import BVH
+
+
+def uvSphere(radius=10.0, n_theta=24, n_phi=48):
+    """Closed triangulated sphere with outward-facing triangles."""
+    theta = np.linspace(0, np.pi, n_theta + 1)
+    phi = np.linspace(0, 2 * np.pi, n_phi + 1)
+    points = radius * np.stack([np.sin(theta)[:, None] * np.cos(phi)[None, :],
+                                np.sin(theta)[:, None] * np.sin(phi)[None, :],
+                                np.cos(theta)[:, None] * np.ones_like(phi)[None, :]], axis=-1)
+    triangles = []
+    for i in range(n_theta):
+        for j in range(n_phi):
+            a, b, c, d = points[i, j], points[i + 1, j], points[i + 1, j + 1], points[i, j + 1]
+            if i > 0:
+                triangles.append((a, b, d))
+            if i < n_theta - 1:
+                triangles.append((b, c, d))
+    return np.array(triangles)
+
+
+def box(lower, upper):
+    """Axis-aligned box as 12 outward-facing triangles."""
+    x0, y0, z0 = lower
+    x1, y1, z1 = upper
+    v = np.array([[x0, y0, z0], [x1, y0, z0], [x1, y1, z0], [x0, y1, z0],
+                  [x0, y0, z1], [x1, y0, z1], [x1, y1, z1], [x0, y1, z1]])
+    faces = [(0, 2, 1), (0, 3, 2), (4, 5, 6), (4, 6, 7), (0, 1, 5), (0, 5, 4),
+             (1, 2, 6), (1, 6, 5), (2, 3, 7), (2, 7, 6), (3, 0, 4), (3, 4, 7)]
+    return v[np.array(faces)]
+
+
+def rays(n=4000, seed=0):
+    rng = np.random.default_rng(seed)
+    origin = np.array([-50.0, 0.3, 0.2])
+    targets = np.column_stack([np.full(n, 50.0), rng.uniform(-15, 15, n), rng.uniform(-15, 15, n)])
+    return origin, targets - origin
+
+
+@pytest.mark.parametrize("mesh", [uvSphere(), np.concatenate([box((-8, -3, -3), (-2, 3, 3)),
+                                                                box((2, -6, -6), (9, 6, 6))])])
+def test_bvh_matches_brute_force(mesh):
+    origin, directions = rays()
+    # 一个叶节点装下全部三角形 = 每条光线对每个三角形求交
+    brute_force = BVH(mesh, leaf_size=len(mesh)).pathLengths(origin, directions, 1.0)
+    np.testing.assert_allclose(BVH(mesh).pathLengths(origin, directions, 1.0), brute_force,
+                               rtol=1e-9, atol=1e-9)
+    assert brute_force.max() > 0
+
+
+def test_box_chord_is_exact():
+    mesh = box((-5, -5, -5), (5, 5, 5))
+    origin = np.array([-20.0, 0.0, 0.0])
+    directions = np.array([[40.0, 0.0, 0.0], [40.0, 1.0, 2.0], [40.0, 40.0, 0.0]])
+    lengths = BVH(mesh).pathLengths(origin, directions, 1.0)
+    expected = [10.0, 10.0 * np.linalg.norm(directions[1]) / 40.0, 0.0]
+    np.testing.assert_allclose(lengths, expected, rtol=1e-12, atol=1e-12)
+
+
+def test_sphere_chord_close_to_analytic():
+    radius = 10.0
+    origin, directions = rays(500, seed=1)
+    lengths = BVH(uvSphere(radius, 96, 192)).pathLengths(origin, directions, 1.0)
+    unit = directions / np.linalg.norm(directions, axis=1, keepdims=True)
+    closest = origin - (unit @ origin)[:, None] * unit
+    d2 = np.sum(closest ** 2, axis=1)
+    expected = 2 * np.sqrt(np.clip(radius ** 2 - d2, 0, None))
+    inside = d2 < (0.95 * radius) ** 2  # 远离切线处，多面体近似误差小
+    np.testing.assert_allclose(lengths[inside], expected[inside], rtol=5e-3)
@@ -0,0 +1,46 @@
+import threading
+import time
+
+import numpy as np
+
+from Pyramid import PreviewPyramid, PyramidBuilder, downsample
+
+
+def feederAlive():
+    return any(thread.name == "pyramid-feeder" and thread.is_alive() for thread in threading.enumerate())
+
+
+def test_downsample_is_block_mean():
+    img = np.arange(36, dtype=np.float32).reshape(6, 6)
+    np.testing.assert_allclose(downsample(img, 2)[0, 0], img[:2, :2].mean())
+    assert downsample(img, 4).shape == (1, 1)
+
+
+def test_from_projections_completes():
+    projections = np.random.default_rng(0).random((20, 32, 32), dtype=np.float32)
+    builder = PyramidBuilder.fromProjections(projections)
+    deadline = time.time() + 10
+    while not builder.pyramid.ready.all() and time.time() < deadline:
+        time.sleep(0.01)
+    builder.close()
+    assert builder.pyramid.ready.all()
+    np.testing.assert_allclose(builder.pyramid.levels[8][5], downsample(projections[5], 8), rtol=1e-6)
+
+
+def test_close_while_feeding_stops_the_feeder():
+    projections = np.random.default_rng(0).random((400, 256, 256), dtype=np.float32)
+    builder = PyramidBuilder.fromProjections(projections)
+    builder.close()
+    assert not feederAlive()
+    assert not builder._thread.is_alive()
+
+
+def test_pyramid_sidecars_round_trip(tmp_path):
+    stack_file = str(tmp_path / "stack.tif")
+    projections = np.random.default_rng(1).random((5, 40, 48), dtype=np.float32)
+    with PyramidBuilder(PreviewPyramid.create(5, (40, 48), stack_file=stack_file)) as builder:
+        for index, projection in enumerate(projections):
+            builder.submit(index, projection)
+    pyramid = PreviewPyramid.open(stack_file)
+    assert pyramid is not None and pyramid.ready.all()
+    np.testing.assert_allclose(pyramid.levels[2][1], downsample(projections[1], 2), rtol=1e-6)
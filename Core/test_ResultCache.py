@@ -0,0 +1,144 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from ProjectionStack import ProjectionStack
+from Pyramid import PreviewPyramid, PyramidBuilder, downsample
+from ResultCache import ResultCache, configurationKey
+
+SCENE = {
+    "WindowSize": [450, 450],
+    "Detector": {"Position": [120, 0, 0, "mm"], "NumberOfPixels": [8, 8], "Size": [16, 16, "mm"]},
+    "Source": {"Position": [-120, 0, 0, "mm"], "Shape": "Point", "Beam": {"TextFile": "beam.txt", "Unit": "keV"}},
+    "Samples": [{"Label": "Part", "Path": "part.stl", "Unit": "mm", "Material": ["element", "Al"]}],
+    "Scan": {"NumberOfProjections": 2, "FinalAngle": 360, "IncludeFinalAngle": False,
+             "OutFolder": "./run", "OutPath": "./output"},
+}
+
+
+def writeScene(folder, scene=SCENE, beam="50 1\n60 2\n", stl="solid part\nendsolid part\n"):
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, "beam.txt"), 'w') as f:
+        f.write(beam)
+    with open(os.path.join(folder, "part.stl"), 'w') as f:
+        f.write(stl)
+    file_name = os.path.join(folder, "scene.json")
+    with open(file_name, 'w') as f:
+        json.dump(scene, f)
+    return file_name
+
+
+def test_key_follows_contents_not_location(tmp_path):
+    key = configurationKey(writeScene(tmp_path / "a"))
+    assert configurationKey(writeScene(tmp_path / "b")) == key
+
+
+def test_key_ignores_output_settings(tmp_path):
+    key = configurationKey(writeScene(tmp_path / "a"))
+    scene = json.loads(json.dumps(SCENE))
+    scene["WindowSize"] = [800, 800]
+    scene["Scan"]["OutFolder"] = "./elsewhere"
+    scene["Scan"]["OutPath"] = "./other"
+    assert configurationKey(writeScene(tmp_path / "b", scene)) == key
+
+
+@pytest.mark.parametrize("change", ["beam", "stl", "geometry"])
+def test_key_changes_with_inputs(tmp_path, change):
+    key = configurationKey(writeScene(tmp_path / "a"))
+    scene = json.loads(json.dumps(SCENE))
+    kwargs = {}
+    if change == "beam":
+        kwargs["beam"] = "50 1\n60 3\n"
+    elif change == "stl":
+        kwargs["stl"] = "solid part\n\nendsolid part\n"
+    else:
+        scene["Detector"]["Position"] = [130, 0, 0, "mm"]
+    assert configurationKey(writeScene(tmp_path / "b", scene, **kwargs)) != key
+
+
+def test_key_includes_spectrum_and_extra(tmp_path):
+    file_name = writeScene(tmp_path)
+    key = configurationKey(file_name)
+    assert configurationKey(file_name, spectrum={"counts": [1.0]}) != key
+    assert configurationKey(file_name, extra={"engine": "gvxr", "version": "2.1"}) != key
+    assert configurationKey(file_name, extra={"engine": "gvxr", "version": "2.1"}) == \
+        configurationKey(file_name, extra={"version": "2.1", "engine": "gvxr"})
+
+
+def storeStack(cache, key, folder, value):
+    file_name = os.path.join(folder, f"{key}.tif")
+    stack = ProjectionStack.create(file_name, 2, (5, 6), angles=[0.0, 180.0])
+    stack.projections[:] = value
+    stack.close()
+    cache.store(key, file_name)
+
+
+def test_store_and_load_read_only(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    assert cache.load("k") is None
+    storeStack(cache, "k", str(tmp_path), 3.0)
+    projections, angles = cache.load("k")
+    assert angles == [0.0, 180.0]
+    np.testing.assert_array_equal(projections, 3.0)
+    assert not projections.flags.writeable
+
+
+def test_evicts_least_recently_used(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    storeStack(cache, "a", str(tmp_path), 1.0)
+    entry_bytes = cache.size()
+    cache.max_bytes = int(2.5 * entry_bytes)
+    storeStack(cache, "b", str(tmp_path), 2.0)
+    os.utime(cache._markerFile("a"), (1e9, 1e9))
+    os.utime(cache._markerFile("b"), (2e9, 2e9))
+    storeStack(cache, "c", str(tmp_path), 3.0)
+    assert "a" not in cache and "b" in cache and "c" in cache
+    cache.clear()
+    assert cache.entries() == []
+
+
+def pyramidStack(folder):
+    """A finished 5-projection stack with its pyramid sidecars, as GVXRCalculate(pyramid=True) leaves it."""
+    stack_file = str(folder / "run" / "stack.tif")
+    projections = np.random.default_rng(0).random((5, 40, 48), dtype=np.float32)
+    stack = ProjectionStack.create(stack_file, 5, (40, 48), angles=np.arange(5) * 72.0)
+    with PyramidBuilder(PreviewPyramid.create(5, (40, 48), stack_file=stack_file)) as builder:
+        for index, projection in enumerate(projections):
+            stack.projections[index] = projection
+            builder.submit(index, projection)
+    stack.close()
+    return stack_file, projections
+
+
+def test_pyramid_round_trip(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    stack_file, projections = pyramidStack(tmp_path)
+    cache.store("p", stack_file)
+
+    loaded, angles, pyramid = cache.load("p", pyramid=True)
+    np.testing.assert_array_equal(loaded, projections)
+    assert pyramid is not None and pyramid.ready.all()
+    assert pyramid.stack_file == cache.entryFile("p")
+    np.testing.assert_allclose(pyramid.levels[4][2], downsample(projections[2], 4), rtol=1e-6)
+    cache.remove("p")
+    assert os.listdir(cache.cache_dir) == []
+
+
+def test_load_into_copies_entry_and_sidecars(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"))
+    stack_file, projections = pyramidStack(tmp_path)
+    cache.store("p", stack_file)
+
+    # 命中时调用者要求的 stackFile 必须真的生成，而且是独立的副本
+    requested = str(tmp_path / "elsewhere" / "copy.tif")
+    assert cache.loadInto("missing", requested) is None
+    loaded, angles, pyramid = cache.loadInto("p", requested, pyramid=True)
+    assert os.path.exists(requested)
+    assert angles == [0.0, 72.0, 144.0, 216.0, 288.0]
+    np.testing.assert_array_equal(loaded, projections)
+    assert not loaded.flags.writeable
+    assert pyramid is not None and pyramid.stack_file == requested
+    assert os.path.exists(os.path.join(tmp_path, "elsewhere", "copy.x8.tif"))
+    assert not os.path.samefile(requested, cache.entryFile("p"))
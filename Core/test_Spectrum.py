@@ -0,0 +1,83 @@
+import os
+
+import numpy as np
+import pytest
+
+from Spectrum import SPECTRUM_CACHE, guessEnergyUnit, loadSpectrum, parseSpectrumText
+
+BUNDLED = os.path.join(os.path.dirname(os.path.abspath(__file__)), "2MeV.txt")
+
+
+@pytest.mark.parametrize("text", [
+    "10,1\n20,2\n30,3",
+    "10;1\n20;2\n30;3",
+    "10\t1\n20\t2\n30\t3",
+    "10  1\n20 2\n30   3",
+    "10, 1\n20, 2\n30, 3\n",
+])
+def test_delimiters(text):
+    spectrum = parseSpectrumText(text, unit='keV')
+    np.testing.assert_allclose(spectrum.energy_mev, [0.01, 0.02, 0.03])
+    np.testing.assert_allclose(spectrum.counts, [1, 2, 3])
+
+
+def test_header_lines_and_counts_column():
+    text = "Tube spectrum\nEnergy [keV], Fluence, Counts\n50, 0.5, 5\n60, 0.6, 6\n"
+    spectrum = parseSpectrumText(text, counts_column=2)
+    assert spectrum.unit == 'keV'
+    np.testing.assert_allclose(spectrum.energy_mev, [0.05, 0.06])
+    np.testing.assert_allclose(spectrum.counts, [5, 6])
+
+
+def test_errors():
+    with pytest.raises(ValueError):
+        parseSpectrumText("Energy, Counts\n")
+    with pytest.raises(ValueError):
+        parseSpectrumText("1, 2\n3, 4", counts_column=2)
+
+
+@pytest.mark.parametrize("header, expected", [("E (MeV)", 'MeV'), ("E [eV]", 'eV'), ("energy_kev counts", 'keV')])
+def test_unit_label_wins(header, expected):
+    assert guessEnergyUnit(np.array([10.0, 100.0]), header) == expected
+
+
+@pytest.mark.parametrize("energy, expected", [
+    (np.linspace(1000, 150000, 50), 'eV'),
+    (np.linspace(10, 150, 50), 'keV'),
+    (np.linspace(0.01, 2.0, 50), 'MeV'),
+])
+def test_unit_from_values(energy, expected, capsys):
+    assert guessEnergyUnit(energy) == expected
+    assert "[WARNING]" not in capsys.readouterr().out
+
+
+def test_ambiguous_guess_warns(capsys):
+    # 10-30 按 0.5 间隔：既可能是 MeV 加速器谱，也可能是低 kV 球管谱
+    assert guessEnergyUnit(np.arange(10.0, 30.5, 0.5)) == 'MeV'
+    assert "[WARNING]" in capsys.readouterr().out
+
+
+def test_bundled_spectrum_is_quiet(capsys):
+    spectrum = loadSpectrum(BUNDLED, use_cache=False)
+    assert spectrum.unit == 'MeV'
+    assert spectrum.energy_mev.max() == pytest.approx(2.0, rel=1e-2)
+    assert "[WARNING]" not in capsys.readouterr().out
+
+
+def test_cache_follows_file_changes(tmp_path):
+    file_name = tmp_path / "beam.txt"
+    file_name.write_text("50 1\n60 2\n")
+    first = loadSpectrum(str(file_name), unit='keV')
+    assert loadSpectrum(str(file_name), unit='keV') is first
+    assert not first.counts.flags.writeable
+
+    # 同样大小的新内容，只有 mtime 变化
+    file_name.write_text("50 3\n60 4\n")
+    stat = os.stat(file_name)
+    os.utime(file_name, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    second = loadSpectrum(str(file_name), unit='keV')
+    assert second is not first
+    np.testing.assert_allclose(second.counts, [3, 4])
+    # 不同单位是不同的缓存条目
+    assert loadSpectrum(str(file_name), unit='MeV') is not second
+    assert len(SPECTRUM_CACHE) >= 2
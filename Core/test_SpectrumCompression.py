@@ -0,0 +1,51 @@
+import os
+
+import numpy as np
+import pytest
+
+from DetectorResponse import DetectorResponse
+from Materials import Material
+from Spectrum import loadSpectrum
+from SpectrumCompression import compressSpectrum, compressWithBins
+
+SPECTRUM = os.path.join(os.path.dirname(os.path.abspath(__file__)), "2MeV.txt")
+THICKNESSES = np.linspace(0.0, 30.0, 31)
+
+
+def detectedIntensity(spectrum, material, thicknesses, response=None):
+    """Full-resolution I(L) = Σ_E N(E) r(E) exp(-mu(E) L), computed independently of the compression."""
+    e_mev, counts = spectrum.energy_mev, np.clip(spectrum.counts, 0.0, None)
+    signal = DetectorResponse.fromSpec(response).apply(counts, e_mev)
+    mu = material.muInterp()(e_mev) / 10.0
+    return np.exp(-np.multiply.outer(thicknesses, mu)) @ signal
+
+
+@pytest.fixture(scope="module")
+def spectrum():
+    return loadSpectrum(SPECTRUM, unit='MeV')
+
+
+@pytest.mark.parametrize("response", [None, 'counting'])
+def test_reported_error_matches_recomputed_error(spectrum, response):
+    material = Material.fromElement('Fe', 1.0)
+    result = compressWithBins(spectrum, material, THICKNESSES, 6, response)
+    reference = detectedIntensity(spectrum, material, THICKNESSES, response)
+    compressed = detectedIntensity(result.spectrum, material, THICKNESSES, response)
+    errors = (compressed - reference) / reference
+    np.testing.assert_allclose(result.errors, errors, rtol=1e-6, atol=1e-12)
+    assert result.max_error == pytest.approx(np.abs(errors).max())
+    assert len(result) <= 6
+
+
+def test_tolerance_is_met_with_few_bins(spectrum):
+    material = Material.fromElement('Al', 1.0)
+    result = compressSpectrum(spectrum, material, (0.0, 50.0), tolerance=1e-3)
+    assert result.max_error <= 1e-3
+    assert len(result) < result.n_input_bins
+    assert np.all(result.spectrum.counts >= 0)
+
+
+def test_more_bins_do_not_increase_error(spectrum):
+    material = Material.fromElement('Cu', 1.0)
+    errors = [compressWithBins(spectrum, material, THICKNESSES, k).max_error for k in (1, 4, 16)]
+    assert errors[2] <= errors[1] <= errors[0]
@@ -0,0 +1,70 @@
+import pytest
+
+from Sweep import SweepStore, expandDesign, pointParameters
+
+SWEEP = {"base": "scene.json", "design": "cartesian", "points": None, "seed": 0,
+         "axes": {"Samples/0/Density": [1.0, 2.0], "Samples/0/Material": [["element", "Al"], ["element", "Cu"]]}}
+
+
+def result(index, status="done"):
+    return {"stack_file": f"point_{index}.tif", "n_projections": 4, "rows": 8, "columns": 8,
+            "mean": float(index), "min": 0.0, "max": 1.0, "seconds": 0.1, "status": status}
+
+
+@pytest.fixture
+def store(tmp_path):
+    with SweepStore(str(tmp_path / "sweep.sqlite")) as store:
+        yield store
+
+
+def test_expand_cartesian_and_latin():
+    points = expandDesign(SWEEP["axes"])
+    assert len(points) == 4
+    assert {(p["Samples/0/Density"], p["Samples/0/Material"][1]) for p in points} == \
+        {(1.0, "Al"), (1.0, "Cu"), (2.0, "Al"), (2.0, "Cu")}
+
+    latin = expandDesign({"x": {"min": 0.0, "max": 1.0}, "n": {"min": 10, "max": 20, "integer": True}},
+                         "latin", n_points=5, seed=3)
+    strata = sorted(int(point["x"] * 5) for point in latin)
+    assert strata == [0, 1, 2, 3, 4]  # 每个分层恰好一个点
+    assert all(isinstance(point["n"], int) and 10 <= point["n"] <= 20 for point in latin)
+
+
+def test_point_parameters_do_not_touch_base():
+    base = {"Samples": [{"Density": 1.0, "Material": ["element", "W"]}]}
+    params = pointParameters(base, {"Samples/0/Density": 3.0, "Filter": [["Cu", 1.0]]})
+    assert params["Samples"][0]["Density"] == 3.0
+    assert base["Samples"][0]["Density"] == 1.0
+    assert "Filter" not in params
+
+
+def test_sweep_id_is_stable(store):
+    sweep_id = store.beginSweep(SWEEP)
+    assert store.beginSweep(dict(SWEEP)) == sweep_id
+    assert store.beginSweep(dict(SWEEP, seed=1)) != sweep_id
+
+
+def test_record_resume_and_query(store):
+    sweep_id = store.beginSweep(SWEEP)
+    points = expandDesign(SWEEP["axes"])
+    for index, point in enumerate(points):
+        store.record(sweep_id, index, point, result(index, "done" if index != 2 else "failed"))
+    assert store.completed(sweep_id) == {0, 1, 3}
+
+    # 重新记录同一个点会替换而不是追加
+    store.record(sweep_id, 2, points[2], result(2))
+    assert store.completed(sweep_id) == {0, 1, 2, 3}
+    assert len(store.query(sweep_id=sweep_id)) == 4
+
+    dense = store.query({"Samples/0/Density": 2.0})
+    assert [row["parameters"]["Samples/0/Density"] for row in dense] == [2.0, 2.0]
+    copper = store.query({"Samples/0/Material": ["element", "Cu"], "Samples/0/Density": (0.5, 1.5)})
+    assert len(copper) == 1
+    assert copper[0]["parameters"] == {"Samples/0/Density": 1.0, "Samples/0/Material": ["element", "Cu"]}
+    assert copper[0]["mean"] == pytest.approx(float(copper[0]["point"]))
+
+
+def test_store_uses_value_indexes(store):
+    plan = store.connection.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM point_values WHERE axis = ? AND value = ?", ("x", 1.0)).fetchall()
+    assert any("point_values_by_value" in str(tuple(row)) for row in plan)
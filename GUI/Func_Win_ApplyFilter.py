@@ -14,6 +14,7 @@ from PyQt5.QtWidgets import QFileDialog, QWidget, QLabel, QPushButton, QHBoxLayo
 from GUI.ui.Win_Filter import Ui_Form as UI
 
 from Core.Materials import Material, MaterialStack
+from Core.Spectrum import loadSpectrum
 import Core.XFilter
 
 
@@ -194,16 +195,16 @@ class Win_ApplyFilter(QWidget):
         pass
 
     def ApplyFilterClicked(self):
-        # Input spectrum file with two columns: E[MeV], counts
+        # Input spectrum file with two columns: E [MeV, keV or eV], counts
         SPECTRUM_PATH = self.ui.SPECTRUM_PATH.text()
 
         SPECTRUM_PATH = "Core/2MeV.txt" if SPECTRUM_PATH == "" else SPECTRUM_PATH
 
-        spec = np.loadtxt(SPECTRUM_PATH)
-        E_mev = spec[:, 0].astype(float)  # MeV
-        counts_in = spec[:, 1].astype(float)  # Relative or absolute photon counts
-        counts_in[counts_in < 0] = 0.0  # Clamp negative values
-        E_keV = E_mev * 1000.0
+        # 单位/表头/分隔符自动识别；文件未改动时直接命中缓存
+        spectrum = loadSpectrum(SPECTRUM_PATH)
+        E_mev = spectrum.energy_mev  # MeV
+        counts_in = np.clip(spectrum.counts, 0.0, None)  # Clamp negative values (copy, the cached spectrum is shared)
+        E_keV = spectrum.E_keV
 
         T = Core.XFilter.transmission_of_stack(E_mev, self.materialStack)
         counts_out = counts_in * T
@@ -218,6 +219,15 @@ class Win_ApplyFilter(QWidget):
 
         pass
 
+    def filteredSpectrum(self):
+        """(E_mev, counts_out) of the last ApplyFilterClicked, for Win_Test.setSpectrum / GVXRCalculate(spectrum=).
+
+        None before the filter has been applied.
+        """
+        if self.MaterialsResult.get("counts_out") is None:
+            return None
+        return self.MaterialsResult["E_keV"] / 1000.0, self.MaterialsResult["counts_out"]
+
     def normalizeButtonGroupClicked(self, button: QRadioButton):
         try:
             self.clearPlot()
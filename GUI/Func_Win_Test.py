@@ -2,7 +2,7 @@ import os
 
 import cv2
 import numpy as np
-from PyQt5.QtCore import QThread, pyqtSignal, Qt
+from PyQt5.QtCore import QRectF, QThread, QTimer, pyqtSignal, Qt
 from PyQt5.QtGui import QPixmap, QImage
 from PyQt5.QtWidgets import QWidget, QFileDialog, QGraphicsScene, QGraphicsPixmapItem
 from matplotlib import pyplot as plt
@@ -11,24 +11,71 @@ import matplotlib
 matplotlib.use('TkAgg')
 from GUI.ui.Win_Test import Ui_Form as UI
 import Core.Json2gvxrCalculator as Calculator
+from Core.Cache import LRUCache
+from Core.Display import DisplayWindow
+from Core.ProjectionStack import isProjectionStackFile, openProjectionStack
+from Core.Pyramid import PreviewPyramid, PyramidBuilder
+
+#  显示缓存保留的已渲染投影数，以及当前帧两侧预取的帧数
+PIXMAP_CACHE_SIZE = 64
+PREFETCH_RADIUS = 4
+#  预览（最粗金字塔层）缓存数；滑块停止多久 (ms) 后切换到全分辨率
+PREVIEW_CACHE_SIZE = 512
+SETTLE_DELAY_MS = 150
+#  使用逐角度增量采集（投影边算边显示，可取消）；默认 False，用一次性的 computeCTAcquisition。
+#  增量采集与 computeCTAcquisition 的一致性见 Core/test_Json2gvxrCalculator.py（需要 gVXR 和 OpenGL）
+INCREMENTAL_ACQUISITION = False
 
 
 class CalculatorWorker(QThread):
     finished = pyqtSignal(object)  # 计算完成信号
     error = pyqtSignal(str)  # 错误信号
 
-    def __init__(self, json_file):
+    def __init__(self, json_file, spectrum=None):
         super().__init__()
         self.json_file = json_file
+        self.spectrum = spectrum
 
     def run(self):
         try:
-            result = Calculator.GVXRCalculate(self.json_file)
+            result = Calculator.GVXRCalculate(self.json_file, pyramid=True, spectrum=self.spectrum)
             self.finished.emit(result)
         except Exception as e:
             self.error.emit(str(e))
 
 
+class IncrementalCalculatorWorker(QThread):
+    frameReady = pyqtSignal(int, float, object)  # 每算完一张投影: (序号, 角度, 投影)
+    progress = pyqtSignal(int, int, float)  # (已完成, 总数, 预计剩余秒数)
+    finished = pyqtSignal(object)  # 计算完成或取消后的结果
+    error = pyqtSignal(str)  # 错误信号
+
+    def __init__(self, json_file, spectrum=None):
+        super().__init__()
+        self.json_file = json_file
+        self.spectrum = spectrum
+        self.acquisition = None
+
+    def run(self):
+        try:
+            self.acquisition = Calculator.IncrementalAcquisition(self.json_file, spectrum=self.spectrum)
+            if self.isInterruptionRequested():
+                self.acquisition.cancel()
+            result = self.acquisition.run(callback=self.onFrame, pyramid=True)
+            self.finished.emit(result)
+        except Exception as e:
+            self.error.emit(str(e))
+
+    def onFrame(self, index, angle, projection, done, total, eta):
+        self.frameReady.emit(index, angle, projection)
+        self.progress.emit(done, total, eta)
+
+    def cancel(self):
+        self.requestInterruption()
+        if self.acquisition is not None:
+            self.acquisition.cancel()
+
+
 def float32_to_uint8(img: np.ndarray, offset: float = 1.0, logCount: int = 3) -> np.ndarray:
     try:
         offset = 1.0 if offset <= 0 else offset
@@ -50,6 +97,7 @@ def float32_to_uint8(img: np.ndarray, offset: float = 1.0, logCount: int = 3) ->
 
 
 def uint8_to_qImage(img_uint8: np.ndarray):
+    img_uint8 = np.ascontiguousarray(img_uint8)
     h, w = img_uint8.shape
     qImage = QImage(
         img_uint8.data,
@@ -70,6 +118,33 @@ class Win_Test(QWidget):
         self.calculator_thread = None
         self.calculator_result = None
         self.calculator_PICs = []
+        self.calculate_text = self.ui.calculate.text()
+        self.display_window = None
+        self.pixmap_cache = LRUCache(PIXMAP_CACHE_SIZE)
+        self.preview_cache = LRUCache(PREVIEW_CACHE_SIZE)
+        self.pyramid = None
+        self.pyramid_builder = None
+        self.prefetch_queue = []
+        self.current_index = 0
+        #  内存中的能谱 (Spectrum 或 (E_mev, counts))，设置后代替 JSON 中的 Beam 文件
+        self.spectrum = None
+
+        # 场景和图像项只建一次，切换投影时只替换 pixmap
+        self.scene = QGraphicsScene(self.ui.PICView)
+        self.pixmap_item = QGraphicsPixmapItem()
+        self.scene.addItem(self.pixmap_item)
+        self.ui.PICView.setScene(self.scene)
+
+        # 空闲时每次预取一帧，不阻塞滑块事件
+        self.prefetch_timer = QTimer(self)
+        self.prefetch_timer.setInterval(0)
+        self.prefetch_timer.timeout.connect(self.prefetchNext)
+
+        # 拖动时先显示最粗的预览，滑块停下后再换成全分辨率
+        self.settle_timer = QTimer(self)
+        self.settle_timer.setSingleShot(True)
+        self.settle_timer.setInterval(SETTLE_DELAY_MS)
+        self.settle_timer.timeout.connect(self.refineFrame)
 
     def UiSetup(self):
         self.ui.choose_JSONFileName.clicked.connect(self.choose_JSONFileNameClicked)
@@ -87,64 +162,199 @@ class Win_Test(QWidget):
             self.ui.PICView.fitInView(self.ui.PICView.scene().sceneRect(), Qt.KeepAspectRatio)
 
     def choose_JSONFileNameClicked(self):
-        fileName, _ = QFileDialog.getOpenFileName(self, "选择JSON文件", "", "JSON Files (*.json)")
+        fileName, _ = QFileDialog.getOpenFileName(self, "选择JSON文件", "",
+                                                  "JSON Files (*.json);;Projection stacks (*.tif *.tiff)")
         if fileName != '':
             self.ui.JSONFileName.setText(fileName)
 
     def calculateClicked(self):
+        if self.calculator_thread is not None and self.calculator_thread.isRunning():
+            # 计算进行中再次点击即取消，已算完的投影保留
+            if isinstance(self.calculator_thread, IncrementalCalculatorWorker):
+                print("取消计算...")
+                self.calculator_thread.cancel()
+            return
         fileName = self.ui.JSONFileName.text()
         if not os.path.exists(fileName):
             print("[ERROR] JSON文件不存在")
             return
+        if isProjectionStackFile(fileName):
+            # 已保存的投影堆栈直接内存映射打开，不重新计算
+            try:
+                stack = openProjectionStack(fileName)
+            except Exception as e:
+                print("[ERROR] 打开投影堆栈出错:", e)
+                return
+            self.on_calculation_finished((stack, stack.angles, PreviewPyramid.open(fileName)))
+            return
         self.start_calculation(fileName)
 
+    def setSpectrum(self, spectrum):
+        """Use spectrum (e.g. Win_ApplyFilter.filteredSpectrum()) for the next calculations; None: the JSON Beam."""
+        self.spectrum = spectrum
+
     def start_calculation(self, json_file):
         # 创建并启动工作线程
         print("开始计算...", json_file)
-        self.calculator_thread = CalculatorWorker(json_file)
+        if INCREMENTAL_ACQUISITION:
+            self.calculator_thread = IncrementalCalculatorWorker(json_file, self.spectrum)
+            self.calculator_thread.frameReady.connect(self.on_frame_ready)
+            self.calculator_thread.progress.connect(self.on_calculation_progress)
+            self.ui.calculate.setText("取消")
+        else:
+            self.calculator_thread = CalculatorWorker(json_file, self.spectrum)
         self.calculator_thread.finished.connect(self.on_calculation_finished)
         self.calculator_thread.error.connect(self.on_calculation_error)
         self.calculator_thread.start()
 
+    def on_frame_ready(self, index, angle, projection):
+        # 增量采集：新投影到达即可浏览；显示窗口先按第一张统计，采集结束后再按整套重算
+        if index == 0:
+            self.calculator_PICs = []
+            self.calculator_result = self.calculator_PICs
+            self.setPyramid(None, build=False)
+            self.display_window = DisplayWindow.fromStack([projection])
+            self.pixmap_cache.clear()
+            self.preview_cache.clear()
+            h, w = projection.shape
+            self.scene.setSceneRect(QRectF(0, 0, w, h))
+            self.ui.PICView.fitInView(self.scene.sceneRect(), Qt.KeepAspectRatio)
+        following = self.ui.PICSlider.value() == len(self.calculator_PICs) - 1 or index == 0
+        # projection 是采集堆栈里的视图，列表只保存引用，不复制投影
+        self.calculator_PICs.append(projection)
+        self.ui.PICSlider.blockSignals(True)
+        self.ui.PICSlider.setMaximum(len(self.calculator_PICs) - 1)
+        if following:
+            # 滑块停在最新一张时跟随显示新投影
+            self.ui.PICSlider.setValue(index)
+        self.ui.PICSlider.blockSignals(False)
+        if following:
+            self.showFrame(index)
+
+    def on_calculation_progress(self, done, total, eta):
+        self.ui.calculate.setText(f"取消 ({done}/{total}, 剩余 {eta:.0f} s)")
+
     def on_calculation_finished(self, result):
         # 处理计算结果
         print("计算完成:", result)
-        self.calculator_result, _ = result
-        self.calculator_PICs = Calculator.getTif(self.calculator_result)
+        self.ui.calculate.setText(self.calculate_text)
+        if result is None or result[0] is None or not len(result[0]):
+            print("[INFO] 没有可显示的投影")
+            return
+        self.calculator_result = result[0]
+        self.setPyramid(result[2] if len(result) > 2 else None)
+        # 直接按索引取投影（内存映射的堆栈按需读盘），不再复制成列表
+        self.calculator_PICs = self.calculator_result
+        # 显示窗口（灰度映射）每个堆栈只统计一次
+        self.display_window = DisplayWindow.fromStack(self.calculator_PICs)
+        self.pixmap_cache.clear()
+        self.preview_cache.clear()
+        self.prefetch_queue = []
+        h, w = self.calculator_PICs[0].shape
+        self.scene.setSceneRect(QRectF(0, 0, w, h))
+        self.ui.PICView.fitInView(self.scene.sceneRect(), Qt.KeepAspectRatio)
         # 更新UI...
         print("Tif_s:", len(self.calculator_PICs))
+        self.ui.PICSlider.blockSignals(True)
         self.ui.PICSlider.setValue(0)
         self.ui.PICSlider.setMaximum(len(self.calculator_PICs) - 1)
+        self.ui.PICSlider.blockSignals(False)
 
-        self.update_pic(self.calculator_PICs[0])
+        self.showFrame(0)
+
+    def setPyramid(self, pyramid, build: bool = True):
+        if self.pyramid_builder is not None:
+            self.pyramid_builder.close(raise_error=False)
+            self.pyramid_builder = None
+        self.pyramid = pyramid
+        if build and pyramid is None and self.calculator_result is not None and len(self.calculator_result):
+            # 没有现成的预览金字塔（如打开的旧堆栈），后台在内存中构建
+            self.pyramid_builder = PyramidBuilder.fromProjections(self.calculator_result)
+            self.pyramid = self.pyramid_builder.pyramid
 
     def on_calculation_error(self, error_msg):
         # 处理错误
         print("计算出错:", error_msg)
+        self.ui.calculate.setText(self.calculate_text)
         # 显示错误信息...
 
     def update_pic(self, tif_image: np.ndarray):
         try:
-            tif_image = float32_to_uint8(tif_image)
-            qImage = uint8_to_qImage(tif_image)
+            window = self.display_window or DisplayWindow(np.min(tif_image), np.max(tif_image))
+            self.setPixmap(QPixmap.fromImage(uint8_to_qImage(window(tif_image))))
+        except Exception as e:
+            print("[ERROR] 更新图片出错:", e)
+
+    def setPixmap(self, pixmap: QPixmap, scale: float = 1.0):
+        self.pixmap_item.setPixmap(pixmap)
+        self.pixmap_item.setScale(scale)
+        # 预览按倍数放大到全分辨率坐标，场景范围保持不变
+        if scale == 1.0 and QRectF(pixmap.rect()) != self.scene.sceneRect():
+            self.scene.setSceneRect(QRectF(pixmap.rect()))
+            self.ui.PICView.fitInView(self.scene.sceneRect(), Qt.KeepAspectRatio)
 
-            scene = QGraphicsScene(self.ui.PICView)
+    def renderPixmap(self, index: int) -> QPixmap:
+        return QPixmap.fromImage(uint8_to_qImage(self.display_window(self.calculator_PICs[index])))
 
-            pixmap = QPixmap.fromImage(qImage)
+    def showPreview(self, index: int) -> bool:
+        """Show the coarsest pyramid level of frame index; False if it is not available yet."""
+        preview = self.pyramid.coarsest(index) if self.pyramid is not None else None
+        if preview is None:
+            return False
+        factor, projection = preview
+        pixmap = self.preview_cache.get(index, lambda: QPixmap.fromImage(
+            uint8_to_qImage(self.display_window(projection))))
+        self.setPixmap(pixmap, scale=float(factor))
+        return True
 
-            # 创建图像项并添加到场景
-            pixmap_item = QGraphicsPixmapItem(pixmap)
-            scene.addItem(pixmap_item)
+    def refineFrame(self):
+        self.showFrame(self.ui.PICSlider.value())
 
-            # 设置场景并调整视图
-            self.ui.PICView.setScene(scene)
-            self.ui.PICView.fitInView(scene.sceneRect(), Qt.KeepAspectRatio)
+    def showFrame(self, index: int):
+        try:
+            self.settle_timer.stop()
+            self.current_index = index
+            self.setPixmap(self.pixmap_cache.get(index, lambda: self.renderPixmap(index)))
+            self.schedulePrefetch(index)
         except Exception as e:
             print("[ERROR] 更新图片出错:", e)
 
+    def schedulePrefetch(self, index: int):
+        # 由近及远预取两侧的帧
+        n = len(self.calculator_PICs)
+        queue = []
+        for step in range(1, PREFETCH_RADIUS + 1):
+            for neighbour in (index + step, index - step):
+                if 0 <= neighbour < n and neighbour not in self.pixmap_cache:
+                    queue.append(neighbour)
+        self.prefetch_queue = queue
+        if queue:
+            self.prefetch_timer.start()
+        else:
+            self.prefetch_timer.stop()
+
+    def prefetchNext(self):
+        while self.prefetch_queue:
+            index = self.prefetch_queue.pop(0)
+            if index not in self.pixmap_cache:
+                try:
+                    self.pixmap_cache.get(index, lambda: self.renderPixmap(index))
+                except Exception as e:
+                    print("[ERROR] 预取图片出错:", e)
+                break
+        if not self.prefetch_queue:
+            self.prefetch_timer.stop()
+
     def PICSliderValueChanged(self, value):
         try:
-            if self.calculator_result is not None:
-                self.update_pic(self.calculator_PICs[value])
+            if self.calculator_result is None:
+                return
+            if value in self.pixmap_cache or not self.showPreview(value):
+                self.showFrame(value)
+            else:
+                # 拖动中：停止预取，等滑块停下再渲染全分辨率
+                self.current_index = value
+                self.prefetch_timer.stop()
+                self.settle_timer.start()
         except Exception as e:
             print("[ERROR] 更新图片出错:", e)